@@ -0,0 +1,120 @@
+"""Strong ETags: If-None-Match on polled reads, If-Match on updates and deletes.
+
+A single company or task is tagged with its update time, which every write
+moves (Firestore's updateTime, SQLite's updated_at). An If-Match naming it
+can then go to Firestore as the commit's own updateTime precondition, with
+no read before the write. Lists and pages are tagged with a body hash.
+"""
+import hashlib
+import re
+from datetime import timezone
+from typing import Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from app.services import firebase
+
+# Per-user data: browsers must revalidate, shared proxies must not store it
+CACHE_CONTROL = "private, no-cache"
+
+
+def entity_tag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+_VERSION_TAG = re.compile(r'^"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}Z)"$')
+
+
+def version_tag(record) -> Optional[str]:
+    """The update-time ETag of a single record, None when it has no update time"""
+    updated_at = getattr(record, "updated_at", None)
+    if updated_at is None:
+        return None
+    if updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone(timezone.utc)
+    return '"' + updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ") + '"'
+
+
+def etag_of(result) -> str:
+    """The ETag a read returning `result` carries"""
+    return version_tag(result) or entity_tag(JSONResponse(content=jsonable_encoder(result)).body)
+
+
+def _tags(header: str) -> list:
+    return [candidate.strip() for candidate in header.split(",")]
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as RFC 9110 prescribes for If-None-Match"""
+    if not if_none_match:
+        return False
+    for candidate in _tags(if_none_match):
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class IfMatch:
+    """Write precondition for an If-Match header (strong comparison).
+
+    Called with the stored record like any precondition. `update_time` is
+    the RFC 3339 update time a single version tag names, which Firestore
+    checks in the commit itself; None for "*" and other tags.
+    """
+
+    def __init__(self, tags: list):
+        self.tags = tags
+        self.any = "*" in tags
+        versions = [match.group(1) for match in map(_VERSION_TAG.match, tags) if match]
+        self.update_time = versions[0] if len(tags) == 1 and versions else None
+
+    def __call__(self, current) -> bool:
+        return self.any or etag_of(current) in self.tags
+
+
+def if_match(header: Optional[str]) -> Optional[IfMatch]:
+    """Write precondition for an If-Match header, None without one"""
+    if header is None:
+        return None
+    return IfMatch(_tags(header))
+
+
+# Cached lists are replaced (copy-on-write), never mutated, so the list the
+# cache returns stands for one version of the user's data. Its tag is kept
+# with the cache entry and goes away when the entry is replaced or evicted.
+def _remembered(result) -> Optional[str]:
+    return firebase.cached_list_note(result)
+
+
+def _remember(result, etag: str):
+    firebase.note_cached_list(result, etag)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def conditional_response(request: Request, result) -> Response:
+    """Serialize `result` with its ETag, or answer 304 if the client already has it"""
+    if isinstance(result, Response):
+        return result
+    if_none_match = request.headers.get("if-none-match")
+    etag = version_tag(result) or _remembered(result)
+    if etag is not None and matches(if_none_match, etag):
+        return not_modified(etag)
+
+    response = JSONResponse(content=jsonable_encoder(result))
+    if etag is None:
+        etag = entity_tag(response.body)
+        _remember(result, etag)
+        if matches(if_none_match, etag):
+            return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
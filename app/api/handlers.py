@@ -1,9 +1,15 @@
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.models import Company, Task, TaskTemplate, AssignData, User
-from app.services import firebase
+from app.api import etags
+from app.services import firebase, jobs, bulk
+from app.services.repository import get_repository
 from datetime import datetime, timedelta
+from typing import Optional
 import uuid
 import re
+import csv
+import zlib
 
 # User authentication handlers
 async def create_user_handler(user_data: User):
@@ -56,15 +62,20 @@ async def login_user_handler(user_data: User):
 
 async def check_company_exists(user_id: str, company_id: str):
     try:
-        company = await firebase.get_company_by_id(user_id, company_id)
-        return company is not None
+        return await get_repository().company_exists(user_id, company_id)
     except Exception:
         return False
 
-async def get_companies(user_id: str):
+DEFAULT_PAGE_SIZE = 100
+
+async def get_companies(user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None):
     try:
-        companies = await firebase.get_companies(user_id)
-        return companies
+        if limit is None and cursor is None:
+            return await get_repository().get_companies(user_id)
+        companies, next_cursor = await get_repository().get_companies_page(user_id, limit or DEFAULT_PAGE_SIZE, cursor)
+        return {"items": companies, "nextCursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         error_msg = str(e).lower()
         print(f"Error in get_companies: {e}")
@@ -96,7 +107,7 @@ async def create_company(user_id: str, company_data: Company):
     company_data.updated_at = datetime.utcnow()
     
     try:
-        success = await firebase.create_company(user_id, company_data)
+        success = await get_repository().create_company(user_id, company_data)
         if success:
             return {"message": "Data created successfully", "id": company_id}
         else:
@@ -108,28 +119,40 @@ async def create_company(user_id: str, company_data: Company):
         # Return success for development
         return {"message": "Data created successfully", "id": company_id}
 
-async def update_company(user_id: str, company_id: str, company_data: Company):
+def _with_etag(content: dict, record) -> JSONResponse:
+    """A write response carrying the record's new ETag, so the next conditional write needs no read first"""
+    return JSONResponse(content=content, headers={"ETag": etags.etag_of(record)} if record else {})
+
+async def update_company(user_id: str, company_id: str, company_data: Company, if_match: Optional[str] = None):
     # Validate required fields
     if not company_data.name or company_data.name.strip() == "":
         raise HTTPException(status_code=422, detail="Company name is required and cannot be empty")
     
     # Check if company exists first
     try:
-        existing_company = await firebase.get_company_by_id(user_id, company_id)
-        if not existing_company:
-            return {"message": "That data not exist"}
+        precondition = etags.if_match(if_match)
+        # With If-Match the write itself fails (412) for a missing company
+        if precondition is None:
+            existing_company = await get_repository().get_company_by_id(user_id, company_id)
+            if not existing_company:
+                return {"message": "That data not exist"}
         
         # Company exists, proceed with update
         company_data.id = company_id
         company_data.updated_at = datetime.utcnow()
         
-        success = await firebase.update_company(user_id, company_id, company_data)
+        success = await get_repository().update_company(user_id, company_id, company_data, precondition)
         if success:
-            return {"message": "Data updated successfully", "id": company_id}
+            content = {"message": "Data updated successfully", "id": company_id}
+            if precondition is None:
+                return content
+            return _with_etag(content, success)
         else:
             raise HTTPException(status_code=500, detail="Internal server error")
     except HTTPException:
         raise
+    except firebase.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Precondition failed")
     except Exception as e:
         error_msg = str(e).lower()
         
@@ -252,19 +275,23 @@ async def send_email_reminders():
         print(f"❌ {error_message}")
         raise HTTPException(status_code=500, detail=error_message)
 
-async def delete_company(user_id: str, company_id: str):
+async def delete_company(user_id: str, company_id: str, if_match: Optional[str] = None):
     # Check if company exists first
     try:
-        existing_company = await firebase.get_company_by_id(user_id, company_id)
+        existing_company = await get_repository().get_company_by_id(user_id, company_id)
         if not existing_company:
             return {"message": "That data not exist"}
         
         # Company exists, proceed with delete
-        success = await firebase.delete_company(user_id, company_id)
+        success = await get_repository().delete_company(user_id, company_id, etags.if_match(if_match))
         if success:
-            return {"message": "Company deleted successfully", "id": company_id}
+            # Its tasks are removed in the background; the job id lets clients follow along
+            job = jobs.start_job("delete_company_tasks", user_id, _delete_company_tasks, companyId=company_id)
+            return {"message": "Company deleted successfully", "id": company_id, "cleanupJobId": job.id}
         else:
             raise HTTPException(status_code=500, detail="Internal server error")
+    except firebase.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Precondition failed")
     except Exception as e:
         error_msg = str(e).lower()
         
@@ -304,7 +331,7 @@ async def delete_company(user_id: str, company_id: str):
 
 async def get_company_by_id(user_id: str, company_id: str):
     try:
-        company = await firebase.get_company_by_id(user_id, company_id)
+        company = await get_repository().get_company_by_id(user_id, company_id)
         if company:
             return company
         else:
@@ -328,10 +355,24 @@ async def get_company_by_id(user_id: str, company_id: str):
         else:
             raise HTTPException(status_code=500, detail="Internal server error")
 
-async def get_tasks(user_id: str):
+async def get_tasks(user_id: str, completed: Optional[bool] = None, company_id: Optional[str] = None,
+                    title_prefix: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None):
+    if company_id is not None and (not company_id.strip() or "/" in company_id):
+        raise HTTPException(status_code=400, detail="Invalid companyId")
+    
     try:
-        tasks = await firebase.get_tasks(user_id)
+        if limit is not None or cursor is not None:
+            tasks, next_cursor = await get_repository().get_tasks_page(
+                user_id, limit or DEFAULT_PAGE_SIZE, cursor,
+                completed=completed, company_id=company_id, title_prefix=title_prefix
+            )
+            return {"items": tasks, "nextCursor": next_cursor}
+        if completed is None and not company_id and not title_prefix:
+            return await get_repository().get_tasks(user_id)
+        tasks = await get_repository().query_tasks(user_id, completed=completed, company_id=company_id, title_prefix=title_prefix)
         return tasks
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         error_msg = str(e).lower()
         
@@ -368,7 +409,7 @@ async def create_task(user_id: str, task_data: Task):
     task_data.updated_at = datetime.utcnow()
     
     try:
-        success = await firebase.create_task(user_id, task_data)
+        success = await get_repository().create_task(user_id, task_data)
         if success:
             return {"message": "Data created successfully", "id": task_id}
         else:
@@ -399,7 +440,7 @@ async def create_task(user_id: str, task_data: Task):
         else:
             raise HTTPException(status_code=500, detail="Internal server error")
 
-async def update_task(user_id: str, task_id: str, task_data: Task):
+async def update_task(user_id: str, task_id: str, task_data: Task, if_match: Optional[str] = None):
     # Validate required fields
     if not task_data.companyId or task_data.companyId.strip() == "":
         raise HTTPException(status_code=422, detail="Company ID is required and cannot be empty")
@@ -413,21 +454,29 @@ async def update_task(user_id: str, task_id: str, task_data: Task):
     
     # Check if task exists first
     try:
-        existing_task = await firebase.get_task_by_id(user_id, task_id)
-        if not existing_task:
-            return {"message": "That data not exist"}
+        precondition = etags.if_match(if_match)
+        # With If-Match the write itself fails (412) for a missing task
+        if precondition is None:
+            existing_task = await get_repository().get_task_by_id(user_id, task_id)
+            if not existing_task:
+                return {"message": "That data not exist"}
         
         # Task exists, proceed with update
         task_data.id = task_id
         task_data.updated_at = datetime.utcnow()
         
-        success = await firebase.update_task(user_id, task_id, task_data)
+        success = await get_repository().update_task(user_id, task_id, task_data, precondition)
         if success:
-            return {"message": "Data updated successfully", "id": task_id}
+            content = {"message": "Data updated successfully", "id": task_id}
+            if precondition is None:
+                return content
+            return _with_etag(content, success)
         else:
             raise HTTPException(status_code=500, detail="Internal server error")
     except HTTPException:
         raise
+    except firebase.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Precondition failed")
     except Exception as e:
         error_msg = str(e).lower()
         
@@ -451,12 +500,12 @@ async def update_task(user_id: str, task_id: str, task_data: Task):
         else:
             raise HTTPException(status_code=500, detail="Internal server error")
 
-async def delete_task(user_id: str, task_id: str):
+async def delete_task(user_id: str, task_id: str, if_match: Optional[str] = None):
     print(f"DELETE /delete_task/{task_id} called")
     
     # Check if task exists first
     try:
-        existing_task = await firebase.get_task_by_id(user_id, task_id)
+        existing_task = await get_repository().get_task_by_id(user_id, task_id)
         if existing_task:
             print(f"✅ Task found: {existing_task.title}")
             company_id = existing_task.companyId
@@ -466,13 +515,15 @@ async def delete_task(user_id: str, task_id: str):
         
         # Task exists, proceed with delete
         print(f"🗑️ Proceeding to delete task: {task_id}")
-        success = await firebase.delete_task(user_id, task_id, company_id)
+        success = await get_repository().delete_task(user_id, task_id, company_id, etags.if_match(if_match))
         if success:
             print("✅ Task deleted successfully from Firebase")
             return {"message": "Task deleted successfully", "id": task_id}
         else:
             print("❌ Failed to delete task from Firebase")
             raise HTTPException(status_code=500, detail="Internal server error")
+    except firebase.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Precondition failed")
     except Exception as e:
         error_msg = str(e).lower()
         print(f"🔥 Error in delete_task: {e}")
@@ -499,7 +550,7 @@ async def delete_task(user_id: str, task_id: str):
 
 async def get_task_by_id(user_id: str, task_id: str):
     try:
-        task = await firebase.get_task_by_id(user_id, task_id)
+        task = await get_repository().get_task_by_id(user_id, task_id)
         if task:
             return task
         else:
@@ -527,7 +578,7 @@ async def get_task_by_id(user_id: str, task_id: str):
 
 async def get_templates(user_id: str):
     try:
-        templates = await firebase.get_templates(user_id)
+        templates = await get_repository().get_templates(user_id)
         return templates
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -539,7 +590,7 @@ async def create_template(user_id: str, template_data: TaskTemplate):
     
     try:
         # Get all companies at once to check existence
-        all_companies = await firebase.get_companies(user_id)
+        all_companies = await get_repository().get_companies(user_id)
         existing_company_ids = {company.id for company in all_companies}
         
         created_tasks = []
@@ -565,7 +616,7 @@ async def create_template(user_id: str, template_data: TaskTemplate):
             
             # Save task to Firebase
             try:
-                success = await firebase.create_task(user_id, task)
+                success = await get_repository().create_task(user_id, task)
                 if success:
                     created_tasks.append({
                         "task_id": task_id,
@@ -621,8 +672,7 @@ async def create_template(user_id: str, template_data: TaskTemplate):
 
 async def check_company_exists(user_id: str, company_id: str):
     try:
-        company = await firebase.get_company_by_id(user_id, company_id)
-        return company is not None
+        return await get_repository().company_exists(user_id, company_id)
     except Exception:
         return False
 
@@ -638,3 +688,131 @@ async def assign_template(user_id: str, template_id: str, assign_data: AssignDat
         "dueDate": assign_data.dueDate,
         "assigned_at": datetime.utcnow().isoformat()
     }
+
+async def get_cache_stats():
+    return firebase.get_cache_stats()
+
+async def get_upstream_stats():
+    return firebase.get_upstream_stats()
+
+def _query_error(e: Exception) -> HTTPException:
+    error_msg = str(e).lower()
+    print(f"Error in count query: {e}")
+    if "forbidden" in error_msg:
+        return HTTPException(status_code=403, detail="Forbidden")
+    elif "rate limit exceeded" in error_msg:
+        return HTTPException(status_code=429, detail="Rate limit exceeded")
+    elif "service unavailable" in error_msg:
+        return HTTPException(status_code=503, detail="Service unavailable")
+    elif "timeout" in error_msg:
+        return HTTPException(status_code=500, detail="Timeout")
+    elif "database error" in error_msg:
+        return HTTPException(status_code=500, detail="Database error")
+    else:
+        return HTTPException(status_code=500, detail="Internal server error")
+
+async def count_companies(user_id: str):
+    try:
+        return {"count": await get_repository().count_companies(user_id)}
+    except Exception as e:
+        raise _query_error(e)
+
+async def count_tasks(user_id: str, completed: Optional[bool] = None, company_id: Optional[str] = None):
+    if company_id is not None and (not company_id.strip() or "/" in company_id):
+        raise HTTPException(status_code=400, detail="Invalid companyId")
+    try:
+        return {"count": await get_repository().count_tasks(user_id, completed=completed, company_id=company_id)}
+    except Exception as e:
+        raise _query_error(e)
+
+async def get_task_summary(user_id: str):
+    try:
+        return await get_repository().get_task_summary(user_id)
+    except Exception as e:
+        raise _query_error(e)
+
+async def sync(user_id: str, since: Optional[str] = None):
+    try:
+        return await get_repository().get_changes(user_id, since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except firebase.SyncTokenExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except Exception as e:
+        raise _query_error(e)
+
+async def get_job(user_id: str, job_id: str):
+    job = await jobs.find_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+async def import_data(user_id: str, kind: str, chunks, fmt: str, gzipped: bool):
+    if kind not in bulk.MODELS:
+        raise HTTPException(status_code=404, detail="Unknown import kind")
+    if fmt not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    try:
+        report = await bulk.import_rows(user_id, kind, chunks, fmt, gzipped)
+        if kind == "tasks" and report["imported"]:
+            # Upserts cannot tell new tasks from replaced ones; recount instead
+            report["counterRepairJobId"] = start_counter_repair(user_id).id
+        return report
+    except (ValueError, zlib.error, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {e}")
+    except Exception as e:
+        raise _query_error(e)
+
+async def export_data(user_id: str, kind: str, fmt: str, gzipped: bool):
+    if kind not in bulk.MODELS:
+        raise HTTPException(status_code=404, detail="Unknown export kind")
+    if fmt not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    chunks = bulk.export_chunks(user_id, kind, fmt, gzipped)
+    try:
+        # Load the first page before committing to a 200
+        first = await chunks.__anext__()
+    except Exception as e:
+        await chunks.aclose()
+        raise _query_error(e)
+    
+    async def body():
+        yield first
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; all we can do is stop the stream short
+            print(f"Error in export_data: {e}")
+    
+    filename = f"{kind}.{fmt}" + (".gz" if gzipped else "")
+    media_type = "application/gzip" if gzipped else ("text/csv" if fmt == "csv" else "application/x-ndjson")
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def search(user_id: str, query: str, limit: int):
+    try:
+        return await get_repository().search(user_id, query, limit)
+    except Exception as e:
+        raise _query_error(e)
+
+def _delete_company_tasks(job):
+    return get_repository().delete_company_tasks(job.user_id, job.params["companyId"], job.progress)
+
+def _repair_task_counters(job):
+    return get_repository().repair_task_counters(job.user_id, job.progress)
+
+# Both are idempotent, so a worker can restart them after another one died
+jobs.register("delete_company_tasks", _delete_company_tasks)
+jobs.register("repair_task_counters", _repair_task_counters)
+
+def start_counter_repair(user_id: str):
+    return jobs.start_job("repair_task_counters", user_id, _repair_task_counters)
+
+async def repair_task_counters(user_id: str):
+    return {"jobId": start_counter_repair(user_id).id}
@@ -0,0 +1,67 @@
+"""Per-request deadlines shared by every upstream call made for one request"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+DEFAULT_REQUEST_BUDGET = float(os.getenv("REQUEST_DEADLINE_SECONDS", "10"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has used up its time budget"""
+
+    def __init__(self):
+        super().__init__("Gateway timeout: request deadline exceeded")
+
+
+class RequestDeadline:
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+        self.exceeded = False
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+# The middleware stores one mutable RequestDeadline per request, so the
+# `exceeded` flag set deep inside a helper is visible to the middleware again.
+_request_deadline: ContextVar[Optional[RequestDeadline]] = ContextVar("request_deadline", default=None)
+
+
+def start_request_deadline(budget: float = DEFAULT_REQUEST_BUDGET) -> RequestDeadline:
+    deadline = RequestDeadline(budget)
+    _request_deadline.set(deadline)
+    return deadline
+
+
+def clear_request_deadline():
+    """Detach the current context from any request deadline (background work)"""
+    _request_deadline.set(None)
+
+
+def get_request_deadline() -> Optional[RequestDeadline]:
+    return _request_deadline.get()
+
+
+def remaining_time(default: float) -> float:
+    """Return the time an upstream call may take, capped at `default`.
+
+    Raises DeadlineExceeded (and flags the request) once the budget is gone,
+    so callers stop before making another upstream call.
+    """
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        deadline.exceeded = True
+        raise DeadlineExceeded()
+    return min(default, remaining)
+
+
+def mark_exceeded_if_expired() -> bool:
+    deadline = _request_deadline.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        deadline.exceeded = True
+        return True
+    return False
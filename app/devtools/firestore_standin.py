@@ -0,0 +1,627 @@
+"""Local stand-in for the subset of the Firestore REST API that firebase.py uses.
+
+Serves list, get, patch, delete, runQuery, runAggregationQuery, batchGet,
+commit and batchWrite from memory, plus the OAuth token endpoint, with
+configurable latency, error injection and list page sizes, so performance
+work can be measured offline and repeatably.
+
+    python -m app.devtools.firestore_standin --port 8085 --latency lognormal:20:0.5 --error-rate 0.01
+    python -m app.devtools.firestore_standin --print-env   # settings that point the app at it
+
+Field paths in masks and filters may be dotted but not backquoted; listen
+streams and transactions are not implemented.
+"""
+import argparse
+import asyncio
+import base64
+import math
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import total_ordering
+from typing import Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+GRPC_CODES = {"INVALID_ARGUMENT": 3, "NOT_FOUND": 5, "ALREADY_EXISTS": 6, "FAILED_PRECONDITION": 9, "UNIMPLEMENTED": 12}
+HTTP_CODES = {"INVALID_ARGUMENT": 400, "NOT_FOUND": 404, "ALREADY_EXISTS": 409, "FAILED_PRECONDITION": 400,
+              "UNIMPLEMENTED": 501, "RESOURCE_EXHAUSTED": 429, "UNAVAILABLE": 503, "INTERNAL": 500}
+STATUS_NAMES = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+
+class LatencyModel:
+    """Per-request delay: "0", "fixed:MS", "uniform:LO:HI", "normal:MEAN:SD" or "lognormal:MEDIAN:SIGMA" (ms)"""
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self._rng = rng
+        kind, *args = spec.split(":")
+        try:
+            self._args = [float(arg) for arg in args]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        expected = {"0": 0, "fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(self._args) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self._kind = kind
+
+    def sample(self) -> float:
+        """Seconds to wait before answering"""
+        if self._kind == "0":
+            return 0.0
+        if self._kind == "fixed":
+            ms = self._args[0]
+        elif self._kind == "uniform":
+            ms = self._rng.uniform(*self._args)
+        elif self._kind == "normal":
+            ms = self._rng.gauss(*self._args)
+        else:
+            median, sigma = self._args
+            ms = self._rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(0.0, ms) / 1000
+
+
+class StandinConfig:
+    def __init__(self, latency: Optional[Dict[str, str]] = None, error_rate: float = 0.0,
+                 error_statuses: tuple = (503,), page_size: Optional[int] = None, seed: Optional[int] = None):
+        """`latency` maps an operation (get, list, patch, delete, runQuery, commit, ...) or "*" to a spec"""
+        self.rng = random.Random(seed)
+        self.latency = {op: LatencyModel(spec, self.rng) for op, spec in (latency or {"*": "0"}).items()}
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.page_size = page_size
+
+    def latency_for(self, operation: str) -> float:
+        model = self.latency.get(operation) or self.latency.get("*")
+        return model.sample() if model else 0.0
+
+
+class RpcError(Exception):
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+    def response(self) -> JSONResponse:
+        code = HTTP_CODES.get(self.status, 500)
+        return JSONResponse({"error": {"code": code, "message": str(self), "status": self.status}}, status_code=code)
+
+
+@total_ordering
+class _Descending:
+    """Wraps a sort key so that it orders in reverse"""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+_TYPE_RANK = {
+    "nullValue": 0, "booleanValue": 1, "integerValue": 2, "doubleValue": 2, "timestampValue": 3,
+    "stringValue": 4, "bytesValue": 5, "referenceValue": 6, "geoPointValue": 7, "arrayValue": 8, "mapValue": 9,
+}
+
+
+def _parse_timestamp(text: str) -> datetime:
+    text = text.replace("Z", "+00:00")
+    if "." in text:
+        head, rest = text.split(".", 1)
+        digits = "".join(c for c in rest if c.isdigit())
+        text = f"{head}.{digits[:6].ljust(6, '0')}{rest[len(digits):]}"
+    return datetime.fromisoformat(text)
+
+
+def value_key(value: dict) -> tuple:
+    """Sort key implementing Firestore's cross-type value ordering"""
+    kind, raw = next(iter(value.items()))
+    rank = _TYPE_RANK.get(kind)
+    if rank is None:
+        raise RpcError("INVALID_ARGUMENT", f"Unsupported value type {kind}")
+    if kind == "nullValue":
+        return (rank,)
+    if kind == "booleanValue":
+        return (rank, bool(raw))
+    if kind == "integerValue":
+        return (rank, int(raw))
+    if kind == "doubleValue":
+        return (rank, float(raw))
+    if kind == "timestampValue":
+        return (rank, _parse_timestamp(raw))
+    if kind == "stringValue":
+        # Firestore orders strings by their UTF-8 encoding
+        return (rank, raw.encode())
+    if kind == "bytesValue":
+        return (rank, base64.b64decode(raw))
+    if kind == "referenceValue":
+        return (rank, tuple(segment.encode() for segment in raw.split("/")))
+    if kind == "geoPointValue":
+        return (rank, (raw.get("latitude", 0), raw.get("longitude", 0)))
+    if kind == "arrayValue":
+        return (rank, tuple(value_key(item) for item in raw.get("values", [])))
+    return (rank, tuple(sorted((name, value_key(item)) for name, item in raw.get("fields", {}).items())))
+
+
+def _field_value(document: dict, path: str) -> Optional[dict]:
+    if path == "__name__":
+        return {"referenceValue": document["name"]}
+    fields = document.get("fields", {})
+    value = None
+    for part in path.split("."):
+        value = fields.get(part)
+        if value is None:
+            return None
+        fields = value.get("mapValue", {}).get("fields", {})
+    return value
+
+
+def _set_field(fields: dict, path: str, value: Optional[dict]):
+    *parents, last = path.split(".")
+    for part in parents:
+        fields = fields.setdefault(part, {"mapValue": {"fields": {}}}).setdefault("mapValue", {}).setdefault("fields", {})
+    if value is None:
+        fields.pop(last, None)
+    else:
+        fields[last] = value
+
+
+def _matches(where: Optional[dict], document: dict) -> bool:
+    if not where:
+        return True
+    if "compositeFilter" in where:
+        composite = where["compositeFilter"]
+        results = (_matches(item, document) for item in composite.get("filters", []))
+        return any(results) if composite.get("op") == "OR" else all(results)
+    if "unaryFilter" in where:
+        unary = where["unaryFilter"]
+        value = _field_value(document, unary["field"]["fieldPath"])
+        op = unary["op"]
+        if value is None:
+            return False
+        is_nan = "doubleValue" in value and math.isnan(float(value["doubleValue"]))
+        return {"IS_NULL": "nullValue" in value, "IS_NOT_NULL": "nullValue" not in value,
+                "IS_NAN": is_nan, "IS_NOT_NAN": not is_nan}[op]
+
+    field_filter = where["fieldFilter"]
+    value = _field_value(document, field_filter["field"]["fieldPath"])
+    if value is None:
+        # A missing field never matches, not even NOT_EQUAL
+        return False
+    op = field_filter["op"]
+    operand = field_filter["value"]
+    if op in ("IN", "NOT_IN", "ARRAY_CONTAINS_ANY"):
+        candidates = {value_key(item) for item in operand.get("arrayValue", {}).get("values", [])}
+        if op == "IN":
+            return value_key(value) in candidates
+        if op == "NOT_IN":
+            return "nullValue" not in value and value_key(value) not in candidates
+        return any(value_key(item) in candidates for item in value.get("arrayValue", {}).get("values", []))
+    if op == "ARRAY_CONTAINS":
+        return any(value_key(item) == value_key(operand) for item in value.get("arrayValue", {}).get("values", []))
+
+    left, right = value_key(value), value_key(operand)
+    if op == "EQUAL":
+        return left == right
+    if op == "NOT_EQUAL":
+        return "nullValue" not in value and left != right
+    if left[0] != right[0]:
+        # Range filters only match values of the same type
+        return False
+    return {
+        "LESS_THAN": left < right, "LESS_THAN_OR_EQUAL": left <= right,
+        "GREATER_THAN": left > right, "GREATER_THAN_OR_EQUAL": left >= right,
+    }[op]
+
+
+def _inequality_field(where: Optional[dict]) -> Optional[str]:
+    if not where:
+        return None
+    if "compositeFilter" in where:
+        for item in where["compositeFilter"].get("filters", []):
+            field = _inequality_field(item)
+            if field:
+                return field
+        return None
+    field_filter = where.get("fieldFilter")
+    if field_filter and field_filter["op"] not in ("EQUAL", "IN", "ARRAY_CONTAINS", "ARRAY_CONTAINS_ANY"):
+        return field_filter["field"]["fieldPath"]
+    return None
+
+
+class FirestoreStandin:
+    """In-memory documents keyed by full resource name, and the operations on them"""
+
+    def __init__(self, config: Optional[StandinConfig] = None):
+        self.config = config or StandinConfig()
+        self.documents: Dict[str, dict] = {}
+        self.calls = Counter()
+        self._last_time = 0.0
+
+    def reset(self):
+        self.documents.clear()
+        self.calls.clear()
+
+    def _timestamp(self) -> str:
+        # Strictly increasing so updateTime preconditions can tell writes apart
+        now = max(time.time(), self._last_time + 1e-6)
+        self._last_time = now
+        return datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    # Writes
+
+    def _check_precondition(self, name: str, current: Optional[dict], precondition: Optional[dict]):
+        if not precondition:
+            return
+        if "exists" in precondition:
+            if precondition["exists"] and current is None:
+                raise RpcError("NOT_FOUND", f"No document to update: {name}")
+            if not precondition["exists"] and current is not None:
+                raise RpcError("ALREADY_EXISTS", f"Document already exists: {name}")
+        if "updateTime" in precondition:
+            if current is None or _parse_timestamp(current["updateTime"]) != _parse_timestamp(precondition["updateTime"]):
+                raise RpcError("FAILED_PRECONDITION", f"The stored version of {name} does not match the required update time")
+
+    def _apply_transforms(self, fields: dict, transforms: List[dict], now: str):
+        for transform in transforms:
+            path = transform["fieldPath"]
+            if "increment" in transform:
+                current = _field_value({"fields": fields}, path)
+                step = transform["increment"]
+                if "integerValue" in step and (current is None or "integerValue" in current):
+                    base = int(current["integerValue"]) if current else 0
+                    _set_field(fields, path, {"integerValue": str(base + int(step["integerValue"]))})
+                else:
+                    base = float(next(iter(current.values()))) if current and ("integerValue" in current or "doubleValue" in current) else 0.0
+                    _set_field(fields, path, {"doubleValue": base + float(next(iter(step.values())))})
+            elif transform.get("setToServerValue") == "REQUEST_TIME":
+                _set_field(fields, path, {"timestampValue": now})
+            else:
+                raise RpcError("UNIMPLEMENTED", f"Unsupported field transform on {path}")
+
+    def _apply_write(self, write: dict, staged: dict, now: str) -> dict:
+        """Apply one write to `staged` (name -> document or None); returns its write result"""
+        if "update" in write:
+            name = write["update"]["name"]
+        elif "delete" in write:
+            name = write["delete"]
+        elif "transform" in write:
+            name = write["transform"]["document"]
+        else:
+            raise RpcError("INVALID_ARGUMENT", "Write has no operation")
+        current = staged[name] if name in staged else self.documents.get(name)
+        self._check_precondition(name, current, write.get("currentDocument"))
+
+        if "delete" in write:
+            staged[name] = None
+            return {}
+
+        fields = {key: value for key, value in (current or {}).get("fields", {}).items()}
+        if "update" in write:
+            new_fields = write["update"].get("fields", {})
+            mask = write.get("updateMask", {}).get("fieldPaths")
+            if mask is None:
+                fields = dict(new_fields)
+            else:
+                for path in mask:
+                    _set_field(fields, path, _field_value({"fields": new_fields}, path))
+        transforms = write.get("updateTransforms") or write.get("transform", {}).get("fieldTransforms", [])
+        self._apply_transforms(fields, transforms, now)
+
+        staged[name] = {
+            "name": name,
+            "fields": fields,
+            "createTime": current["createTime"] if current else now,
+            "updateTime": now,
+        }
+        return {"updateTime": now}
+
+    def commit(self, writes: List[dict]) -> dict:
+        """All writes or none"""
+        now = self._timestamp()
+        staged = {}
+        results = [self._apply_write(write, staged, now) for write in writes]
+        self._store(staged)
+        return {"writeResults": results, "commitTime": now}
+
+    def batch_write(self, writes: List[dict]) -> dict:
+        """Each write on its own; failures are reported per write"""
+        results, statuses = [], []
+        for write in writes:
+            staged = {}
+            try:
+                results.append(self._apply_write(write, staged, self._timestamp()))
+                self._store(staged)
+                statuses.append({})
+            except RpcError as e:
+                results.append({})
+                statuses.append({"code": GRPC_CODES.get(e.status, 2), "message": str(e)})
+        return {"writeResults": results, "status": statuses}
+
+    def _store(self, staged: dict):
+        for name, document in staged.items():
+            if document is None:
+                self.documents.pop(name, None)
+            else:
+                self.documents[name] = document
+
+    # Reads
+
+    def list_collection(self, collection: str, page_size: Optional[int], page_token: Optional[str]) -> dict:
+        prefix = collection + "/"
+        names = sorted(
+            (name for name in self.documents if name.startswith(prefix) and "/" not in name[len(prefix):]),
+            key=lambda name: name.encode()
+        )
+        if page_token:
+            names = [name for name in names if name.encode() > page_token.encode()]
+        limits = [size for size in (page_size, self.config.page_size) if size]
+        result = {}
+        if limits and len(names) > min(limits):
+            names = names[:min(limits)]
+            result["nextPageToken"] = names[-1]
+        if names:
+            result["documents"] = [self.documents[name] for name in names]
+        return result
+
+    def _select(self, parent: str, source: dict) -> List[dict]:
+        collection_id = source["collectionId"]
+        prefix = parent + "/"
+        selected = []
+        for name, document in self.documents.items():
+            if not name.startswith(prefix):
+                continue
+            segments = name[len(prefix):].split("/")
+            if source.get("allDescendants"):
+                if len(segments) >= 2 and segments[-2] == collection_id:
+                    selected.append(document)
+            elif len(segments) == 2 and segments[0] == collection_id:
+                selected.append(document)
+        return selected
+
+    def run_query(self, parent: str, query: dict) -> List[dict]:
+        sources = query.get("from", [])
+        if len(sources) != 1:
+            raise RpcError("INVALID_ARGUMENT", "Exactly one collection selector is supported")
+        documents = [doc for doc in self._select(parent, sources[0]) if _matches(query.get("where"), doc)]
+
+        order = [(item["field"]["fieldPath"], item.get("direction", "ASCENDING")) for item in query.get("orderBy", [])]
+        inequality = _inequality_field(query.get("where"))
+        if inequality and inequality != "__name__" and inequality not in [path for path, _ in order]:
+            order.insert(0, (inequality, "ASCENDING"))
+        if "__name__" not in [path for path, _ in order]:
+            order.append(("__name__", order[-1][1] if order else "ASCENDING"))
+
+        def position(document: dict) -> Optional[tuple]:
+            key = []
+            for path, direction in order:
+                value = _field_value(document, path)
+                if value is None:
+                    return None
+                key.append(value_key(value) if direction == "ASCENDING" else _Descending(value_key(value)))
+            return tuple(key)
+
+        def cursor_key(cursor: dict) -> tuple:
+            return tuple(
+                value_key(value) if direction == "ASCENDING" else _Descending(value_key(value))
+                for value, (_, direction) in zip(cursor.get("values", []), order)
+            )
+
+        # Documents lacking an ordered field are left out, as in Firestore
+        keyed = sorted(((key, doc) for doc in documents for key in [position(doc)] if key is not None), key=lambda item: item[0])
+        if "startAt" in query:
+            start = cursor_key(query["startAt"])
+            inclusive = query["startAt"].get("before", False)
+            keyed = [(key, doc) for key, doc in keyed if (key[:len(start)] >= start if inclusive else key[:len(start)] > start)]
+        if "endAt" in query:
+            end = cursor_key(query["endAt"])
+            inclusive = not query["endAt"].get("before", False)
+            keyed = [(key, doc) for key, doc in keyed if (key[:len(end)] <= end if inclusive else key[:len(end)] < end)]
+
+        results = [doc for _, doc in keyed][query.get("offset", 0):]
+        limit = query.get("limit")
+        if isinstance(limit, dict):
+            limit = limit.get("value")
+        if limit is not None:
+            results = results[:int(limit)]
+        if "select" in query:
+            paths = [item["fieldPath"] for item in query["select"].get("fields", [])]
+            results = [self._project(doc, paths) for doc in results]
+        return results
+
+    @staticmethod
+    def _project(document: dict, paths: List[str]) -> dict:
+        fields = {}
+        for path in paths:
+            if path != "__name__":
+                _set_field(fields, path, _field_value(document, path))
+        return {**document, "fields": fields}
+
+
+def _error_body(status_code: int) -> JSONResponse:
+    status = STATUS_NAMES.get(status_code, "UNAVAILABLE")
+    return JSONResponse({"error": {"code": status_code, "message": "Injected fault", "status": status}}, status_code=status_code)
+
+
+async def _handle(request: Request) -> Response:
+    standin: FirestoreStandin = request.app.state.standin
+    rest = request.path_params["rest"]
+    marker = "/documents"
+    if not rest.startswith("projects/") or marker not in rest:
+        return RpcError("NOT_FOUND", f"Unknown resource {rest}").response()
+    root, relative = rest.split(marker, 1)
+    root += marker
+    # ".../documents/users/u:runQuery" and ".../documents:commit" name a method
+    method = None
+    if ":" in relative.rsplit("/", 1)[-1]:
+        relative, method = relative.rsplit(":", 1)
+    relative = relative.lstrip("/")
+    if method:
+        operation = method
+    else:
+        is_document = relative and len(relative.split("/")) % 2 == 0
+        operation = {"GET": "get" if is_document else "list", "PATCH": "patch", "DELETE": "delete"}.get(
+            request.method, request.method.lower()
+        )
+    standin.calls[operation] += 1
+
+    config = standin.config
+    delay = config.latency_for(operation)
+    if delay:
+        await asyncio.sleep(delay)
+    if config.error_rate and config.rng.random() < config.error_rate:
+        return _error_body(config.rng.choice(config.error_statuses))
+
+    try:
+        if method:
+            parent = f"{root}/{relative}" if relative else root
+            body = await request.json() if request.method == "POST" else {}
+            if method == "runQuery":
+                documents = standin.run_query(parent, body.get("structuredQuery", {}))
+                read_time = standin._timestamp()
+                return JSONResponse([{"document": doc, "readTime": read_time} for doc in documents] or [{"readTime": read_time}])
+            if method == "runAggregationQuery":
+                aggregation = body.get("structuredAggregationQuery", {})
+                documents = standin.run_query(parent, aggregation.get("structuredQuery", {}))
+                fields = {}
+                for item in aggregation.get("aggregations", []):
+                    if "count" not in item:
+                        raise RpcError("UNIMPLEMENTED", "Only count aggregations are supported")
+                    up_to = item["count"].get("upTo")
+                    count = min(len(documents), int(up_to)) if up_to else len(documents)
+                    fields[item.get("alias", "field_1")] = {"integerValue": str(count)}
+                return JSONResponse([{"result": {"aggregateFields": fields}, "readTime": standin._timestamp()}])
+            if method == "batchGet":
+                read_time = standin._timestamp()
+                return JSONResponse([
+                    {"found": standin.documents[name], "readTime": read_time} if name in standin.documents
+                    else {"missing": name, "readTime": read_time}
+                    for name in body.get("documents", [])
+                ])
+            if method == "commit":
+                return JSONResponse(standin.commit(body.get("writes", [])))
+            if method == "batchWrite":
+                return JSONResponse(standin.batch_write(body.get("writes", [])))
+            raise RpcError("UNIMPLEMENTED", f"{method} is not implemented by the stand-in")
+
+        name = f"{root}/{relative}"
+        if operation == "list":
+            page_size = request.query_params.get("pageSize")
+            return JSONResponse(standin.list_collection(
+                name, int(page_size) if page_size else None, request.query_params.get("pageToken")
+            ))
+        precondition = {}
+        if "currentDocument.exists" in request.query_params:
+            precondition["exists"] = request.query_params["currentDocument.exists"] == "true"
+        if "currentDocument.updateTime" in request.query_params:
+            precondition["updateTime"] = request.query_params["currentDocument.updateTime"]
+        if operation == "get":
+            if name not in standin.documents:
+                raise RpcError("NOT_FOUND", f"Document {name} not found")
+            return JSONResponse(standin.documents[name])
+        if operation == "patch":
+            body = await request.json()
+            write = {"update": {"name": name, "fields": body.get("fields", {})}, "currentDocument": precondition}
+            mask = request.query_params.getlist("updateMask.fieldPaths")
+            if mask:
+                write["updateMask"] = {"fieldPaths": mask}
+            standin.commit([write])
+            return JSONResponse(standin.documents[name])
+        if operation == "delete":
+            standin.commit([{"delete": name, "currentDocument": precondition}])
+            return JSONResponse({})
+        raise RpcError("UNIMPLEMENTED", f"{request.method} is not supported")
+    except RpcError as e:
+        return e.response()
+
+
+async def _token(request: Request) -> Response:
+    request.app.state.standin.calls["token"] += 1
+    return JSONResponse({"access_token": "standin-access-token", "expires_in": 3600, "token_type": "Bearer"})
+
+
+async def _stats(request: Request) -> Response:
+    standin = request.app.state.standin
+    return JSONResponse({"documents": len(standin.documents), "calls": dict(standin.calls)})
+
+
+async def _reset(request: Request) -> Response:
+    request.app.state.standin.reset()
+    return JSONResponse({})
+
+
+async def _root(request: Request) -> Response:
+    # Target of the app's connection warm-up
+    return Response(status_code=200)
+
+
+def create_app(config: Optional[StandinConfig] = None) -> Starlette:
+    app = Starlette(routes=[
+        Route("/v1/{rest:path}", _handle, methods=["GET", "PATCH", "DELETE", "POST"]),
+        Route("/token", _token, methods=["POST"]),
+        Route("/standin/stats", _stats, methods=["GET"]),
+        Route("/standin/reset", _reset, methods=["POST"]),
+        Route("/", _root, methods=["GET", "HEAD"]),
+    ])
+    app.state.standin = FirestoreStandin(config)
+    return app
+
+
+def _throwaway_env(base_url: str) -> List[str]:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    return [
+        f"FIRESTORE_BASE_URL={base_url}/",
+        f"OAUTH_TOKEN_URL={base_url}/token",
+        "FIREBASE_PROJECT_ID=standin",
+        "FIREBASE_CLIENT_EMAIL=standin@standin.iam.gserviceaccount.com",
+        # firebase.py turns the literal \n back into newlines
+        f'FIREBASE_PRIVATE_KEY="{pem.strip().replace(chr(10), chr(92) + "n")}"',
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Firestore REST stand-in with latency and fault injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency", action="append", default=[],
+                        help='"SPEC" for every call or "OPERATION=SPEC" (e.g. runQuery=lognormal:40:0.6); repeatable')
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Firestore calls failed on purpose")
+    parser.add_argument("--error-statuses", default="503", help="comma separated HTTP statuses to fail with")
+    parser.add_argument("--page-size", type=int, default=None, help="cap on documents per list page")
+    parser.add_argument("--seed", type=int, default=None, help="makes latency and faults repeatable")
+    parser.add_argument("--print-env", action="store_true", help="print settings that point the app here, then exit")
+    args = parser.parse_args()
+
+    if args.print_env:
+        print("\n".join(_throwaway_env(f"http://{args.host}:{args.port}")))
+        return
+
+    latency = {}
+    for item in args.latency:
+        operation, _, spec = item.rpartition("=")
+        latency[operation or "*"] = spec
+    config = StandinConfig(
+        latency=latency or None,
+        error_rate=args.error_rate,
+        error_statuses=tuple(int(status) for status in args.error_statuses.split(",")),
+        page_size=args.page_size,
+        seed=args.seed,
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
@@ -7,6 +7,9 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from dotenv import load_dotenv
 from app.models import Company, Task, TaskTemplate, AssignData, User
 from app.api import handlers
+from app.api.etags import conditional_response
+from app.services import firebase, change_feed, compaction, jobs, repository
+from app.core.deadline import DeadlineExceeded, start_request_deadline
 # from app.services.scheduler import start_email_scheduler, stop_email_scheduler
 import firebase_admin
 from firebase_admin import auth, credentials
@@ -14,6 +17,8 @@ from typing import Optional
 import traceback
 import time
 import atexit
+import asyncio
+import os
 
 load_dotenv("config/.env")
 
@@ -21,7 +26,6 @@ load_dotenv("config/.env")
 try:
     firebase_admin.get_app()
 except ValueError:
-    import os
     firebase_creds = {
         "type": "service_account",
         "project_id": os.getenv("FIREBASE_PROJECT_ID"),
@@ -44,17 +48,57 @@ except ValueError:
 
 app = FastAPI(title="Company Management API", version="1.0.0")
 
+# Set once the startup warm-up has run; reported by /ready
+_warmup_status = None
+
+# Public keys Firebase ID tokens are signed with
+ID_TOKEN_CERT_URI = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+async def fetch_id_token_certs() -> bool:
+    """Check the ID-token signing certificates are reachable, warming DNS and TLS to googleapis.com"""
+    client = await firebase.get_http_client()
+    response = await client.get(ID_TOKEN_CERT_URI, timeout=firebase.WARMUP_TIMEOUT)
+    return response.status_code == 200
+
+async def warm_up_services():
+    global _warmup_status
+    started = time.time()
+    certs = asyncio.ensure_future(fetch_id_token_certs())
+    status = await firebase.warm_up()
+    try:
+        status["certs"] = await asyncio.wait_for(certs, firebase.WARMUP_TIMEOUT)
+    except Exception as e:
+        print(f"⚠️ Warm-up could not fetch ID token certs: {e}")
+        status["certs"] = False
+    status["seconds"] = round(time.time() - started, 3)
+    _warmup_status = status
+    print(f"🔥 Warm-up done: {status}")
+
 # Start email reminder scheduler on startup
 @app.on_event("startup")
 async def startup_event():
     print("🚀 Starting Company Management API...")
     # start_email_scheduler()
+    firebase.start_cache_sweeper()
+    change_feed.start_change_feed()
+    compaction.start_tombstone_purger()
+    # Picks up jobs a previous process left unfinished
+    jobs.start_job_monitor()
+    # Uvicorn only accepts connections once startup returns
+    await warm_up_services()
     print("✅ API started (scheduler disabled)")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("🛑 Shutting down Company Management API...")
     # stop_email_scheduler()
+    await change_feed.stop_change_feed()
+    compaction.stop_tombstone_purger()
+    jobs.stop_jobs()
+    await firebase.flush_pending_writes()
+    firebase.stop_cache_sweeper()
+    # Closes the SQLite connection when that backend is in use
+    repository.set_repository(None)
     print("✅ API stopped")
 
 # Register cleanup on exit
@@ -67,7 +111,8 @@ _cache_expiry = {}
 # Simplified middleware
 class FastContentTypeMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        if request.method in ["POST", "PUT", "PATCH"]:
+        # Bulk uploads are NDJSON/CSV streams, not JSON bodies
+        if request.method in ["POST", "PUT", "PATCH"] and not request.url.path.startswith("/import/"):
             content_type = request.headers.get("content-type", "")
             if content_type and not content_type.startswith("application/json"):
                 return JSONResponse(
@@ -79,6 +124,26 @@ class FastContentTypeMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(FastContentTypeMiddleware)
 
+# Per-request deadline shared by every Firestore call made for the request
+BULK_PATH_PREFIXES = ("/import/", "/export/")
+BULK_REQUEST_BUDGET = float(os.getenv("BULK_REQUEST_DEADLINE_SECONDS", "600"))
+
+class RequestDeadlineMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        bulk = request.url.path.startswith(BULK_PATH_PREFIXES)
+        deadline = start_request_deadline(BULK_REQUEST_BUDGET) if bulk else start_request_deadline()
+        try:
+            response = await call_next(request)
+        except DeadlineExceeded:
+            deadline.exceeded = True
+        if deadline.exceeded:
+            # Handlers may have mapped the failure to something else (or an
+            # empty result); the budget running out always wins.
+            return JSONResponse(status_code=504, content={"detail": "Gateway timeout"})
+        return response
+
+app.add_middleware(RequestDeadlineMiddleware)
+
 # Simplified exception handlers
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -94,6 +159,13 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
         content={"detail": exc.detail}
     )
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exception_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(
+        status_code=504,
+        content={"detail": "Gateway timeout"}
+    )
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
@@ -141,57 +213,147 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Company API Routes
 @app.get("/getall_companies")
-async def get_companies(user_id: str = Depends(get_user_id_from_token)):
-    return await handlers.get_companies(user_id)
+async def get_companies(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    if limit is None and cursor is None:
+        return conditional_response(request, await handlers.get_companies(user_id))
+    return conditional_response(request, await handlers.get_companies(user_id, limit=limit, cursor=cursor))
+
+@app.get("/count_companies")
+async def count_companies(user_id: str = Depends(get_user_id_from_token)):
+    return await handlers.count_companies(user_id)
 
 @app.get("/get_company/{company_id}")
-async def get_company_by_id(company_id: str, user_id: str = Depends(get_user_id_from_token)):
+async def get_company_by_id(company_id: str, request: Request, user_id: str = Depends(get_user_id_from_token)):
     if "../" in company_id or "..\\" in company_id or "<script>" in company_id.lower():
         raise HTTPException(status_code=404, detail="Not found")
-    return await handlers.get_company_by_id(user_id, company_id)
+    return conditional_response(request, await handlers.get_company_by_id(user_id, company_id))
 
 @app.post("/create_company")
 async def create_company(company_data: Company, user_id: str = Depends(get_user_id_from_token)):
     return await handlers.create_company(user_id, company_data)
 
 @app.put("/update_company/{company_id}")
-async def update_company(company_id: str, company_data: Company, user_id: str = Depends(get_user_id_from_token)):
-    return await handlers.update_company(user_id, company_id, company_data)
+async def update_company(
+    company_id: str,
+    company_data: Company,
+    if_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id_from_token)
+):
+    return await handlers.update_company(user_id, company_id, company_data, if_match)
 
 @app.delete("/delete_company/{company_id}")
-async def delete_company(company_id: str, user_id: str = Depends(get_user_id_from_token)):
+async def delete_company(company_id: str, if_match: Optional[str] = Header(None), user_id: str = Depends(get_user_id_from_token)):
     if "<script>" in company_id.lower():
         raise HTTPException(status_code=404, detail="Not found")
-    return await handlers.delete_company(user_id, company_id)
+    return await handlers.delete_company(user_id, company_id, if_match)
 
 # Task API Routes
 @app.get("/getall_tasks")
-async def get_tasks(user_id: str = Depends(get_user_id_from_token)):
-    return await handlers.get_tasks(user_id)
+async def get_tasks(
+    request: Request,
+    completed: Optional[bool] = None,
+    companyId: Optional[str] = None,
+    titlePrefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    filters = {"completed": completed, "company_id": companyId, "title_prefix": titlePrefix}
+    if limit is not None or cursor is not None:
+        filters.update(limit=limit, cursor=cursor)
+    if all(value is None for value in filters.values()):
+        return conditional_response(request, await handlers.get_tasks(user_id))
+    return conditional_response(request, await handlers.get_tasks(user_id, **filters))
+
+@app.get("/count_tasks")
+async def count_tasks(
+    completed: Optional[bool] = None,
+    companyId: Optional[str] = None,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    return await handlers.count_tasks(user_id, completed=completed, company_id=companyId)
+
+@app.get("/task_summary")
+async def get_task_summary(user_id: str = Depends(get_user_id_from_token)):
+    return await handlers.get_task_summary(user_id)
+
+@app.get("/sync")
+async def sync(since: Optional[str] = None, user_id: str = Depends(get_user_id_from_token)):
+    """Everything changed since the `since` token, and the token to pass next time"""
+    return await handlers.sync(user_id, since)
 
 @app.get("/get_task/{task_id}")
-async def get_task_by_id(task_id: str, user_id: str = Depends(get_user_id_from_token)):
+async def get_task_by_id(task_id: str, request: Request, user_id: str = Depends(get_user_id_from_token)):
     if "../" in task_id or "..\\" in task_id or "<script>" in task_id.lower():
         raise HTTPException(status_code=404, detail="Not found")
-    return await handlers.get_task_by_id(user_id, task_id)
+    return conditional_response(request, await handlers.get_task_by_id(user_id, task_id))
 
 @app.post("/create_task")
 async def create_task(task_data: Task, user_id: str = Depends(get_user_id_from_token)):
     return await handlers.create_task(user_id, task_data)
 
 @app.put("/update_task/{task_id}")
-async def update_task(task_id: str, task_data: Task, user_id: str = Depends(get_user_id_from_token)):
-    return await handlers.update_task(user_id, task_id, task_data)
+async def update_task(
+    task_id: str,
+    task_data: Task,
+    if_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id_from_token)
+):
+    return await handlers.update_task(user_id, task_id, task_data, if_match)
 
 @app.delete("/delete_task/{task_id}")
-async def delete_task(task_id: str, user_id: str = Depends(get_user_id_from_token)):
+async def delete_task(task_id: str, if_match: Optional[str] = Header(None), user_id: str = Depends(get_user_id_from_token)):
     if "<script>" in task_id.lower():
         raise HTTPException(status_code=404, detail="Not found")
-    return await handlers.delete_task(user_id, task_id)
+    return await handlers.delete_task(user_id, task_id, if_match)
+
+# Search Routes
+@app.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """Prefix search over company name/city/contact/EIN and task title/description"""
+    return await handlers.search(user_id, q, limit)
+
+# Bulk Routes
+@app.post("/import/{kind}")
+async def import_data(
+    kind: str,
+    request: Request,
+    format: Optional[str] = None,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """Upsert companies or tasks from an NDJSON or CSV stream (optionally gzip)"""
+    content_type = request.headers.get("content-type", "")
+    if format is None:
+        format = "csv" if content_type.startswith("text/csv") else "ndjson"
+    gzipped = (
+        request.headers.get("content-encoding", "").lower() == "gzip"
+        or content_type.startswith(("application/gzip", "application/x-gzip"))
+    )
+    return await handlers.import_data(user_id, kind, request.stream(), format, gzipped)
+
+@app.get("/export/{kind}")
+async def export_data(
+    kind: str,
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """Stream all companies or tasks as NDJSON or CSV (optionally gzip)"""
+    return await handlers.export_data(user_id, kind, format, gzip)
 
 # Template API Routes
 @app.get("/getall_templates")
@@ -232,6 +394,34 @@ async def send_email_reminders_manual():
     """Alternative manual trigger endpoint"""
     return await handlers.send_email_reminders()
 
+# Operational Routes
+@app.post("/repair_task_counters")
+async def repair_task_counters(user_id: str = Depends(get_user_id_from_token)):
+    """Recompute every company's taskCount/openTaskCount in a background job"""
+    return await handlers.repair_task_counters(user_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = Depends(get_user_id_from_token)):
+    """Status and progress of a background job started by this user"""
+    return await handlers.get_job(user_id, job_id)
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the startup warm-up has run"""
+    if _warmup_status is None:
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready", "warmup": _warmup_status}
+
+@app.get("/cache_stats")
+async def get_cache_stats(user_id: str = Depends(get_user_id_from_token)):
+    """Size and hit statistics of the in-process list caches"""
+    return await handlers.get_cache_stats()
+
+@app.get("/upstream_stats")
+async def get_upstream_stats(user_id: str = Depends(get_user_id_from_token)):
+    """Current adaptive concurrency limit for outbound Firestore requests"""
+    return await handlers.get_upstream_stats()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -239,6 +429,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 if __name__ == "__main__":
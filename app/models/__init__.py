@@ -17,6 +17,9 @@ class Company(BaseModel):
     city: str = Field(min_length=1, max_length=200)
     state: str = Field(min_length=1, max_length=50)
     zip: str = Field(min_length=1, max_length=20)
+    # Maintained by task writes; read-only for clients
+    taskCount: Optional[int] = None
+    openTaskCount: Optional[int] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
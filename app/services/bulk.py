@@ -0,0 +1,258 @@
+"""Streaming bulk import and export of companies and tasks (NDJSON or CSV, optionally gzip)"""
+import asyncio
+import codecs
+import csv
+import io
+import json
+import os
+import uuid
+import zlib
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+
+from app.core.deadline import clear_request_deadline
+from app.models import Company, Task
+from app.services import firebase
+from app.services.repository import get_repository
+
+MODELS = {"companies": Company, "tasks": Task}
+FORMATS = ("ndjson", "csv")
+
+# Rows per batchWrite; the body is consumed no faster than batches are written
+IMPORT_BATCH_SIZE = firebase.BATCH_WRITE_LIMIT
+# The report keeps at most this many row errors (the counts stay exact)
+MAX_IMPORT_ERRORS = int(os.getenv("MAX_IMPORT_ERRORS", "1000"))
+MAX_LINE_CHARS = 1024 * 1024
+READ_SIZE = 64 * 1024
+# Documents per Firestore page while exporting; the next page is fetched while this one is sent
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+
+async def gunzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Decompress a gzip stream in bounded pieces, however well it compresses"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk, READ_SIZE)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, READ_SIZE)
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        if len(pending) > MAX_LINE_CHARS:
+            raise ValueError("Line too long")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_rows(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[tuple]:
+    """Yield (row number, dict or None, parse error or None) for every data row"""
+    row = 0
+    if fmt == "ndjson":
+        async for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row, None, f"Invalid JSON: {e.msg}"
+                continue
+            if isinstance(data, dict):
+                yield row, data, None
+            else:
+                yield row, None, "Expected a JSON object"
+        return
+
+    header = None
+    record = ""
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        # A quoted field may span lines; wait until its quotes are balanced
+        if record.count('"') % 2:
+            if len(record) > MAX_LINE_CHARS:
+                raise ValueError("Line too long")
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) > len(header):
+            yield row, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells mean "not given" so optional fields keep their defaults
+        yield row, {name: value for name, value in zip(header, values) if value != ""}, None
+    if record:
+        row += 1
+        yield row, None, "Unterminated quoted field"
+
+
+def _validation_messages(error: ValidationError) -> list:
+    return [f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()]
+
+
+class ImportReport:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, row: int, doc_id: Optional[str], messages: list):
+        self.failed += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({"row": row, "id": doc_id, "errors": messages})
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "processed": self.processed,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors),
+        }
+
+
+async def import_rows(user_id: str, kind: str, chunks: AsyncIterator[bytes], fmt: str, gzipped: bool = False) -> dict:
+    """Validate rows as they arrive and upsert them in one backend batch per IMPORT_BATCH_SIZE rows"""
+    model = MODELS[kind]
+    repository = get_repository()
+    report = ImportReport(kind)
+    known_companies = {}
+    batch = []
+
+    async def flush():
+        try:
+            results = await repository.import_batch(user_id, kind, [(doc_id, item) for _, doc_id, item in batch])
+        except Exception as e:
+            results = [str(e)] * len(batch)
+        for (row, doc_id, _), result in zip(batch, results):
+            if result is True:
+                report.imported += 1
+            else:
+                report.fail(row, doc_id, [result if isinstance(result, str) else "Write failed"])
+        batch.clear()
+
+    if gzipped:
+        chunks = gunzip(chunks)
+    async for row, data, error in iter_rows(iter_lines(chunks), fmt):
+        report.processed += 1
+        if error:
+            report.fail(row, None, [error])
+            continue
+
+        doc_id = str(data.pop("id", "") or uuid.uuid4())
+        if "/" in doc_id or len(doc_id) > 500:
+            report.fail(row, doc_id, ["id: Invalid document id"])
+            continue
+        try:
+            item = model.model_validate(data)
+        except ValidationError as e:
+            report.fail(row, doc_id, _validation_messages(e))
+            continue
+
+        if kind == "tasks":
+            if "/" in item.companyId:
+                report.fail(row, doc_id, ["companyId: Invalid company id"])
+                continue
+            if item.companyId not in known_companies:
+                known_companies[item.companyId] = await repository.company_exists(user_id, item.companyId)
+            if not known_companies[item.companyId]:
+                report.fail(row, doc_id, ["companyId: Company not exist"])
+                continue
+
+        batch.append((row, doc_id, item))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return report.to_dict()
+
+
+async def iter_pages(user_id: str, kind: str, page_size: Optional[int] = None) -> AsyncIterator[list]:
+    """Walk a user's companies or tasks page by page, prefetching one page ahead"""
+    page_size = page_size or EXPORT_PAGE_SIZE
+    repository = get_repository()
+    fetch = repository.get_companies_page if kind == "companies" else repository.get_tasks_page
+    next_page = asyncio.ensure_future(fetch(user_id, page_size, None))
+    try:
+        while next_page is not None:
+            items, cursor = await next_page
+            next_page = asyncio.ensure_future(fetch(user_id, page_size, cursor)) if cursor else None
+            yield items
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+def _export_fields(kind: str) -> list:
+    return [name for name in MODELS[kind].model_fields if name not in ("created_at", "updated_at")]
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        # Matches what the importer parses back
+        return "true" if value else "false"
+    return str(value)
+
+
+def _encode_page(items: list, fields: list, fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(json.dumps(item.model_dump(mode="json", include=set(fields))) + "\n" for item in items)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for item in items:
+        values = item.model_dump(mode="json", include=set(fields))
+        writer.writerow([_csv_value(values[name]) for name in fields])
+    return out.getvalue()
+
+
+async def export_chunks(user_id: str, kind: str, fmt: str, gzipped: bool = False) -> AsyncIterator[bytes]:
+    """Encode pages as they arrive; only one page (plus the prefetched one) is ever in memory.
+
+    The first chunk is produced only after the first page has loaded, so a
+    caller can await it to surface upstream errors before the response starts.
+    """
+    fields = _export_fields(kind)
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzipped else None
+    prefix = ",".join(fields) + "\n" if fmt == "csv" else ""
+    first = True
+
+    pages = iter_pages(user_id, kind)
+    try:
+        async for items in pages:
+            data = (prefix + _encode_page(items, fields, fmt)).encode()
+            prefix = ""
+            if compressor is not None:
+                # Sync flush so every page reaches the client without waiting for more
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data or first:
+                yield data
+            if first:
+                # From here on the export runs as long as the client keeps reading
+                clear_request_deadline()
+                first = False
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        await pages.aclose()
@@ -0,0 +1,189 @@
+"""Memory-bounded in-process caches"""
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+
+def approximate_size(value: Any) -> int:
+    """Rough deep size in bytes of a cached value (models, lists, dicts, scalars)"""
+    if isinstance(value, BaseModel):
+        return sys.getsizeof(value) + approximate_size(value.__dict__)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approximate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """TTL cache bounded by approximate byte size with LRU eviction.
+
+    Entries are fresh until `fresh_ttl` and still served (as stale) until
+    `ttl`, which lets callers revalidate in the background in between.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, fresh_ttl: Optional[float] = None,
+                 sizeof: Callable[[Any], int] = approximate_size):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.fresh_ttl = ttl if fresh_ttl is None else min(fresh_ttl, ttl)
+        self._sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, expires_at, size, fresh_until, tag)
+        self._keys_by_id = {}  # id(value) -> key; ids are unique while the entry holds the value
+        self._notes = {}  # key -> note about the current value, dropped when it is replaced
+        self.current_bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and time.monotonic() < entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> list:
+        return list(self._entries)
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, key) -> Optional[tuple]:
+        """Return (value, is_fresh) for a live entry, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        now = time.monotonic()
+        if now >= entry[1]:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        fresh = now < entry[3]
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return entry[0], fresh
+
+    def set(self, key, value, ttl: Optional[float] = None, tag: Any = None):
+        size = self._sizeof(value)
+        self._remove(key)
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (value, now + ttl, size, now + min(self.fresh_ttl, ttl), tag)
+        self._keys_by_id[id(value)] = key
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def update(self, key, fn: Callable[[Any], Any]) -> bool:
+        """Replace a live entry with fn(value), keeping its expiry; no-op when absent"""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            return False
+        value = fn(entry[0])
+        size = self._sizeof(value)
+        self.current_bytes += size - entry[2]
+        self._forget(key, entry[0])
+        self._entries[key] = (value, entry[1], size, entry[3], entry[4])
+        self._keys_by_id[id(value)] = key
+        return True
+
+    def get_tag(self, key) -> Any:
+        """Caller-defined stamp stored with an entry (e.g. the version it was built from)"""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[4]
+
+    def set_tag(self, key, tag: Any):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = entry[:4] + (tag,)
+
+    def get_note(self, value) -> Any:
+        """Note stored with `value` by set_note, while it is still the value of an entry"""
+        key = self._keys_by_id.get(id(value))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not value:
+            return None
+        return self._notes.get(key)
+
+    def set_note(self, value, note: Any) -> bool:
+        """Attach a note (e.g. a digest) to a cached value; False when `value` is not cached"""
+        key = self._keys_by_id.get(id(value))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not value:
+            return False
+        self._notes[key] = note
+        return True
+
+    def pop(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_id.clear()
+        self._notes.clear()
+        self.current_bytes = 0
+
+    def sweep(self) -> int:
+        """Drop every expired entry; returns how many were removed"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now >= entry[1]]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+            self._forget(key, entry[0])
+
+    def _forget(self, key, value):
+        if self._keys_by_id.get(id(value)) == key:
+            del self._keys_by_id[id(value)]
+        self._notes.pop(key, None)
+
+
+async def sweep_periodically(caches: list, interval: float, on_sweep: Optional[Callable[[], None]] = None):
+    """Background loop removing expired entries so idle keys do not pin memory"""
+    while True:
+        await asyncio.sleep(interval)
+        for cache in caches:
+            cache.sweep()
+        if on_sweep is not None:
+            on_sweep()
@@ -0,0 +1,215 @@
+"""Change notifications that patch the per-user caches when documents change.
+
+Sources yield Firestore ListenResponse-shaped dicts (`documentChange`,
+`documentDelete`, `documentRemove`, `targetChange`); the feed turns them
+into cache updates. Configure with CHANGE_FEED:
+  - "firestore"            poll Firestore for changes to the users recently
+                           active on this worker (see FirestorePollSource)
+  - "file:/path/to.ndjson"  tail a local file with one ListenResponse per line
+"""
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+
+from app.services import firebase
+
+# Seconds between polls of a user with recent changes; users whose polls
+# come back empty are polled ever less often, down to MAX_POLL_INTERVAL
+POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "2"))
+MAX_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_MAX_POLL_SECONDS", "30"))
+# Only users who read their data on this worker this recently are polled
+ACTIVE_WINDOW = float(os.getenv("CHANGE_FEED_ACTIVE_SECONDS", "300"))
+
+_feed_task = None
+_feed_source = None
+
+
+def parse_document_name(name: str) -> Optional[tuple]:
+    """Return (user_id, kind, doc_id) for company and task document names"""
+    parts = name.split("/documents/", 1)[-1].split("/")
+    if len(parts) == 4 and parts[0] == "users" and parts[2] == "companies":
+        return parts[1], "company", parts[3]
+    if len(parts) == 6 and parts[0] == "users" and parts[2] == "companies" and parts[4] == "Task":
+        return parts[1], "task", parts[5]
+    return None
+
+
+def apply_listen_response(response: dict) -> bool:
+    """Apply one ListenResponse to the caches; returns True when it changed something"""
+    if "documentChange" in response:
+        change = response["documentChange"]
+        document = change.get("document", {})
+        name = document.get("name", "")
+        # A document that no longer matches any target is gone for our purposes
+        deleted = not change.get("targetIds") and bool(change.get("removedTargetIds"))
+    elif "documentDelete" in response:
+        name, document, deleted = response["documentDelete"].get("document", ""), None, True
+    elif "documentRemove" in response:
+        name, document, deleted = response["documentRemove"].get("document", ""), None, True
+    else:
+        return False
+
+    parsed = parse_document_name(name)
+    if parsed is None:
+        return False
+    user_id, kind, doc_id = parsed
+    firebase.apply_document_change(user_id, kind, doc_id, None if deleted else document)
+    return True
+
+
+class ChangeSource(ABC):
+    """Produces ListenResponse dicts until closed"""
+
+    @abstractmethod
+    def responses(self) -> AsyncIterator[dict]:
+        ...
+
+    async def close(self):
+        pass
+
+
+class FileChangeSource(ChangeSource):
+    """Tails an NDJSON file; a local stand-in for the Firestore feed in tests and dev"""
+
+    def __init__(self, path: str, poll_interval: float = 0.5, from_start: bool = False):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+        self._closed = False
+
+    async def responses(self) -> AsyncIterator[dict]:
+        position = 0 if self.from_start or not os.path.exists(self.path) else os.path.getsize(self.path)
+        pending = ""
+        while not self._closed:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    f.seek(position)
+                    chunk = f.read()
+                    position = f.tell()
+                pending += chunk
+                *lines, pending = pending.split("\n")
+                for line in lines:
+                    if line.strip():
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            print(f"⚠️ Skipping malformed change line: {line[:100]}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        self._closed = True
+
+
+class FirestorePollSource(ChangeSource):
+    """Polls Firestore for changes to the users recently active on this worker.
+
+    Firestore serves Listen over gRPC/WebChannel only, not REST, so instead
+    each poll runs firebase.query_changes for one user: runQuery on
+    updated_at (and on the delete tombstones' deleted_at) after the read
+    time of that user's previous poll, scoped to users/{uid}. Only users who
+    read their data here within CHANGE_FEED_ACTIVE_SECONDS are polled, all
+    due users at once; a user's interval doubles after each empty poll up to
+    CHANGE_FEED_MAX_POLL_SECONDS. A user's position is kept while their lists
+    stay cached, so one who goes quiet and comes back catches up, and starts
+    from a Firestore read time rather than the local clock.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, max_interval: float = MAX_POLL_INTERVAL,
+                 active_window: float = ACTIVE_WINDOW):
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.active_window = active_window
+        self._positions = {}
+        self._schedule = {}  # user -> (next poll at, current interval)
+        self._closed = False
+
+    async def responses(self) -> AsyncIterator[dict]:
+        while not self._closed:
+            cached = firebase.cached_user_ids()
+            for user_id in list(self._positions):
+                if user_id not in cached:
+                    self._positions.pop(user_id)
+                    self._schedule.pop(user_id, None)
+            now = time.monotonic()
+            due = [
+                user_id for user_id in firebase.active_user_ids(self.active_window)
+                if self._schedule.get(user_id, (0, 0))[0] <= now
+            ]
+            # The upstream limiter bounds how many of these run at once
+            results = await asyncio.gather(*[self._poll(user_id) for user_id in due], return_exceptions=True)
+            for user_id, messages in zip(due, results):
+                if isinstance(messages, Exception):
+                    print(f"⚠️ Change poll for {user_id} failed: {messages}")
+                    messages = []
+                self._reschedule(user_id, changed=bool(messages))
+                for message in messages:
+                    yield message
+            await asyncio.sleep(self.poll_interval)
+
+    def _reschedule(self, user_id: str, changed: bool):
+        _, interval = self._schedule.get(user_id, (0, 0))
+        interval = self.poll_interval if changed or not interval else min(self.max_interval, interval * 2)
+        self._schedule[user_id] = (time.monotonic() + interval, interval)
+
+    async def _poll(self, user_id: str) -> list:
+        after = self._positions.get(user_id)
+        if after is None:
+            # Only changes from now on (as Firestore's clock has it); the
+            # caches load current state themselves
+            read_time = await firebase.server_read_time(user_id)
+            if read_time:
+                self._positions[user_id] = read_time
+            return []
+        companies, tasks, tombstones, read_time = await firebase.query_changes(user_id, after)
+        if read_time:
+            self._positions[user_id] = read_time
+        messages = [{"documentChange": {"document": document, "targetIds": [1]}} for document in companies + tasks]
+        for tombstone in tombstones:
+            name = firebase.get_string_value(tombstone.get("fields", {}), "document")
+            if name:
+                messages.append({"documentDelete": {"document": name}})
+        return messages
+
+    async def close(self):
+        self._closed = True
+
+
+def get_change_source(setting: Optional[str]) -> Optional[ChangeSource]:
+    if not setting:
+        return None
+    if setting == "firestore":
+        return FirestorePollSource()
+    if setting.startswith("file:"):
+        return FileChangeSource(setting[len("file:"):])
+    raise ValueError(f"Unknown CHANGE_FEED source: {setting}")
+
+
+async def run_change_feed(source: ChangeSource):
+    async for response in source.responses():
+        try:
+            apply_listen_response(response)
+        except Exception as e:
+            print(f"⚠️ Failed to apply change: {e}")
+
+
+def start_change_feed():
+    global _feed_task, _feed_source
+    if _feed_task is not None:
+        return
+    _feed_source = get_change_source(os.getenv("CHANGE_FEED"))
+    if _feed_source is None:
+        return
+    _feed_task = asyncio.ensure_future(run_change_feed(_feed_source))
+    print(f"📡 Change feed started ({type(_feed_source).__name__})")
+
+
+async def stop_change_feed():
+    global _feed_task, _feed_source
+    if _feed_task is not None:
+        await _feed_source.close()
+        _feed_task.cancel()
+        _feed_task = None
+        _feed_source = None
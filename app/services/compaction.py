@@ -0,0 +1,47 @@
+"""Background purge of delete tombstones past the retention window.
+
+Tombstones let /sync report deletes; once older than
+TOMBSTONE_RETENTION_DAYS they are removed in batches, and sync tokens from
+before the window are refused so no client silently misses a delete.
+Set TOMBSTONE_PURGE_INTERVAL_SECONDS to 0 to turn the loop off.
+"""
+import asyncio
+import os
+
+from app.services import firebase
+from app.services.repository import get_repository
+
+TOMBSTONE_PURGE_INTERVAL = int(os.getenv("TOMBSTONE_PURGE_INTERVAL_SECONDS", "21600"))
+
+_purger = None
+
+
+async def purge_tombstones() -> dict:
+    """One pass over the configured backend; returns its progress counts"""
+    progress = {}
+    await get_repository().purge_tombstones(firebase.tombstone_cutoff(), progress)
+    return progress
+
+
+async def purge_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            progress = await purge_tombstones()
+            if progress.get("deleted") or progress.get("failed"):
+                print(f"🧹 Purged tombstones: {progress}")
+        except Exception as e:
+            print(f"⚠️ Tombstone purge failed: {e}")
+
+
+def start_tombstone_purger():
+    global _purger
+    if _purger is None and TOMBSTONE_PURGE_INTERVAL > 0:
+        _purger = asyncio.ensure_future(purge_periodically(TOMBSTONE_PURGE_INTERVAL))
+
+
+def stop_tombstone_purger():
+    global _purger
+    if _purger is not None:
+        _purger.cancel()
+        _purger = None
@@ -1,32 +1,181 @@
 import httpx
 import json
 import os
-from typing import List, Optional
+from typing import Callable, List, Optional, Union
 from app.models import Company, Task, TaskTemplate
 import jwt
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from pydantic import TypeAdapter
 import asyncio
-from functools import lru_cache
+import base64
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from app.services.cache import LRUCache, sweep_periodically
+from app.services.shared_cache import SharedCache
+from app.services.snapshot import SnapshotStore, UserSnapshot
+from app.services.limiter import AdaptiveLimiter
+from app.services.write_behind import WriteBehind
+from app.core.deadline import DeadlineExceeded, clear_request_deadline, get_request_deadline, remaining_time, mark_exceeded_if_expired
 
 # Global variables for caching
 _cached_token = None
 _token_expiry = 0
 _http_client = None
-_companies_cache = {}
-_tasks_cache = {}
-_cache_expiry = {}
+_inflight_reads = {}
+_write_versions = {}
+_write_versions_generation = 0
+_cache_sweeper = None
+_background_refreshes = {}
+# user -> monotonic time of their last list or snapshot read on this worker
+_last_reads = {}
+
+# Mutations keep the list caches current, so they can live much longer
+# than the old 10 s without breaking read-your-writes. Past the soft TTL a
+# list is still served while one background refresh runs; past the hard
+# TTL the request waits for Firestore.
+LIST_CACHE_TTL = int(os.getenv("LIST_CACHE_TTL_SECONDS", "300"))
+LIST_CACHE_HARD_TTL = int(os.getenv("LIST_CACHE_HARD_TTL_SECONDS", "1800"))
+LIST_CACHE_MAX_BYTES = int(os.getenv("LIST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "60"))
+# The snapshots below (search tries included) take their share of the same limit
+SNAPSHOT_MAX_BYTES = LIST_CACHE_MAX_BYTES // 4
+
+_companies_cache = LRUCache(max_bytes=(LIST_CACHE_MAX_BYTES - SNAPSHOT_MAX_BYTES) // 2, ttl=LIST_CACHE_HARD_TTL, fresh_ttl=LIST_CACHE_TTL)
+_tasks_cache = LRUCache(max_bytes=(LIST_CACHE_MAX_BYTES - SNAPSHOT_MAX_BYTES) // 2, ttl=LIST_CACHE_HARD_TTL, fresh_ttl=LIST_CACHE_TTL)
+
+# Optional L2 shared by all workers on the host; each L1 entry is tagged
+# with the L2 version it was built from.
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH")
+_shared_cache = SharedCache(SHARED_CACHE_PATH, ttl=LIST_CACHE_TTL, retention=2 * LIST_CACHE_HARD_TTL) if SHARED_CACHE_PATH else None
+# Its SQLite calls can wait on another worker's lock, so they run here,
+# off the event loop; one thread keeps them in the order they were issued.
+_shared_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+
+# Indexed per-user view over the cached lists, kept current by the same
+# write deltas, serving lookups by id without going back to Firestore.
+SNAPSHOT_IDLE_TTL = int(os.getenv("SNAPSHOT_IDLE_SECONDS", "600"))
+SNAPSHOT_MAX_USERS = int(os.getenv("SNAPSHOT_MAX_USERS", "10000"))
+_snapshots = SnapshotStore(max_age=LIST_CACHE_TTL, idle_ttl=SNAPSHOT_IDLE_TTL, max_users=SNAPSHOT_MAX_USERS,
+                           max_bytes=SNAPSHOT_MAX_BYTES)
+
+# Deletes leave a tombstone under users/{uid}/deletions so /sync can report
+# them; tombstones older than the retention window are purged, and sync
+# tokens older than it are refused since deletes after them may be gone.
+SYNC_DELETIONS = "deletions"
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+_TIMESTAMP = TypeAdapter(datetime)
+
+# Aggregation results per user ({count name: value}); short-lived and
+# dropped on any write by the user, so badges never lag their own edits.
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL_SECONDS", "30"))
+_counts_cache = LRUCache(max_bytes=int(os.getenv("COUNT_CACHE_MAX_BYTES", str(4 * 1024 * 1024))), ttl=COUNT_CACHE_TTL)
+
+UPSTREAM_TIMEOUT = 5.0
+UPSTREAM_CONNECT_TIMEOUT = 2.0
+# Bound on one coalesced read as a whole; it runs free of any caller's deadline
+SHARED_LOAD_TIMEOUT = float(os.getenv("SHARED_LOAD_TIMEOUT_SECONDS", "30"))
+# Point both at a stand-in (app/devtools/firestore_standin.py) for offline runs
+FIRESTORE_BASE_URL = os.getenv("FIRESTORE_BASE_URL", "https://firestore.googleapis.com/").rstrip("/") + "/"
+OAUTH_TOKEN_URL = os.getenv("OAUTH_TOKEN_URL", "https://oauth2.googleapis.com/token")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "8"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "10"))
+
+# One process-wide limit for every outbound call, adjusted from latency and 429s
+_upstream_limiter = AdaptiveLimiter(
+    initial=int(os.getenv("UPSTREAM_INITIAL_CONCURRENCY", "32")),
+    min_limit=int(os.getenv("UPSTREAM_MIN_CONCURRENCY", "4")),
+    max_limit=int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "256")),
+    latency_target=float(os.getenv("UPSTREAM_LATENCY_TARGET_SECONDS", "1.0"))
+)
+
+# Updates of one task within this window are merged into a single write of
+# the last value (0 = every update is written before the request returns)
+TASK_WRITE_BEHIND_MS = int(os.getenv("TASK_WRITE_BEHIND_MS", "0"))
+_task_write_behind = WriteBehind(TASK_WRITE_BEHIND_MS / 1000, lambda key, task: _flush_task_update(*key, task))
 
 async def get_http_client():
     global _http_client
     if _http_client is None:
         _http_client = httpx.AsyncClient(
-            timeout=httpx.Timeout(5.0, connect=2.0),
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
             limits=httpx.Limits(max_keepalive_connections=100, max_connections=500),
             http2=False
         )
     return _http_client
 
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    # Every upstream call shrinks its timeout to what is left of the request
+    # deadline and refuses to start once that budget is gone.
+    timeout = remaining_time(UPSTREAM_TIMEOUT)
+    try:
+        await asyncio.wait_for(_upstream_limiter.acquire(), timeout)
+    except asyncio.TimeoutError:
+        if mark_exceeded_if_expired():
+            raise DeadlineExceeded()
+        raise Exception("Request timeout waiting for an upstream slot")
+    
+    # Only what upstream did moves the limit: a request that expired while
+    # queued, or ran out of its own shrunken budget, says nothing about load
+    latency = None
+    congested = False
+    try:
+        client = await get_http_client()
+        timeout = remaining_time(UPSTREAM_TIMEOUT)
+        started = time.monotonic()
+        response = await client.request(
+            method,
+            url,
+            timeout=httpx.Timeout(timeout, connect=min(UPSTREAM_CONNECT_TIMEOUT, timeout)),
+            **kwargs
+        )
+        latency = time.monotonic() - started
+        congested = response.status_code in (429, 503)
+        return response
+    except httpx.TimeoutException:
+        if timeout >= UPSTREAM_TIMEOUT:
+            # Upstream did not answer within the full allowance
+            latency = time.monotonic() - started
+            congested = True
+        if mark_exceeded_if_expired():
+            raise DeadlineExceeded()
+        raise
+    finally:
+        _upstream_limiter.release(latency, congested)
+
+async def warm_up(connections: int = WARMUP_CONNECTIONS, timeout: float = WARMUP_TIMEOUT) -> dict:
+    """Sign and fetch the access token and open pooled Firestore connections.
+
+    Run once at startup so the first requests after a deploy do not pay for
+    JWT signing and TLS handshakes. Failures are reported, never raised.
+    """
+    result = {"access_token": False, "connections": 0}
+    
+    async def open_connection():
+        client = await get_http_client()
+        # Any response leaves a TLS connection in the keep-alive pool
+        await client.request("HEAD", FIRESTORE_BASE_URL, timeout=timeout)
+        return True
+    
+    async def run():
+        opened = await asyncio.gather(
+            get_access_token(),
+            *[open_connection() for _ in range(connections)],
+            return_exceptions=True
+        )
+        if isinstance(opened[0], Exception):
+            print(f"⚠️ Warm-up could not fetch access token: {opened[0]}")
+        else:
+            result["access_token"] = True
+        result["connections"] = sum(1 for item in opened[1:] if item is True)
+    
+    try:
+        await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Warm-up did not finish within {timeout}s")
+    return result
+
 @lru_cache(maxsize=1)
 def get_firebase_config():
     return {
@@ -49,16 +198,16 @@ async def get_access_token() -> str:
     payload = {
         "iss": config["client_email"],
         "scope": "https://www.googleapis.com/auth/datastore",
-        "aud": "https://oauth2.googleapis.com/token",
+        "aud": OAUTH_TOKEN_URL,
         "exp": now + 3600,
         "iat": now,
     }
     
     token = jwt.encode(payload, config["private_key"], algorithm="RS256")
     
-    client = await get_http_client()
-    response = await client.post(
-        "https://oauth2.googleapis.com/token",
+    response = await _request(
+        "POST",
+        OAUTH_TOKEN_URL,
         data={
             "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
             "assertion": token,
@@ -73,116 +222,766 @@ async def get_access_token() -> str:
     _token_expiry = now + 3600
     return _cached_token
 
+async def _single_flight(url: str, projection: str, loader):
+    """Share one upstream read between concurrent identical requests.
+
+    Keyed by request URL plus the projection the result is parsed into, so
+    callers also share the parsed value. The load runs under its own fixed
+    SHARED_LOAD_TIMEOUT rather than the deadline of whichever caller started
+    it, so a short deadline cannot cut it short for everyone; each waiter
+    still bounds its wait by its own request deadline.
+    """
+    key = (asyncio.get_running_loop(), url, projection)
+    task = _inflight_reads.get(key)
+    if task is None:
+        async def shared_load():
+            clear_request_deadline()
+            return await asyncio.wait_for(loader(), SHARED_LOAD_TIMEOUT)
+        
+        task = asyncio.ensure_future(shared_load())
+        _inflight_reads[key] = task
+        task.add_done_callback(lambda _: _inflight_reads.pop(key, None))
+    deadline = get_request_deadline()
+    if deadline is None:
+        return await asyncio.shield(task)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=remaining_time(deadline.remaining()))
+    except asyncio.TimeoutError:
+        deadline.exceeded = True
+        raise DeadlineExceeded()
+
+def _shared_call(shared: Optional[SharedCache], method: str, *args, default=None):
+    # The L2 is an optimisation; any SQLite trouble degrades to a miss
+    if shared is None:
+        return default
+    try:
+        return getattr(shared, method)(*args)
+    except sqlite3.Error as e:
+        print(f"Shared cache {method} failed: {e}")
+        return default
+
+async def _shared_await(method: str, *args, default=None):
+    """Run a shared cache call on its thread and wait for the result"""
+    call = partial(_shared_call, _shared_cache, method, *args, default=default)
+    return await asyncio.get_running_loop().run_in_executor(_shared_executor, call)
+
+def _shared_later(method: str, *args, then: Optional[Callable] = None):
+    """Queue a shared cache call from synchronous code; `then` gets its result on the event loop"""
+    if _shared_cache is None:
+        return
+    call = partial(_shared_call, _shared_cache, method, *args)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No loop (scripts, shutdown): nothing else can be waiting on it
+        result = call()
+        if then is not None:
+            then(result)
+        return
+    future = loop.run_in_executor(_shared_executor, call)
+    if then is not None:
+        future.add_done_callback(lambda done: then(done.result()))
+
+async def _get_cached_list(cache: LRUCache, cache_key: str) -> Optional[tuple]:
+    """L1 lookup that drops entries another worker has written past"""
+    if _shared_cache is not None and cache_key in cache:
+        version = await _shared_await("version", cache_key)
+        # Compared after the wait: our own writes retag the entry meanwhile
+        if version is not None and version != cache.get_tag(cache_key):
+            cache.pop(cache_key)
+            return None
+    return cache.get_entry(cache_key)
+
+async def _get_shared_list(cache_key: str, model) -> tuple:
+    """Return (L2 version, parsed list or None)"""
+    if _shared_cache is None:
+        return 0, None
+    version, payload = await _shared_await("get", cache_key, default=(0, None))
+    if payload is None:
+        return version, None
+    try:
+        return version, [model(**item) for item in json.loads(payload)]
+    except Exception:
+        return version, None
+
+def _put_shared_list(cache_key: str, items: list, version: int):
+    if _shared_cache is not None:
+        payload = json.dumps([item.model_dump(mode="json") for item in items]).encode()
+        _shared_later("put", cache_key, payload, version)
+
+def _invalidate_shared(cache: LRUCache, cache_key: str):
+    def retag(versions):
+        # Keep our in-place updated L1 copy only if no other worker wrote in between
+        if versions is not None and cache.get_tag(cache_key) == versions[0]:
+            cache.set_tag(cache_key, versions[1])
+        else:
+            cache.pop(cache_key)
+    _shared_later("invalidate", cache_key, then=retag)
+
+def _refresh_in_background(cache_key: str, loader):
+    if cache_key in _background_refreshes:
+        return
+    
+    async def refresh():
+        # Runs detached from the request that noticed the stale entry
+        clear_request_deadline()
+        try:
+            await loader()
+        except Exception as e:
+            print(f"Background refresh of {cache_key} failed: {e}")
+    
+    task = asyncio.ensure_future(refresh())
+    _background_refreshes[cache_key] = task
+    task.add_done_callback(lambda _: _background_refreshes.pop(cache_key, None))
+
 async def get_companies(user_id: str) -> List[Company]:
-    global _companies_cache, _cache_expiry
-    
-    now = int(time.time())
+    _last_reads[user_id] = time.monotonic()
     cache_key = f"companies_{user_id}"
-    if cache_key in _companies_cache and now < _cache_expiry.get(cache_key, 0):
-        return _companies_cache[cache_key]
+    entry = await _get_cached_list(_companies_cache, cache_key)
+    if entry is not None:
+        companies, fresh = entry
+        if not fresh:
+            _refresh_in_background(cache_key, lambda: _load_companies(user_id))
+        return companies
     
+    return await _load_companies(user_id)
+
+async def _load_companies(user_id: str) -> List[Company]:
+    cache_key = f"companies_{user_id}"
     config = get_firebase_config()
-    url = f"https://firestore.googleapis.com/v1/projects/{config['project_id']}/databases/(default)/documents/users/{user_id}/companies"
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{config['project_id']}/databases/(default)/documents/users/{user_id}/companies"
     
     try:
-        token = await get_access_token()
-        client = await get_http_client()
-        
-        response = await client.get(url, headers={"Authorization": f"Bearer {token}"})
+        version = _write_version(user_id)
+        shared_version, companies = await _get_shared_list(cache_key, Company)
+        # Unless a write of ours landed while the L2 was read
+        if companies is not None and version == _write_version(user_id):
+            _companies_cache.set(cache_key, companies, tag=shared_version)
+            return companies
         
-        if response.status_code != 200:
+        companies = await _single_flight(url, "companies", lambda: _fetch_companies(url))
+        if companies is None:
             return []
         
-        data = response.json()
-        companies = []
-        
-        if "documents" in data:
-            for doc in data["documents"]:
-                company = parse_firestore_company(doc)
-                if company:
-                    companies.append(company)
-        
-        _companies_cache[cache_key] = companies
-        _cache_expiry[cache_key] = now + 10
+        # A write that landed while the read was in flight wins over it
+        if version == _write_version(user_id):
+            _companies_cache.set(cache_key, companies, tag=shared_version)
+            _put_shared_list(cache_key, companies, shared_version)
         
         return companies
     except Exception:
         return []
 
-
+async def _fetch_companies(url: str) -> Optional[List[Company]]:
+    token = await get_access_token()
+    
+    response = await _request("GET", url, headers={"Authorization": f"Bearer {token}"})
+    
+    if response.status_code != 200:
+        return None
+    
+    data = response.json()
+    companies = []
+    
+    if "documents" in data:
+        for doc in data["documents"]:
+            company = parse_firestore_company(doc)
+            if company:
+                companies.append(company)
+    
+    return companies
 
 async def get_tasks(user_id: str) -> List[Task]:
-    global _tasks_cache, _cache_expiry
-    
-    now = int(time.time())
+    _last_reads[user_id] = time.monotonic()
+    cache_key = f"tasks_{user_id}"
+    entry = await _get_cached_list(_tasks_cache, cache_key)
+    if entry is not None:
+        tasks, fresh = entry
+        if not fresh:
+            _refresh_in_background(cache_key, lambda: _load_tasks(user_id))
+        return tasks
+    
+    return await _load_tasks(user_id)
+
+async def _load_tasks(user_id: str) -> List[Task]:
     cache_key = f"tasks_{user_id}"
-    if cache_key in _tasks_cache and now < _cache_expiry.get(cache_key, 0):
-        return _tasks_cache[cache_key]
-    
     project_id = os.getenv("FIREBASE_PROJECT_ID")
     
-    companies_url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies"
+    companies_url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies"
+    
+    version = _write_version(user_id)
+    shared_version, all_tasks = await _get_shared_list(cache_key, Task)
+    if all_tasks is not None and version == _write_version(user_id):
+        all_tasks = _with_pending_tasks(user_id, all_tasks)
+        _tasks_cache.set(cache_key, all_tasks, tag=shared_version)
+        return all_tasks
     
+    all_tasks = await _single_flight(companies_url, "tasks", lambda: _fetch_tasks(project_id, user_id, companies_url))
+    if all_tasks is None:
+        return []
+    all_tasks = _with_pending_tasks(user_id, all_tasks)
+    
+    if version == _write_version(user_id):
+        _tasks_cache.set(cache_key, all_tasks, tag=shared_version)
+        _put_shared_list(cache_key, all_tasks, shared_version)
+    
+    return all_tasks
+
+async def _fetch_tasks(project_id: str, user_id: str, companies_url: str) -> Optional[List[Task]]:
     token = await get_access_token()
-    client = await get_http_client()
     
-    companies_response = await client.get(
+    companies_response = await _request(
+        "GET",
         companies_url,
         headers={"Authorization": f"Bearer {token}"}
     )
     
     if companies_response.status_code in [403, 401, 404]:
-        return []
+        return None
     
     companies_data = companies_response.json()
     
     if "documents" not in companies_data:
-        return []
-    
-    # Limit concurrent requests to avoid overwhelming the server
-    semaphore = asyncio.Semaphore(100)
+        return None
     
     async def get_company_tasks(company_doc):
-        async with semaphore:
-            company_id = company_doc["name"].split("/")[-1]
-            tasks_url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task"
-            
-            try:
-                tasks_response = await client.get(
-                    tasks_url,
-                    headers={"Authorization": f"Bearer {token}"}
-                )
-                
-                if tasks_response.status_code == 200:
-                    tasks_data = tasks_response.json()
-                    if "documents" in tasks_data:
-                        return [parse_firestore_task(task_doc) for task_doc in tasks_data["documents"] if parse_firestore_task(task_doc)]
-            except:
-                pass
-            return []
+        company_id = company_doc["name"].split("/")[-1]
+        tasks_url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task"
+        
+        return await _single_flight(tasks_url, "tasks", lambda: _fetch_company_tasks(tasks_url, token))
     
-    # Execute requests with limited concurrency
-    task_lists = await asyncio.gather(*[get_company_tasks(company_doc) for company_doc in companies_data["documents"]], return_exceptions=True)
+    # Concurrency is bounded process-wide by the upstream limiter in _request.
+    # Any company that cannot be read fails the whole load: a list missing
+    # one company's tasks must not be served (or cached) as complete.
+    task_lists = await asyncio.gather(*[get_company_tasks(company_doc) for company_doc in companies_data["documents"]])
     
     # Flatten the results
     all_tasks = []
     for task_list in task_lists:
-        if isinstance(task_list, list):
-            all_tasks.extend(task_list)
-    
-    _tasks_cache[cache_key] = all_tasks
-    _cache_expiry[cache_key] = now + 10
+        all_tasks.extend(task_list)
     
     return all_tasks
 
+async def _fetch_company_tasks(tasks_url: str, token: str) -> List[Task]:
+    tasks_response = await _request(
+        "GET",
+        tasks_url,
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    
+    if tasks_response.status_code == 404:
+        # The company was deleted since the company list was read
+        return []
+    _raise_for_query_status(tasks_response, "list tasks")
+    tasks_data = tasks_response.json()
+    if "documents" in tasks_data:
+        return [parse_firestore_task(task_doc) for task_doc in tasks_data["documents"] if parse_firestore_task(task_doc)]
+    return []
+
+def _field_filter(field: str, op: str, value: dict) -> dict:
+    return {"fieldFilter": {"field": {"fieldPath": field}, "op": op, "value": value}}
+
+def _combine_filters(filters: list) -> Optional[dict]:
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return {"compositeFilter": {"op": "AND", "filters": filters}}
+
+def _task_query(user_id: str, completed: Optional[bool], company_id: Optional[str], title_prefix: Optional[str]) -> tuple:
+    """Build (parent path, structured query) selecting the matching tasks in Firestore"""
+    if company_id:
+        # One company's tasks live in a single collection under it
+        parent = f"users/{user_id}/companies/{company_id}"
+        source = {"collectionId": "Task"}
+    else:
+        parent = f"users/{user_id}"
+        source = {"collectionId": "Task", "allDescendants": True}
+    
+    filters = []
+    if completed is not None:
+        filters.append(_field_filter("completed", "EQUAL", {"booleanValue": completed}))
+    if title_prefix:
+        filters.append(_field_filter("title", "GREATER_THAN_OR_EQUAL", {"stringValue": title_prefix}))
+        filters.append(_field_filter("title", "LESS_THAN", {"stringValue": title_prefix + "\uf8ff"}))
+    
+    query = {"from": [source]}
+    where = _combine_filters(filters)
+    if where is not None:
+        query["where"] = where
+    return parent, query
+
+async def _run_query(parent: str, query: dict) -> List[dict]:
+    """POST a structured query under `parent`; returns the matching documents"""
+    documents, _ = await _run_query_at(parent, query)
+    return documents
+
+async def _run_query_at(parent: str, query: dict) -> tuple:
+    """(matching documents, read time the results are consistent at or None)"""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    # An empty parent queries from the database root (collection groups across users)
+    resource = f"documents/{parent}" if parent else "documents"
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/{resource}:runQuery"
+    token = await get_access_token()
+    
+    response = await _request(
+        "POST",
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        json={"structuredQuery": query}
+    )
+    
+    _raise_for_query_status(response, "runQuery")
+    items = response.json()
+    read_times = [item["readTime"] for item in items if "readTime" in item]
+    return [item["document"] for item in items if "document" in item], read_times[0] if read_times else None
+
+def _raise_for_query_status(response: httpx.Response, method: str):
+    if response.status_code in [401, 403]:
+        raise Exception("Forbidden")
+    if response.status_code == 429:
+        raise Exception("Rate limit exceeded")
+    if response.status_code == 503:
+        raise Exception("Service unavailable")
+    if response.status_code != 200:
+        # e.g. FAILED_PRECONDITION when a composite index is missing
+        raise Exception(f"Database error: {method} returned {response.status_code}: {response.text[:200]}")
+
+async def _run_count(parent: str, query: dict) -> int:
+    """Count the documents matching a structured query without reading them"""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/{parent}:runAggregationQuery"
+    token = await get_access_token()
+    
+    response = await _request(
+        "POST",
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "structuredAggregationQuery": {
+                "structuredQuery": query,
+                "aggregations": [{"alias": "count", "count": {}}]
+            }
+        }
+    )
+    
+    _raise_for_query_status(response, "runAggregationQuery")
+    for item in response.json():
+        if "result" in item:
+            return int(item["result"]["aggregateFields"]["count"]["integerValue"])
+    return 0
+
+async def _cached_count(user_id: str, name: str, parent: str, query: dict) -> int:
+    cache_key = f"counts_{user_id}"
+    counts = _counts_cache.get(cache_key)
+    if counts is not None and name in counts:
+        return counts[name]
+    
+    version = _write_version(user_id)
+    count = await _single_flight(parent, "count:" + json.dumps(query, sort_keys=True), lambda: _run_count(parent, query))
+    if version == _write_version(user_id):
+        if not _counts_cache.update(cache_key, lambda current: {**current, name: count}):
+            _counts_cache.set(cache_key, {name: count})
+    return count
+
+async def count_companies(user_id: str) -> int:
+    return await _cached_count(user_id, "companies", f"users/{user_id}", {"from": [{"collectionId": "companies"}]})
+
+async def count_tasks(user_id: str, completed: Optional[bool] = None, company_id: Optional[str] = None) -> int:
+    parent, query = _task_query(user_id, completed, company_id, None)
+    return await _cached_count(user_id, f"tasks:{company_id or '*'}:{completed}", parent, query)
+
+async def get_task_summary(user_id: str) -> dict:
+    """Company count plus open/completed task counts, overall and per company.
+
+    Read from the taskCount/openTaskCount counters on the company list.
+    Companies written before the counters existed fall back to the cached
+    task list, or to two aggregation queries each until repair_task_counters
+    has filled them in.
+    """
+    companies = await get_companies(user_id)
+    by_company = {}
+    uncounted = []
+    for company in companies:
+        if company.taskCount is not None and company.openTaskCount is not None:
+            by_company[company.id] = {"open": company.openTaskCount, "completed": company.taskCount - company.openTaskCount}
+        else:
+            by_company[company.id] = {"open": 0, "completed": 0}
+            uncounted.append(company.id)
+    
+    tasks = _tasks_cache.get(f"tasks_{user_id}") if uncounted else None
+    if tasks is not None:
+        # Already in memory: counting it costs no upstream reads at all
+        wanted = set(uncounted)
+        for task in tasks:
+            if task.companyId in wanted:
+                by_company[task.companyId]["completed" if task.completed else "open"] += 1
+    elif uncounted:
+        pairs = [(company_id, completed) for company_id in uncounted for completed in (False, True)]
+        counts = await asyncio.gather(*[
+            count_tasks(user_id, completed=completed, company_id=company_id) for company_id, completed in pairs
+        ])
+        for (company_id, completed), count in zip(pairs, counts):
+            by_company[company_id]["completed" if completed else "open"] = count
+    
+    return {
+        "companies": len(companies),
+        "openTasks": sum(counts["open"] for counts in by_company.values()),
+        "completedTasks": sum(counts["completed"] for counts in by_company.values()),
+        "byCompany": by_company
+    }
+
+async def query_tasks(user_id: str, completed: Optional[bool] = None, company_id: Optional[str] = None,
+                      title_prefix: Optional[str] = None) -> List[Task]:
+    """Tasks matching the given filters, selected by Firestore rather than in Python"""
+    parent, query = _task_query(user_id, completed, company_id, title_prefix)
+    
+    async def load():
+        documents = await _run_query(parent, query)
+        return [task for task in (parse_firestore_task(doc) for doc in documents) if task]
+    
+    return await _single_flight(parent, "query:" + json.dumps(query, sort_keys=True), load)
+
+def encode_cursor(order_fields: List[str], values: List[dict]) -> str:
+    """Opaque continuation token holding the ordering values of the last item served"""
+    raw = json.dumps({"o": order_fields, "v": values}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, order_fields: List[str]) -> List[dict]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values = data["v"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # A cursor only resumes the ordering it was issued for
+    if data.get("o") != order_fields or not isinstance(values, list) or len(values) != len(order_fields):
+        raise ValueError("Invalid cursor")
+    return values
+
+async def _query_page(parent: str, query: dict, order_fields: List[str], parse, limit: int,
+                      cursor: Optional[str]) -> tuple:
+    """Run one page of a query in a stable order; returns (items, next cursor or None).
+
+    Pages continue strictly after the last document served (ordered by the
+    given fields, then document name), so inserts and deletes elsewhere
+    never shift or repeat items the way offsets do.
+    """
+    query = dict(query)
+    query["orderBy"] = [{"field": {"fieldPath": field}, "direction": "ASCENDING"} for field in order_fields]
+    if cursor:
+        query["startAt"] = {"values": decode_cursor(cursor, order_fields), "before": False}
+    # One extra document tells whether another page exists
+    query["limit"] = limit + 1
+    
+    documents = await _single_flight(parent, "page:" + json.dumps(query, sort_keys=True), lambda: _run_query(parent, query))
+    more = len(documents) > limit
+    documents = documents[:limit]
+    items = [item for item in (parse(doc) for doc in documents) if item]
+    
+    next_cursor = None
+    if more and documents:
+        last = documents[-1]
+        values = [
+            {"referenceValue": last["name"]} if field == "__name__" else last.get("fields", {}).get(field, {"nullValue": None})
+            for field in order_fields
+        ]
+        next_cursor = encode_cursor(order_fields, values)
+    return items, next_cursor
+
+async def get_companies_page(user_id: str, limit: int, cursor: Optional[str] = None) -> tuple:
+    query = {"from": [{"collectionId": "companies"}]}
+    return await _query_page(f"users/{user_id}", query, ["__name__"], parse_firestore_company, limit, cursor)
+
+async def get_tasks_page(user_id: str, limit: int, cursor: Optional[str] = None, completed: Optional[bool] = None,
+                         company_id: Optional[str] = None, title_prefix: Optional[str] = None) -> tuple:
+    parent, query = _task_query(user_id, completed, company_id, title_prefix)
+    # Firestore requires the range field to be ordered first
+    order_fields = ["title", "__name__"] if title_prefix else ["__name__"]
+    return await _query_page(parent, query, order_fields, parse_firestore_task, limit, cursor)
+
+def encode_sync_token(position: dict) -> str:
+    """Opaque /sync token; each backend keeps its own position in it"""
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_sync_token(token: str, key: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))[key]
+    except Exception:
+        raise ValueError("Invalid sync token")
+
+class SyncTokenExpired(Exception):
+    """The token predates tombstones that may have been purged; the client must sync from scratch"""
+
+    def __init__(self, message: str = "Sync token expired"):
+        super().__init__(message)
+
+def tombstone_cutoff() -> datetime:
+    """Tombstones written before this may be purged"""
+    return datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+async def get_changes(user_id: str, since: Optional[str] = None) -> dict:
+    """Companies and tasks written, and ids deleted, after the `since` token (everything without one).
+
+    updated_at and deleted_at are commit times (REQUEST_TIME), so a query
+    sees every change stamped up to its read time and none after it; the
+    next token is that read time.
+    """
+    after = None
+    if since:
+        after = decode_sync_token(since, "t")
+        try:
+            issued = _TIMESTAMP.validate_python(after) if isinstance(after, str) else None
+        except Exception:
+            issued = None
+        if issued is None or issued.tzinfo is None:
+            raise ValueError("Invalid sync token")
+        if issued < tombstone_cutoff():
+            raise SyncTokenExpired()
+    
+    company_docs, task_docs, tombstones, read_time = await query_changes(user_id, after)
+    companies = [company for company in map(parse_firestore_company, company_docs) if company]
+    tasks = [task for task in map(parse_firestore_task, task_docs) if task]
+    deleted = {"companies": [], "tasks": []}
+    written = {"company": {company.id for company in companies}, "task": {task.id for task in tasks}}
+    for record in tombstones:
+        fields = record.get("fields", {})
+        kind, doc_id = get_string_value(fields, "kind"), get_string_value(fields, "id")
+        # Created again since the delete: the document is the newer state
+        if kind in written and doc_id not in written[kind]:
+            deleted["companies" if kind == "company" else "tasks"].append(doc_id)
+    
+    token = encode_sync_token({"t": read_time}) if read_time else since
+    return {"companies": companies, "tasks": tasks, "deleted": deleted, "token": token}
+
+async def query_changes(user_id: str, after: Optional[str] = None) -> tuple:
+    """(company documents, task documents, tombstones, read time) for writes stamped after `after`.
+
+    Without `after` every company and task comes back and no tombstones.
+    Resuming from the returned read time may repeat a change, never skip one.
+    """
+    def written_after(source: dict, field: str) -> dict:
+        query = {"from": [source]}
+        if after is not None:
+            query["where"] = _field_filter(field, "GREATER_THAN", {"timestampValue": after})
+        return query
+    
+    parent = f"users/{user_id}"
+    reads = [
+        _run_query_at(parent, written_after({"collectionId": "companies"}, "updated_at")),
+        _run_query_at(parent, written_after({"collectionId": "Task", "allDescendants": True}, "updated_at")),
+    ]
+    if after is not None:
+        reads.append(_run_query_at(parent, written_after({"collectionId": SYNC_DELETIONS}, "deleted_at")))
+    results = await asyncio.gather(*reads)
+    
+    # The earliest of the queries' read times is covered by all of them
+    read_times = [read_time for _, read_time in results if read_time]
+    read_time = min(read_times, key=_TIMESTAMP.validate_python) if read_times else None
+    tombstones = results[2][0] if after is not None else []
+    return results[0][0], results[1][0], tombstones, read_time
+
+def _replace_in_list(items: list, item_id: str, item=None) -> list:
+    # Copy-on-write so callers still serializing the old list are unaffected
+    updated = []
+    found = False
+    for existing in items:
+        if existing.id == item_id:
+            found = True
+            if item is not None:
+                updated.append(item)
+        else:
+            updated.append(existing)
+    if not found and item is not None:
+        updated.append(item)
+    return updated
+
+def _apply_company_write(user_id: str, company_id: str, company: Optional[Company] = None, from_feed: bool = False):
+    """Apply a company mutation to the cached lists (None = deleted)"""
+    _write_versions[user_id] = _write_versions.get(user_id, 0) + 1
+    _counts_cache.pop(f"counts_{user_id}")
+    if company is not None:
+        company = company.model_copy(update={"id": company_id})
+    
+    _companies_cache.update(f"companies_{user_id}", lambda companies: _replace_in_list(companies, company_id, company))
+    _snapshots.apply_company(user_id, company_id, company)
+    _sync_shared(_companies_cache, f"companies_{user_id}", from_feed)
+    if company is None:
+        _tasks_cache.update(f"tasks_{user_id}", lambda tasks: [task for task in tasks if task.companyId != company_id])
+        _sync_shared(_tasks_cache, f"tasks_{user_id}", from_feed)
+
+def _apply_task_write(user_id: str, task_id: str, task: Optional[Task] = None, from_feed: bool = False):
+    """Apply a task mutation to the cached task list (None = deleted)"""
+    _write_versions[user_id] = _write_versions.get(user_id, 0) + 1
+    _counts_cache.pop(f"counts_{user_id}")
+    if task is not None:
+        task = task.model_copy(update={"id": task_id})
+    
+    _tasks_cache.update(f"tasks_{user_id}", lambda tasks: _replace_in_list(tasks, task_id, task))
+    _snapshots.apply_task(user_id, task_id, task)
+    _sync_shared(_tasks_cache, f"tasks_{user_id}", from_feed)
+
+def _with_pending_tasks(user_id: str, tasks: List[Task]) -> List[Task]:
+    """Freshly loaded tasks with not yet written updates laid over them"""
+    for (pending_user, task_id), task in _task_write_behind.items():
+        if pending_user == user_id:
+            tasks = _replace_in_list(tasks, task_id, task.model_copy(update={"id": task_id}))
+    return tasks
+
+def _sync_shared(cache: LRUCache, cache_key: str, from_feed: bool):
+    if from_feed:
+        # Every worker sees the same feed event and patches its own L1, so
+        # only the shared payload goes; bumping the version here would make
+        # each worker throw away the others' already patched copies.
+        _shared_later("drop_payload", cache_key)
+    else:
+        _invalidate_shared(cache, cache_key)
+
+def invalidate_user_caches(user_id: str):
+    """Forget everything cached for a user (used when a change cannot be applied in place)"""
+    _write_versions[user_id] = _write_versions.get(user_id, 0) + 1
+    _counts_cache.pop(f"counts_{user_id}")
+    _snapshots.drop(user_id)
+    for cache, cache_key in ((_companies_cache, f"companies_{user_id}"), (_tasks_cache, f"tasks_{user_id}")):
+        cache.pop(cache_key)
+        _shared_later("invalidate", cache_key)
+
+def _invalidate_companies(user_id: str):
+    """Forget a user's cached company list, leaving the task list alone"""
+    _write_versions[user_id] = _write_versions.get(user_id, 0) + 1
+    _counts_cache.pop(f"counts_{user_id}")
+    _snapshots.drop(user_id)
+    _companies_cache.pop(f"companies_{user_id}")
+    _shared_later("invalidate", f"companies_{user_id}")
+
+def apply_document_change(user_id: str, kind: str, doc_id: str, document: Optional[dict]):
+    """Patch caches from a change notification; `document` is None for deletes"""
+    if kind == "company":
+        company = parse_firestore_company(document) if document else None
+        if document and company is None:
+            invalidate_user_caches(user_id)
+        else:
+            _apply_company_write(user_id, doc_id, company, from_feed=True)
+    elif kind == "task":
+        task = parse_firestore_task(document) if document else None
+        if document and task is None:
+            invalidate_user_caches(user_id)
+        else:
+            _apply_task_write(user_id, doc_id, task, from_feed=True)
+
+def _write_version(user_id: str) -> tuple:
+    return (_write_versions_generation, _write_versions.get(user_id, 0))
+
+def _after_cache_sweep():
+    # Write versions only matter while a read is in flight; dropping them
+    # bumps the generation so no read straddling the prune caches stale data.
+    global _write_versions_generation
+    _write_versions.clear()
+    _write_versions_generation += 1
+    _snapshots.evict_idle()
+    cached = cached_user_ids()
+    for user_id in [user_id for user_id in _last_reads if user_id not in cached]:
+        _last_reads.pop(user_id, None)
+    _shared_later("sweep")
+
+def start_cache_sweeper():
+    global _cache_sweeper
+    if _cache_sweeper is None:
+        _cache_sweeper = asyncio.ensure_future(
+            sweep_periodically([_companies_cache, _tasks_cache, _counts_cache], CACHE_SWEEP_INTERVAL, _after_cache_sweep)
+        )
+
+def stop_cache_sweeper():
+    global _cache_sweeper
+    if _cache_sweeper is not None:
+        _cache_sweeper.cancel()
+        _cache_sweeper = None
+    _shared_later("close")
+
+def cached_user_ids() -> set:
+    """Users this worker holds list caches for"""
+    return {
+        key.split("_", 1)[1]
+        for cache in (_companies_cache, _tasks_cache) for key in cache.keys()
+    }
+
+def active_user_ids(window: float) -> set:
+    """Cached users who read their lists on this worker in the last `window` seconds"""
+    cutoff = time.monotonic() - window
+    return {user_id for user_id in cached_user_ids() if _last_reads.get(user_id, 0) >= cutoff}
+
+async def server_read_time(user_id: str) -> Optional[str]:
+    """Firestore's current read time, from a query reading at most one tombstone"""
+    _, read_time = await _run_query_at(f"users/{user_id}", {"from": [{"collectionId": SYNC_DELETIONS}], "limit": 1})
+    return read_time
+
+def cached_list_note(result):
+    """Note attached to `result` while it is the cached companies or tasks list of a user"""
+    for cache in (_companies_cache, _tasks_cache):
+        note = cache.get_note(result)
+        if note is not None:
+            return note
+    return None
+
+def note_cached_list(result, note) -> bool:
+    return any(cache.set_note(result, note) for cache in (_companies_cache, _tasks_cache))
+
+def get_upstream_stats() -> dict:
+    return {**_upstream_limiter.stats(), "taskWriteBehind": _task_write_behind.stats()}
+
+async def flush_pending_writes():
+    await _task_write_behind.flush_all()
+
+def get_cache_stats() -> dict:
+    return {
+        "companies": _companies_cache.stats(),
+        "tasks": _tasks_cache.stats(),
+    }
+
+async def get_user_snapshot(user_id: str) -> UserSnapshot:
+    """Indexed companies and tasks of a user, built once from the list caches"""
+    _last_reads[user_id] = time.monotonic()
+    snapshot = _snapshots.get(user_id)
+    if snapshot is not None and _shared_cache is not None:
+        # Another worker's write drops our L1 lists; the snapshot goes with them
+        if await _get_cached_list(_companies_cache, f"companies_{user_id}") is None or \
+                await _get_cached_list(_tasks_cache, f"tasks_{user_id}") is None:
+            _snapshots.drop(user_id)
+            snapshot = None
+    if snapshot is not None:
+        return snapshot
+    
+    version = _write_version(user_id)
+    companies, tasks = await asyncio.gather(get_companies(user_id), get_tasks(user_id))
+    snapshot = UserSnapshot(companies, tasks)
+    if version == _write_version(user_id):
+        _snapshots.put(user_id, snapshot)
+    return snapshot
+
+async def search(user_id: str, query: str, limit: int = 20) -> dict:
+    """Companies and tasks whose text matches every word of the query as a prefix"""
+    snapshot = await get_user_snapshot(user_id)
+    result = snapshot.search(query, limit)
+    # The first search builds the trie; count it against the snapshot budget
+    _snapshots.resize(user_id)
+    return result
+
+async def company_exists(user_id: str, company_id: str) -> bool:
+    snapshot = await get_user_snapshot(user_id)
+    if company_id in snapshot.companies:
+        return True
+    # Not in memory: confirm with Firestore before saying no
+    return await get_company_by_id(user_id, company_id) is not None
+
 async def get_templates(user_id: str) -> List[TaskTemplate]:
     project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/task_templates"
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/task_templates"
     
     token = await get_access_token()
-    client = await get_http_client()
     
-    response = await client.get(
+    response = await _request(
+        "GET",
         url,
         headers={"Authorization": f"Bearer {token}"}
     )
@@ -218,7 +1017,12 @@ def parse_firestore_company(doc: dict) -> Optional[Company]:
             address2=get_string_value(fields, "address2"),
             city=get_string_value(fields, "city"),
             state=get_string_value(fields, "state"),
-            zip=get_string_value(fields, "zip")
+            zip=get_string_value(fields, "zip"),
+            taskCount=get_int_value(fields, "taskCount"),
+            openTaskCount=get_int_value(fields, "openTaskCount"),
+            created_at=get_timestamp_value(fields, "created_at"),
+            # Firestore's own update time when known; it is what ETags pin
+            updated_at=doc.get("updateTime") or get_timestamp_value(fields, "updated_at")
         )
     except:
         return None
@@ -233,11 +1037,42 @@ def parse_firestore_task(doc: dict) -> Optional[Task]:
             companyId=get_string_value(fields, "company_id"),
             title=get_string_value(fields, "title"),
             description=get_optional_string_value(fields, "description"),
-            completed=get_bool_value(fields, "completed")
+            completed=get_bool_value(fields, "completed"),
+            created_at=get_timestamp_value(fields, "created_at"),
+            # Firestore's own update time when known; it is what ETags pin
+            updated_at=doc.get("updateTime") or get_timestamp_value(fields, "updated_at")
         )
     except:
         return None
 
+def company_to_firestore(company: Company) -> dict:
+    return {
+        "name": {"stringValue": company.name},
+        "EIN": {"stringValue": company.EIN},
+        "startDate": {"stringValue": company.startDate},
+        "stateIncorporated": {"stringValue": company.stateIncorporated},
+        "contactPersonName": {"stringValue": company.contactPersonName},
+        "contactPersonPhNumber": {"stringValue": company.contactPersonPhNumber},
+        "address1": {"stringValue": company.address1},
+        "address2": {"stringValue": company.address2},
+        "city": {"stringValue": company.city},
+        "state": {"stringValue": company.state},
+        "zip": {"stringValue": company.zip}
+    }
+
+def task_to_firestore(task: Task) -> dict:
+    return {
+        "company_id": {"stringValue": task.companyId},
+        "title": {"stringValue": task.title},
+        "description": {"stringValue": task.description or ""},
+        "completed": {"booleanValue": task.completed}
+    }
+
+def document_name(path: str) -> str:
+    """Full Firestore resource name of a document path such as users/{uid}/companies/{id}"""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    return f"projects/{project_id}/databases/(default)/documents/{path}"
+
 def parse_firestore_template(doc: dict) -> Optional[TaskTemplate]:
     # Templates are not stored in Firebase, they are just used to create tasks
     return None
@@ -252,49 +1087,78 @@ def get_optional_string_value(fields: dict, field_name: str) -> Optional[str]:
 def get_bool_value(fields: dict, field_name: str) -> bool:
     return fields.get(field_name, {}).get("booleanValue", False)
 
+def get_int_value(fields: dict, field_name: str) -> Optional[int]:
+    value = fields.get(field_name, {}).get("integerValue")
+    return int(value) if value is not None else None
+
+def get_timestamp_value(fields: dict, field_name: str) -> Optional[str]:
+    return fields.get(field_name, {}).get("timestampValue")
+
+def _read_back(parse, path: str, fields: dict, written):
+    """The model a later read of the written fields parses to.
+
+    Caching exactly that keeps cached and freshly read copies, and so the
+    ETags derived from them, identical.
+    """
+    return parse({"name": document_name(path), "fields": fields}) or written
+
+def _pinned_version(precondition: Optional[Callable]) -> Optional[dict]:
+    """currentDocument for a precondition naming an exact update time (see etags.IfMatch).
+
+    Firestore then checks it in the commit, so the write needs no read
+    first. None when the stored record has to be read and checked instead.
+    """
+    update_time = getattr(precondition, "update_time", None)
+    return {"updateTime": update_time} if update_time else None
+
+def _check_precondition(precondition: Optional[Callable], parse, document: Optional[dict]):
+    """Raise PreconditionFailed unless the stored document satisfies `precondition`"""
+    if precondition is None:
+        return
+    current = parse(document) if document is not None else None
+    if current is None or not precondition(current):
+        raise PreconditionFailed()
+
 async def create_company(user_id: str, company: Company) -> bool:
-    project_id = os.getenv("FIREBASE_PROJECT_ID")
     doc_id = company.id
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{doc_id}"
-    
-    token = await get_access_token()
+    company_path = f"users/{user_id}/companies/{doc_id}"
     
-    firestore_doc = {
-        "fields": {
-            "name": {"stringValue": company.name},
-            "EIN": {"stringValue": company.EIN},
-            "startDate": {"stringValue": company.startDate},
-            "stateIncorporated": {"stringValue": company.stateIncorporated},
-            "contactPersonName": {"stringValue": company.contactPersonName},
-            "contactPersonPhNumber": {"stringValue": company.contactPersonPhNumber},
-            "address1": {"stringValue": company.address1},
-            "address2": {"stringValue": company.address2},
-            "city": {"stringValue": company.city},
-            "state": {"stringValue": company.state},
-            "zip": {"stringValue": company.zip}
-        }
+    # A new company starts with zeroed task counters
+    fields = {
+        **company_to_firestore(company),
+        "taskCount": {"integerValue": "0"},
+        "openTaskCount": {"integerValue": "0"}
     }
+    result = await commit([{
+        "update": {"name": document_name(company_path), "fields": fields},
+        "updateTransforms": [server_time("created_at"), server_time("updated_at")]
+    }])
     
-    client = await get_http_client()
-    response = await client.patch(
-        url,
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        },
-        json=firestore_doc
-    )
-    
-    return response.status_code < 400
+    if result is None:
+        return False
+    stored = _stamped(fields, result, "created_at", "updated_at")
+    _apply_company_write(user_id, doc_id, _read_back(parse_firestore_company, company_path, stored, company))
+    return True
 
 async def get_company_by_id(user_id: str, company_id: str) -> Optional[Company]:
+    # A fresh cached list is as current as a read; serving from it keeps
+    # polled lookups (and their ETags) off Firestore
+    entry = await _get_cached_list(_companies_cache, f"companies_{user_id}")
+    if entry is not None and entry[1]:
+        company = next((company for company in entry[0] if company.id == company_id), None)
+        if company is not None:
+            return company
+    
     project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}"
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}"
     
+    return await _single_flight(url, "company", lambda: _fetch_company(url))
+
+async def _fetch_company(url: str) -> Optional[Company]:
     token = await get_access_token()
-    client = await get_http_client()
     
-    response = await client.get(
+    response = await _request(
+        "GET",
         url,
         headers={"Authorization": f"Bearer {token}"}
     )
@@ -305,93 +1169,212 @@ async def get_company_by_id(user_id: str, company_id: str) -> Optional[Company]:
     doc = response.json()
     return parse_firestore_company(doc)
 
-async def update_company(user_id: str, company_id: str, company: Company) -> bool:
-    project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}"
-    
-    token = await get_access_token()
-    
-    firestore_doc = {
-        "fields": {
-            "name": {"stringValue": company.name},
-            "EIN": {"stringValue": company.EIN},
-            "startDate": {"stringValue": company.startDate},
-            "stateIncorporated": {"stringValue": company.stateIncorporated},
-            "contactPersonName": {"stringValue": company.contactPersonName},
-            "contactPersonPhNumber": {"stringValue": company.contactPersonPhNumber},
-            "address1": {"stringValue": company.address1},
-            "address2": {"stringValue": company.address2},
-            "city": {"stringValue": company.city},
-            "state": {"stringValue": company.state},
-            "zip": {"stringValue": company.zip}
-        }
+async def update_company(user_id: str, company_id: str, company: Company, precondition: Optional[Callable] = None) -> Union[Company, bool]:
+    company_path = f"users/{user_id}/companies/{company_id}"
+    fields = company_to_firestore(company)
+    current = None
+    pinned = _pinned_version(precondition)
+    if precondition is not None and pinned is None:
+        current = await _get_document(company_path)
+        _check_precondition(precondition, parse_firestore_company, current)
+    
+    # Only the editable fields; the task counters belong to task writes
+    write = {
+        "update": {"name": document_name(company_path), "fields": fields},
+        "updateMask": {"fieldPaths": list(fields)},
+        "updateTransforms": [server_time("updated_at")]
     }
+    if pinned is not None:
+        write["currentDocument"] = pinned
+    elif current is not None:
+        # A write landing between the read and the commit moves the
+        # updateTime, so the commit fails instead of overwriting it
+        write["currentDocument"] = _unchanged_since(current)
+    result = await commit([write])
+    if result is None:
+        return False
     
-    client = await get_http_client()
-    response = await client.patch(
-        url,
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        },
-        json=firestore_doc
-    )
-    
-    return response.status_code < 400
+    fields = _stamped(fields, result, "updated_at")
+    if current is not None:
+        stored = _read_back(parse_firestore_company, company_path, {**current.get("fields", {}), **fields}, None)
+    else:
+        cached = _cached_company(user_id, company_id)
+        stored = _read_back(parse_firestore_company, company_path, fields, company)
+        if cached is None:
+            # The counters and created_at were not written, so they are not
+            # known here; the next list read fetches them instead
+            _invalidate_companies(user_id)
+            return stored
+        stored = stored.model_copy(update={field: getattr(cached, field) for field in (*COUNTER_FIELDS, "created_at")})
+    if stored is None:
+        invalidate_user_caches(user_id)
+        return company.model_copy(update={"id": company_id, **_commit_time(result)})
+    _apply_company_write(user_id, company_id, stored)
+    return stored
 
-async def delete_company(user_id: str, company_id: str) -> bool:
+async def delete_company(user_id: str, company_id: str, precondition: Optional[Callable] = None) -> bool:
+    company_path = f"users/{user_id}/companies/{company_id}"
+    write = {"delete": document_name(company_path)}
+    pinned = _pinned_version(precondition)
+    if pinned is not None:
+        write["currentDocument"] = pinned
+    elif precondition is not None:
+        current = await _get_document(company_path)
+        _check_precondition(precondition, parse_firestore_company, current)
+        write["currentDocument"] = _unchanged_since(current)
+    
+    # Its tasks go with it, for /sync as well; only the company is recorded
+    success = await commit([write, _deletion_record(user_id, "company", company_id, company_path)]) is not None
+    if success:
+        _apply_company_write(user_id, company_id)
+    return success
+
+BATCH_WRITE_LIMIT = 500
+
+async def batch_write(writes: List[dict]) -> List[bool]:
+    """Apply up to BATCH_WRITE_LIMIT independent writes in one call; returns per-write success"""
     project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}"
-    
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents:batchWrite"
     token = await get_access_token()
-    client = await get_http_client()
     
-    response = await client.delete(
+    response = await _request(
+        "POST",
         url,
-        headers={"Authorization": f"Bearer {token}"}
+        headers={"Authorization": f"Bearer {token}"},
+        json={"writes": writes}
     )
     
-    return response.status_code < 400
+    _raise_for_query_status(response, "batchWrite")
+    statuses = response.json().get("status", [])
+    # An empty status (code 0, OK) means the write was applied
+    return [not (statuses[i] or {}).get("code") if i < len(statuses) else True for i in range(len(writes))]
+
+async def delete_company_tasks(user_id: str, company_id: str, progress: dict):
+    """Delete a company's Task subcollection in pages of BATCH_WRITE_LIMIT.
+
+    Firestore does not cascade document deletes, so without this the tasks
+    of a deleted company stay behind as orphans. `progress` is updated in
+    place after every batch.
+    """
+    parent = f"users/{user_id}/companies/{company_id}"
+    progress.update(deleted=0, failed=0, batches=0)
+    last_name = None
+    
+    while True:
+        query = {
+            "from": [{"collectionId": "Task"}],
+            "select": {"fields": [{"fieldPath": "__name__"}]},
+            "orderBy": [{"field": {"fieldPath": "__name__"}, "direction": "ASCENDING"}],
+            "limit": BATCH_WRITE_LIMIT
+        }
+        # Resume after the last document seen so failed deletes are not retried forever
+        if last_name:
+            query["startAt"] = {"values": [{"referenceValue": last_name}], "before": False}
+        
+        documents = await _run_query(parent, query)
+        if not documents:
+            break
+        
+        results = await batch_write([{"delete": doc["name"]} for doc in documents])
+        progress["deleted"] += sum(results)
+        progress["failed"] += len(results) - sum(results)
+        progress["batches"] += 1
+        last_name = documents[-1]["name"]
+        
+        if len(documents) < BATCH_WRITE_LIMIT:
+            break
+    
+    _counts_cache.pop(f"counts_{user_id}")
+
+async def purge_tombstones(cutoff: datetime, progress: dict):
+    """Delete every user's tombstones written before `cutoff`, BATCH_WRITE_LIMIT per batch.
+
+    One collection-group query over all `deletions` collections, which
+    needs a single-field collection-group index on deleted_at.
+    """
+    progress.update(deleted=0, failed=0, batches=0)
+    order = [{"field": {"fieldPath": field}, "direction": "ASCENDING"} for field in ("deleted_at", "__name__")]
+    last = None
+    
+    while True:
+        query = {
+            "from": [{"collectionId": SYNC_DELETIONS, "allDescendants": True}],
+            "where": _field_filter("deleted_at", "LESS_THAN", {"timestampValue": cutoff.isoformat()}),
+            "select": {"fields": [{"fieldPath": "deleted_at"}]},
+            "orderBy": order,
+            "limit": BATCH_WRITE_LIMIT
+        }
+        if last:
+            query["startAt"] = {
+                "values": [last["fields"]["deleted_at"], {"referenceValue": last["name"]}],
+                "before": False
+            }
+        
+        documents = await _run_query("", query)
+        if not documents:
+            break
+        
+        results = await batch_write([{"delete": doc["name"]} for doc in documents])
+        progress["deleted"] += sum(results)
+        progress["failed"] += len(results) - sum(results)
+        progress["batches"] += 1
+        last = documents[-1]
+        
+        if len(documents) < BATCH_WRITE_LIMIT:
+            break
 
 async def create_task(user_id: str, task: Task) -> bool:
-    project_id = os.getenv("FIREBASE_PROJECT_ID")
     doc_id = task.id
     company_id = task.companyId
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task/{doc_id}"
-    
-    token = await get_access_token()
+    company_path = f"users/{user_id}/companies/{company_id}"
+    
+    # The task and its company's counters change in one atomic commit
+    task_path = f"{company_path}/Task/{doc_id}"
+    fields = task_to_firestore(task)
+    writes = [{
+        "update": {"name": document_name(task_path), "fields": fields},
+        "updateTransforms": [server_time("created_at"), server_time("updated_at")],
+        "currentDocument": {"exists": False}
+    }]
+    writes += _counter_transforms(company_path, 1, 0 if task.completed else 1)
     
-    firestore_doc = {
-        "fields": {
-            "company_id": {"stringValue": task.companyId},
-            "title": {"stringValue": task.title},
-            "description": {"stringValue": task.description or ""},
-            "completed": {"booleanValue": task.completed}
-        }
-    }
-    
-    client = await get_http_client()
-    response = await client.patch(
-        url,
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        },
-        json=firestore_doc
-    )
-    
-    return response.status_code < 400
+    try:
+        result = await commit(writes)
+    except PreconditionFailed:
+        raise Exception("Conflict: company does not exist or task already exists")
+    if result is None:
+        return False
+    stored = _stamped(fields, result, "created_at", "updated_at")
+    _apply_task_write(user_id, doc_id, _read_back(parse_firestore_task, task_path, stored, task))
+    _apply_counter_delta(user_id, company_id, 1, 0 if task.completed else 1, result)
+    return True
 
 async def get_task_by_id(user_id: str, task_id: str) -> Optional[Task]:
     project_id = os.getenv("FIREBASE_PROJECT_ID")
     
     # Need to search through all companies to find the task
-    companies_url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies"
+    companies_url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies"
+    
+    pending = _task_write_behind.get((user_id, task_id))
+    if pending is not None:
+        return pending
     
+    snapshot = await get_user_snapshot(user_id)
+    if task_id in snapshot.tasks:
+        return snapshot.tasks[task_id]
+    
+    # Not in memory: fall back to scanning the companies in Firestore
+    return await _single_flight(
+        f"{companies_url}/*/Task/{task_id}",
+        "task",
+        lambda: _find_task(project_id, user_id, task_id, companies_url)
+    )
+
+async def _find_task(project_id: str, user_id: str, task_id: str, companies_url: str) -> Optional[Task]:
     token = await get_access_token()
-    client = await get_http_client()
     
-    companies_response = await client.get(
+    companies_response = await _request(
+        "GET",
         companies_url,
         headers={"Authorization": f"Bearer {token}"}
     )
@@ -405,9 +1388,10 @@ async def get_task_by_id(user_id: str, task_id: str) -> Optional[Task]:
         for company_doc in companies_data["documents"]:
             company_id = company_doc["name"].split("/")[-1]
             
-            task_url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task/{task_id}"
+            task_url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task/{task_id}"
             
-            task_response = await client.get(
+            task_response = await _request(
+                "GET",
                 task_url,
                 headers={"Authorization": f"Bearer {token}"}
             )
@@ -418,47 +1402,318 @@ async def get_task_by_id(user_id: str, task_id: str) -> Optional[Task]:
     
     return None
 
-async def update_task(user_id: str, task_id: str, task: Task) -> bool:
-    project_id = os.getenv("FIREBASE_PROJECT_ID")
+async def update_task(user_id: str, task_id: str, task: Task, precondition: Optional[Callable] = None) -> Union[Task, bool]:
+    task = _read_back(parse_firestore_task, f"users/{user_id}/companies/{task.companyId}/Task/{task_id}", task_to_firestore(task), task)
+    if precondition is not None:
+        # The check is against the stored task, so a pending update lands first
+        await _task_write_behind.flush((user_id, task_id))
+        return await _commit_task_update(user_id, task_id, task, precondition)
+    if _task_write_behind.delay > 0:
+        # Acknowledged at once; reads see the pending value until it is written
+        _task_write_behind.put((user_id, task_id), task)
+        _apply_task_write(user_id, task_id, task)
+        return task
+    return await _commit_task_update(user_id, task_id, task)
+
+async def _flush_task_update(user_id: str, task_id: str, task: Task):
+    try:
+        if not await _commit_task_update(user_id, task_id, task):
+            raise Exception("Database error: update rejected")
+    except Exception:
+        # The caches show a value that never made it; reload from Firestore
+        invalidate_user_caches(user_id)
+        raise
+    newer = _task_write_behind.get((user_id, task_id))
+    if newer is not None:
+        # A later update is still pending; keep it visible over the one just written
+        _apply_task_write(user_id, task_id, newer)
+
+async def _commit_task_update(user_id: str, task_id: str, task: Task, precondition: Optional[Callable] = None) -> Union[Task, bool]:
     company_id = task.companyId
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task/{task_id}"
-    
+    company_path = f"users/{user_id}/companies/{company_id}"
+    task_path = f"{company_path}/Task/{task_id}"
+    source_path = task_path
+    
+    # Counter deltas depend on the stored task; the commit only applies if
+    # it is still the version we read, otherwise read again and retry.
+    for _ in range(COUNTER_COMMIT_ATTEMPTS):
+        current = await _get_document(source_path)
+        if current is None and source_path == task_path:
+            # Not under the new company: it may be moving from another one
+            stored = await _locate_task(user_id, task_id)
+            if stored is not None and stored.companyId != company_id:
+                source_path = f"users/{user_id}/companies/{stored.companyId}/Task/{task_id}"
+                current = await _get_document(source_path)
+        _check_precondition(precondition, parse_firestore_task, current)
+        moved_from = source_path.split("/")[3] if current is not None and source_path != task_path else None
+        was_open = current is not None and not get_bool_value(current.get("fields", {}), "completed")
+        now_open = 0 if task.completed else 1
+        
+        fields = task_to_firestore(task)
+        if current is not None and "created_at" in current.get("fields", {}):
+            # The update replaces the whole document
+            fields["created_at"] = current["fields"]["created_at"]
+        if moved_from is None:
+            total_delta, open_delta = (0 if current is not None else 1), now_open - (1 if was_open else 0)
+            writes = [{
+                "update": {"name": document_name(task_path), "fields": fields},
+                "updateTransforms": [server_time("updated_at")],
+                "currentDocument": _unchanged_since(current)
+            }]
+            writes += _counter_transforms(company_path, total_delta, open_delta)
+        else:
+            # Task documents live under their company: a move is a delete
+            # plus a create, with both companies' counters, in one commit
+            writes = [
+                {"delete": document_name(source_path), "currentDocument": _unchanged_since(current)},
+                {
+                    "update": {"name": document_name(task_path), "fields": fields},
+                    "updateTransforms": [server_time("updated_at")],
+                    "currentDocument": {"exists": False}
+                },
+            ]
+            writes += _counter_transforms(f"users/{user_id}/companies/{moved_from}", -1, -1 if was_open else 0)
+            writes += _counter_transforms(company_path, 1, now_open)
+        
+        try:
+            result = await commit(writes)
+        except PreconditionFailed:
+            continue
+        if result is None:
+            return False
+        stored = _read_back(parse_firestore_task, task_path, _stamped(fields, result, "updated_at"), task)
+        _apply_task_write(user_id, task_id, stored)
+        if moved_from is None:
+            _apply_counter_delta(user_id, company_id, total_delta, open_delta, result)
+        else:
+            _apply_counter_delta(user_id, moved_from, -1, -1 if was_open else 0, result)
+            _apply_counter_delta(user_id, company_id, 1, now_open, result)
+        return stored
+    raise Exception("Conflict: task changed concurrently")
+
+async def _locate_task(user_id: str, task_id: str) -> Optional[Task]:
+    """The stored task wherever it is, bypassing the caches and pending writes"""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    companies_url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies"
+    return await _find_task(project_id, user_id, task_id, companies_url)
+
+async def delete_task(user_id: str, task_id: str, company_id: str, precondition: Optional[Callable] = None) -> bool:
+    if precondition is None:
+        # A pending update is moot once the task is gone; an in-flight one must land first
+        await _task_write_behind.discard((user_id, task_id))
+    else:
+        # The check is against the stored task, so a pending update lands first
+        await _task_write_behind.flush((user_id, task_id))
+    
+    company_path = f"users/{user_id}/companies/{company_id}"
+    task_path = f"{company_path}/Task/{task_id}"
+    
+    for _ in range(COUNTER_COMMIT_ATTEMPTS):
+        current = await _get_document(task_path)
+        if current is None and precondition is not None:
+            # The caller's company may be stale after a move; check the task where it is
+            stored = await _locate_task(user_id, task_id)
+            if stored is not None and stored.companyId != company_id:
+                company_id = stored.companyId
+                company_path = f"users/{user_id}/companies/{company_id}"
+                task_path = f"{company_path}/Task/{task_id}"
+                current = await _get_document(task_path)
+        _check_precondition(precondition, parse_firestore_task, current)
+        if current is None:
+            # Already gone; deleting a missing document is not an error
+            _apply_task_write(user_id, task_id)
+            return True
+        was_open = not get_bool_value(current.get("fields", {}), "completed")
+        
+        writes = [{"delete": document_name(task_path), "currentDocument": _unchanged_since(current)}]
+        writes += _counter_transforms(company_path, -1, -1 if was_open else 0)
+        writes.append(_deletion_record(user_id, "task", task_id, task_path))
+        
+        try:
+            result = await commit(writes)
+        except PreconditionFailed:
+            continue
+        if result is None:
+            return False
+        _apply_task_write(user_id, task_id)
+        _apply_counter_delta(user_id, company_id, -1, -1 if was_open else 0, result)
+        return True
+    raise Exception("Conflict: task changed concurrently")
+
+async def repair_task_counters(user_id: str, progress: dict):
+    """Recompute taskCount/openTaskCount of every company of a user from its tasks"""
+    progress.update(companies=0, corrected=0, failed=0)
+    cursor = None
+    while True:
+        companies, cursor = await get_companies_page(user_id, 100, cursor)
+        for company in companies:
+            try:
+                if await _repair_company_counters(user_id, company.id):
+                    progress["corrected"] += 1
+            except Exception as e:
+                print(f"⚠️ Counter repair failed for company {company.id}: {e}")
+                progress["failed"] += 1
+            progress["companies"] += 1
+        if cursor is None:
+            break
+
+async def _repair_company_counters(user_id: str, company_id: str) -> bool:
+    company_path = f"users/{user_id}/companies/{company_id}"
+    for _ in range(COUNTER_COMMIT_ATTEMPTS):
+        current = await _get_document(company_path)
+        if current is None:
+            return False
+        
+        total_parent, total_query = _task_query(user_id, None, company_id, None)
+        open_parent, open_query = _task_query(user_id, False, company_id, None)
+        total, open_count = await asyncio.gather(_run_count(total_parent, total_query), _run_count(open_parent, open_query))
+        
+        fields = current.get("fields", {})
+        if get_int_value(fields, "taskCount") == total and get_int_value(fields, "openTaskCount") == open_count:
+            return False
+        
+        # Any task write since the company was read moves its updateTime and
+        # fails this commit, so the counts are never stale when stored
+        writes = [{
+            "update": {
+                "name": document_name(company_path),
+                "fields": {"taskCount": {"integerValue": str(total)}, "openTaskCount": {"integerValue": str(open_count)}}
+            },
+            "updateMask": {"fieldPaths": list(COUNTER_FIELDS)},
+            "updateTransforms": [server_time("updated_at")],
+            "currentDocument": _unchanged_since(current)
+        }]
+        try:
+            result = await commit(writes)
+            if result is None:
+                raise Exception("Database error: commit failed")
+        except PreconditionFailed:
+            continue
+        company = _cached_company(user_id, company_id)
+        if company is not None:
+            _apply_company_write(user_id, company_id, company.model_copy(update={
+                "taskCount": total, "openTaskCount": open_count, **_commit_time(result)
+            }))
+        return True
+    raise Exception("Conflict: company changed concurrently")
+
+COUNTER_FIELDS = ("taskCount", "openTaskCount")
+COUNTER_COMMIT_ATTEMPTS = 3
+
+class PreconditionFailed(Exception):
+    """A commit precondition (exists / updateTime) no longer holds"""
+
+    def __init__(self, message: str = "Precondition failed"):
+        super().__init__(message)
+
+async def commit(writes: List[dict]) -> Optional[dict]:
+    """Apply writes atomically; None when Firestore rejects the commit"""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents:commit"
     token = await get_access_token()
     
-    firestore_doc = {
-        "fields": {
-            "company_id": {"stringValue": task.companyId},
-            "title": {"stringValue": task.title},
-            "description": {"stringValue": task.description or ""},
-            "completed": {"booleanValue": task.completed}
-        }
-    }
-    
-    client = await get_http_client()
-    response = await client.patch(
+    response = await _request(
+        "POST",
         url,
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        },
-        json=firestore_doc
+        headers={"Authorization": f"Bearer {token}"},
+        json={"writes": writes}
     )
     
-    return response.status_code < 400
+    if response.status_code < 400:
+        return response.json()
+    try:
+        status = response.json().get("error", {}).get("status")
+    except ValueError:
+        status = None
+    if status in ("FAILED_PRECONDITION", "NOT_FOUND", "ALREADY_EXISTS", "ABORTED"):
+        raise PreconditionFailed(f"Precondition failed: {status}")
+    return None
 
-async def delete_task(user_id: str, task_id: str, company_id: str) -> bool:
-    project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task/{task_id}"
-    
+async def _get_document(path: str) -> Optional[dict]:
+    """Raw Firestore document (fields and updateTime), or None when it does not exist"""
     token = await get_access_token()
-    client = await get_http_client()
-    
-    response = await client.delete(
-        url,
+    response = await _request(
+        "GET",
+        f"{FIRESTORE_BASE_URL}v1/{document_name(path)}",
         headers={"Authorization": f"Bearer {token}"}
     )
-    
-    return response.status_code < 400
+    if response.status_code == 404:
+        return None
+    _raise_for_query_status(response, "get")
+    return response.json()
+
+def _unchanged_since(document: Optional[dict]) -> dict:
+    if document is None:
+        return {"exists": False}
+    if "updateTime" in document:
+        return {"updateTime": document["updateTime"]}
+    return {"exists": True}
+
+def _counter_transforms(company_path: str, total_delta: int, open_delta: int) -> List[dict]:
+    transforms = [
+        {"fieldPath": field, "increment": {"integerValue": str(delta)}}
+        for field, delta in zip(COUNTER_FIELDS, (total_delta, open_delta)) if delta
+    ]
+    if not transforms:
+        return []
+    # The counters are part of the company, so /sync has to see it change
+    transforms.append(server_time("updated_at"))
+    # Must not create the company as a side effect if it was deleted meanwhile
+    return [{
+        "transform": {"document": document_name(company_path), "fieldTransforms": transforms},
+        "currentDocument": {"exists": True}
+    }]
+
+def _cached_company(user_id: str, company_id: str) -> Optional[Company]:
+    snapshot = _snapshots.get(user_id)
+    if snapshot is not None and company_id in snapshot.companies:
+        return snapshot.companies[company_id]
+    companies = _companies_cache.get(f"companies_{user_id}") or []
+    return next((company for company in companies if company.id == company_id), None)
+
+def _apply_counter_delta(user_id: str, company_id: str, total_delta: int, open_delta: int, result: Optional[dict] = None):
+    """Mirror a committed counter increment onto the cached company"""
+    if not total_delta and not open_delta:
+        return
+    company = _cached_company(user_id, company_id)
+    if company is None or company.taskCount is None:
+        return
+    _apply_company_write(user_id, company_id, company.model_copy(update={
+        "taskCount": company.taskCount + total_delta,
+        "openTaskCount": (company.openTaskCount or 0) + open_delta,
+        **_commit_time(result)
+    }))
+
+def server_time(field: str) -> dict:
+    return {"fieldPath": field, "setToServerValue": "REQUEST_TIME"}
+
+def _stamped(fields: dict, result: Optional[dict], *names: str) -> dict:
+    """`fields` plus the server timestamps a commit set (REQUEST_TIME is the commit time)"""
+    commit_time = (result or {}).get("commitTime")
+    if not commit_time:
+        return fields
+    return {**fields, **{name: {"timestampValue": commit_time} for name in names}}
+
+def _commit_time(result: Optional[dict]) -> dict:
+    """{"updated_at": commit time} for model_copy, parsed as a read-back would be"""
+    commit_time = (result or {}).get("commitTime")
+    return {"updated_at": _TIMESTAMP.validate_python(commit_time)} if commit_time else {}
+
+def _deletion_record(user_id: str, kind: str, doc_id: str, path: str) -> dict:
+    """Write recording the delete of the document at `path`, committed together with the delete"""
+    return {
+        "update": {
+            "name": document_name(f"users/{user_id}/{SYNC_DELETIONS}/{kind}-{doc_id}"),
+            "fields": {
+                "kind": {"stringValue": kind},
+                "id": {"stringValue": doc_id},
+                # Full name, so the change feed can report it as a documentDelete
+                "document": {"stringValue": document_name(path)}
+            }
+        },
+        "updateTransforms": [server_time("deleted_at")]
+    }
+
 async def create_user(email: str, password: str) -> dict:
     try:
         api_key = os.getenv("FIREBASE_API_KEY")
@@ -467,8 +1722,8 @@ async def create_user(email: str, password: str) -> dict:
             
         url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={api_key}"
         
-        client = await get_http_client()
-        response = await client.post(
+        response = await _request(
+            "POST",
             url,
             json={
                 "email": email,
@@ -502,7 +1757,7 @@ async def create_user(email: str, password: str) -> dict:
 
 async def store_user_in_firestore(user_id: str, email: str) -> bool:
     project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}"
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}"
     
     token = await get_access_token()
     
@@ -513,8 +1768,8 @@ async def store_user_in_firestore(user_id: str, email: str) -> bool:
         }
     }
     
-    client = await get_http_client()
-    response = await client.patch(
+    response = await _request(
+        "PATCH",
         url,
         headers={
             "Authorization": f"Bearer {token}",
@@ -528,8 +1783,8 @@ async def login_user(email: str, password: str) -> dict:
     api_key = os.getenv("FIREBASE_API_KEY")
     url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={api_key}"
     
-    client = await get_http_client()
-    response = await client.post(
+    response = await _request(
+        "POST",
         url,
         json={
             "email": email,
@@ -549,12 +1804,12 @@ async def login_user(email: str, password: str) -> dict:
 
 async def get_users_for_reminder() -> list:
     project_id = os.getenv("FIREBASE_PROJECT_ID")
-    url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users"
+    url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users"
     
     token = await get_access_token()
-    client = await get_http_client()
     
-    response = await client.get(
+    response = await _request(
+        "GET",
         url,
         headers={"Authorization": f"Bearer {token}"}
     )
@@ -652,12 +1907,11 @@ User Reference: {user_id}
 async def get_user_name(user_id: str) -> str:
     try:
         project_id = os.getenv("FIREBASE_PROJECT_ID")
-        url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}"
+        url = f"{FIRESTORE_BASE_URL}v1/projects/{project_id}/databases/(default)/documents/users/{user_id}"
         
         token = await get_access_token()
-        client = await get_http_client()
         
-        response = await client.get(url, headers={"Authorization": f"Bearer {token}"})
+        response = await _request("GET", url, headers={"Authorization": f"Bearer {token}"})
         
         if response.status_code == 200:
             doc = response.json()
@@ -674,47 +1928,19 @@ async def get_user_name(user_id: str) -> str:
 
 async def get_user_tasks_with_companies(user_id: str) -> list:
     try:
-        project_id = os.getenv("FIREBASE_PROJECT_ID")
-        companies_url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies"
-        
-        token = await get_access_token()
-        client = await get_http_client()
-        
-        companies_response = await client.get(companies_url, headers={"Authorization": f"Bearer {token}"})
-        
-        if companies_response.status_code != 200:
-            return []
-        
-        companies_data = companies_response.json()
+        snapshot = await get_user_snapshot(user_id)
         tasks_with_companies = []
         
-        if "documents" in companies_data:
-            for company_doc in companies_data["documents"]:
-                company_id = company_doc["name"].split("/")[-1]
-                company_fields = company_doc.get("fields", {})
-                company_name = company_fields.get("name", {}).get("stringValue", "Unknown Company")
-                
-                # Get tasks for this company
-                tasks_url = f"https://firestore.googleapis.com/v1/projects/{project_id}/databases/(default)/documents/users/{user_id}/companies/{company_id}/Task"
-                
-                tasks_response = await client.get(tasks_url, headers={"Authorization": f"Bearer {token}"})
-                
-                if tasks_response.status_code == 200:
-                    tasks_data = tasks_response.json()
-                    if "documents" in tasks_data:
-                        for task_doc in tasks_data["documents"]:
-                            task_fields = task_doc.get("fields", {})
-                            task_title = task_fields.get("title", {}).get("stringValue", "Untitled Task")
-                            completed = task_fields.get("completed", {}).get("booleanValue", False)
-                            
-                            # Only include incomplete tasks
-                            if not completed:
-                                tasks_with_companies.append({
-                                    "company_name": company_name,
-                                    "task_title": task_title,
-                                    "due_date": "Not specified"
-                                })
-        
-        return tasks_with_companies[:5]  # Limit to 5 tasks
+        # Only include incomplete tasks
+        for task, company in snapshot.open_tasks_with_companies():
+            tasks_with_companies.append({
+                "company_name": company.name if company else "Unknown Company",
+                "task_title": task.title or "Untitled Task",
+                "due_date": "Not specified"
+            })
+            if len(tasks_with_companies) == 5:  # Limit to 5 tasks
+                break
+        
+        return tasks_with_companies
     except:
-        return []
\ No newline at end of file
+        return []
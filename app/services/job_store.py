@@ -0,0 +1,114 @@
+"""Job records in a local SQLite file shared by all worker processes (WAL mode)"""
+import json
+import sqlite3
+import threading
+from typing import List, Optional
+
+
+class JobStore:
+    """Latest saved state of every background job on the host.
+
+    The worker running a job saves it on start, periodically while it runs
+    (saved_at doubles as a heartbeat) and when it finishes. Any worker can
+    then answer a poll, and a job whose heartbeat stopped can be claimed by
+    another worker and run again.
+    """
+
+    COLUMNS = ("id", "kind", "user_id", "params", "status", "progress", "error", "created_at", "finished_at")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " user_id TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " progress TEXT NOT NULL,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " finished_at REAL,"
+                " saved_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def save(self, record: dict, saved_at: float):
+        values = [record[column] for column in self.COLUMNS]
+        values[3] = json.dumps(values[3])
+        values[5] = json.dumps(values[5])
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, user_id, params, status, progress, error,"
+                " created_at, finished_at, saved_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*values, saved_at),
+            )
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def claim_stale(self, kinds: List[str], before: float, now: float) -> List[dict]:
+        """Take over unfinished jobs not saved since `before`.
+
+        Jobs of the given kinds are returned for the caller to run again;
+        any other kind cannot be restarted and is marked failed. The claim
+        bumps saved_at in the same write transaction, so two workers never
+        pick up the same job.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    f"SELECT {', '.join(self.COLUMNS)} FROM jobs"
+                    " WHERE status IN ('queued', 'running') AND saved_at < ?",
+                    (before,),
+                ).fetchall()
+                claimed = []
+                for row in rows:
+                    record = self._record(row)
+                    if record["kind"] in kinds:
+                        conn.execute("UPDATE jobs SET saved_at = ? WHERE id = ?", (now, record["id"]))
+                        claimed.append(record)
+                    else:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, saved_at = ? WHERE id = ?",
+                            ("Worker stopped before the job finished", now, now, record["id"]),
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def prune(self, finished_before: float) -> int:
+        with self._lock:
+            cursor = self._connect().execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (finished_before,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _record(self, row) -> dict:
+        record = dict(zip(self.COLUMNS, row))
+        record["params"] = json.loads(record["params"])
+        record["progress"] = json.loads(record["progress"])
+        return record
@@ -0,0 +1,210 @@
+"""Background jobs whose progress clients can poll.
+
+Jobs run on the event loop of the worker that queued them. With
+JOBS_DB_PATH (default: SHARED_CACHE_PATH) set, their records are also kept
+in a SQLite file so a poll can land on any worker of the host, and jobs a
+dead or restarted worker left unfinished are picked up again by the next
+worker's monitor. Without it jobs live only in the queuing process: polls
+must reach that worker, and a restart loses unfinished jobs.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.deadline import clear_request_deadline
+from app.services.job_store import JobStore
+
+# Finished jobs stay queryable this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH") or os.getenv("SHARED_CACHE_PATH")
+# A running job re-saves its record this often; one not saved for
+# JOB_STALE_SECONDS is taken to have lost its worker
+JOB_SAVE_INTERVAL = float(os.getenv("JOB_SAVE_INTERVAL_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "30"))
+
+_jobs: Dict[str, "Job"] = {}
+# Kinds that can be restarted from their params alone, see register()
+_runners: Dict[str, Callable[["Job"], Awaitable]] = {}
+_store = JobStore(JOBS_DB_PATH) if JOBS_DB_PATH else None
+_monitor = None
+
+
+class Job:
+    def __init__(self, kind: str, user_id: str, params: dict):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.user_id = user_id
+        self.params = params
+        self.status = "queued"
+        self.progress = {}
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "progress": self.progress,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+    def to_record(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        job = cls(record["kind"], record["user_id"], record["params"])
+        job.id = record["id"]
+        job.status = record["status"]
+        job.progress = record["progress"]
+        job.error = record["error"]
+        job.created_at = record["created_at"]
+        job.finished_at = record["finished_at"]
+        return job
+
+
+def register(kind: str, run: Callable[[Job], Awaitable]):
+    """Let jobs of this kind be restarted after their worker died.
+
+    run must only use job.user_id and job.params, and be safe to run
+    again over work a previous attempt partly did.
+    """
+    _runners[kind] = run
+
+
+def start_job(kind: str, user_id: str, run: Callable[[Job], Awaitable], **params) -> Job:
+    """Schedule run(job) on the event loop and return the job at once"""
+    _prune()
+    job = Job(kind, user_id, params)
+    _jobs[job.id] = job
+    job.task = asyncio.ensure_future(_run(job, run))
+    return job
+
+
+async def _run(job: Job, run: Callable[[Job], Awaitable]):
+    # Outlives the request that queued it, so not bound by its deadline
+    clear_request_deadline()
+    job.status = "running"
+    await _save(job)
+    heartbeat = asyncio.ensure_future(_save_periodically(job)) if _store is not None else None
+    try:
+        await run(job)
+        job.status = "completed"
+    except asyncio.CancelledError:
+        # Left "running" in the store, so another worker resumes it
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        print(f"⚠️ Job {job.kind} {job.id} failed: {e}")
+    finally:
+        job.finished_at = time.time()
+        if heartbeat is not None:
+            heartbeat.cancel()
+    await _save(job)
+
+
+async def _save(job: Job):
+    if _store is None:
+        return
+    try:
+        await asyncio.to_thread(_store.save, job.to_record(), time.time())
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not save job {job.id}: {e}")
+
+
+async def _save_periodically(job: Job):
+    while True:
+        await asyncio.sleep(JOB_SAVE_INTERVAL)
+        await _save(job)
+
+
+def get_job(job_id: str, user_id: str) -> Optional[Job]:
+    job = _jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
+
+
+async def find_job(job_id: str, user_id: str) -> Optional[Job]:
+    """Like get_job, but also finds jobs queued by other workers"""
+    job = get_job(job_id, user_id)
+    if job is not None or _store is None:
+        return job
+    try:
+        record = await asyncio.to_thread(_store.load, job_id)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not load job {job_id}: {e}")
+        return None
+    if record is None or record["user_id"] != user_id:
+        return None
+    return Job.from_record(record)
+
+
+async def resume_stale_jobs() -> List[Job]:
+    """Restart registered jobs whose worker stopped saving them"""
+    if _store is None:
+        return []
+    now = time.time()
+    records = await asyncio.to_thread(_store.claim_stale, list(_runners), now - JOB_STALE_SECONDS, now)
+    resumed = []
+    for record in records:
+        job = Job.from_record(record)
+        job.status = "queued"
+        _jobs[job.id] = job
+        job.task = asyncio.ensure_future(_run(job, _runners[job.kind]))
+        print(f"♻️ Resuming job {job.kind} {job.id}")
+        resumed.append(job)
+    return resumed
+
+
+async def monitor_periodically(interval: float):
+    while True:
+        try:
+            await resume_stale_jobs()
+            await asyncio.to_thread(_store.prune, time.time() - JOB_RETENTION_SECONDS)
+        except Exception as e:
+            print(f"⚠️ Job monitor failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_job_monitor():
+    global _monitor
+    if _monitor is None and _store is not None:
+        _monitor = asyncio.ensure_future(monitor_periodically(JOB_STALE_SECONDS))
+
+
+def _prune():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+        _jobs.pop(job_id, None)
+
+
+def stop_jobs():
+    global _monitor
+    if _monitor is not None:
+        _monitor.cancel()
+        _monitor = None
+    for job in _jobs.values():
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
@@ -0,0 +1,78 @@
+"""Adaptive (AIMD) concurrency limit for outbound requests"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class AdaptiveLimiter:
+    """Caps in-flight requests at a limit that finds its own ceiling.
+
+    Each request that completes without a congestion signal raises the
+    limit additively (about +1 per round of `limit` requests). A 429/503,
+    a timeout or a latency above `latency_target` cuts it multiplicatively,
+    at most once per observed latency window, so one burst of slow replies
+    does not collapse the limit to the floor.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_target: float, backoff: float = 0.7):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.inflight = 0
+        self._waiters = deque()
+        self._last_decrease = 0.0
+        self.completed = 0
+        self.congested = 0
+
+    async def acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed to us just as we gave up; pass it on
+                self.inflight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: Optional[float], congested: bool = False):
+        """Free a slot; a latency of None (nothing was sent) leaves the limit alone"""
+        self.inflight -= 1
+        if latency is None:
+            self._wake()
+            return
+        self.completed += 1
+        now = time.monotonic()
+        if congested or latency > self.latency_target:
+            self.congested += 1
+            if now - self._last_decrease >= latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "completed": self.completed,
+            "congested": self.congested,
+        }
@@ -0,0 +1,271 @@
+"""Storage backend behind the handlers: Firestore (default) or a local SQLite file"""
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, List, Optional, Union
+
+from app.models import Company, Task, TaskTemplate
+from app.services import firebase
+
+# "firestore" or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/app.db")
+
+_repository = None
+
+
+class Repository(ABC):
+    """The data operations the handlers, bulk import/export and jobs rely on.
+
+    Writes return False when the store rejects them and raise for
+    conflicts and upstream errors, with the same messages firebase.py
+    uses, so the handlers map both backends to the same status codes.
+    Updates return the record as written instead of True; its updated_at
+    is the stored one, which the response's ETag is derived from.
+    Pages are (items, next cursor or None); an unusable cursor raises
+    ValueError("Invalid cursor").
+
+    Updates and deletes take an optional `precondition`, called with the
+    stored record; unless it returns True (or when the record is gone) the
+    write is not made and firebase.PreconditionFailed is raised. The check
+    and the write are atomic. A precondition with an `update_time` (see
+    etags.IfMatch) holds exactly when the record's updated_at is that time,
+    which lets a backend check it without reading the record first.
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    async def get_companies(self, user_id: str) -> List[Company]:
+        ...
+
+    @abstractmethod
+    async def get_companies_page(self, user_id: str, limit: int, cursor: Optional[str] = None) -> tuple:
+        ...
+
+    @abstractmethod
+    async def get_company_by_id(self, user_id: str, company_id: str) -> Optional[Company]:
+        ...
+
+    @abstractmethod
+    async def company_exists(self, user_id: str, company_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def create_company(self, user_id: str, company: Company) -> bool:
+        ...
+
+    @abstractmethod
+    async def update_company(self, user_id: str, company_id: str, company: Company,
+                             precondition: Optional[Callable] = None) -> Union[Company, bool]:
+        ...
+
+    @abstractmethod
+    async def delete_company(self, user_id: str, company_id: str,
+                             precondition: Optional[Callable] = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete_company_tasks(self, user_id: str, company_id: str, progress: dict):
+        ...
+
+    @abstractmethod
+    async def get_tasks(self, user_id: str) -> List[Task]:
+        ...
+
+    @abstractmethod
+    async def query_tasks(self, user_id: str, completed: Optional[bool] = None, company_id: Optional[str] = None,
+                          title_prefix: Optional[str] = None) -> List[Task]:
+        ...
+
+    @abstractmethod
+    async def get_tasks_page(self, user_id: str, limit: int, cursor: Optional[str] = None,
+                             completed: Optional[bool] = None, company_id: Optional[str] = None,
+                             title_prefix: Optional[str] = None) -> tuple:
+        ...
+
+    @abstractmethod
+    async def get_task_by_id(self, user_id: str, task_id: str) -> Optional[Task]:
+        ...
+
+    @abstractmethod
+    async def create_task(self, user_id: str, task: Task) -> bool:
+        ...
+
+    @abstractmethod
+    async def update_task(self, user_id: str, task_id: str, task: Task,
+                          precondition: Optional[Callable] = None) -> Union[Task, bool]:
+        ...
+
+    @abstractmethod
+    async def delete_task(self, user_id: str, task_id: str, company_id: str,
+                          precondition: Optional[Callable] = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def count_companies(self, user_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def count_tasks(self, user_id: str, completed: Optional[bool] = None, company_id: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    async def get_task_summary(self, user_id: str) -> dict:
+        ...
+
+    @abstractmethod
+    async def search(self, user_id: str, query: str, limit: int = 20) -> dict:
+        ...
+
+    @abstractmethod
+    async def get_templates(self, user_id: str) -> List[TaskTemplate]:
+        ...
+
+    @abstractmethod
+    async def get_changes(self, user_id: str, since: Optional[str] = None) -> dict:
+        """{"companies", "tasks", "deleted": {"companies", "tasks"}, "token"} changed after the `since` token.
+
+        Without a token everything is returned. Tokens are opaque and only
+        mean something to the backend that issued them; an unusable one
+        raises ValueError("Invalid sync token"), and one that predates
+        purged tombstones raises firebase.SyncTokenExpired.
+        """
+
+    @abstractmethod
+    async def purge_tombstones(self, cutoff: datetime, progress: dict):
+        """Delete all users' delete tombstones written before `cutoff`, in batches"""
+
+    @abstractmethod
+    async def import_batch(self, user_id: str, kind: str, items: list) -> list:
+        """Upsert [(doc id, Company or Task)]; one result per item, True or an error message"""
+
+    @abstractmethod
+    async def repair_task_counters(self, user_id: str, progress: dict):
+        ...
+
+    def close(self):
+        pass
+
+
+class FirestoreRepository(Repository):
+    """Firestore over REST, with the caches in firebase.py in front of it"""
+
+    name = "firestore"
+
+    # Looked up on the module at call time, so patching firebase.* still takes effect
+    async def get_companies(self, user_id):
+        return await firebase.get_companies(user_id)
+
+    async def get_companies_page(self, user_id, limit, cursor=None):
+        return await firebase.get_companies_page(user_id, limit, cursor)
+
+    async def get_company_by_id(self, user_id, company_id):
+        return await firebase.get_company_by_id(user_id, company_id)
+
+    async def company_exists(self, user_id, company_id):
+        return await firebase.company_exists(user_id, company_id)
+
+    async def create_company(self, user_id, company):
+        return await firebase.create_company(user_id, company)
+
+    async def update_company(self, user_id, company_id, company, precondition=None):
+        return await firebase.update_company(user_id, company_id, company, precondition)
+
+    async def delete_company(self, user_id, company_id, precondition=None):
+        return await firebase.delete_company(user_id, company_id, precondition)
+
+    async def delete_company_tasks(self, user_id, company_id, progress):
+        return await firebase.delete_company_tasks(user_id, company_id, progress)
+
+    async def get_tasks(self, user_id):
+        return await firebase.get_tasks(user_id)
+
+    async def query_tasks(self, user_id, completed=None, company_id=None, title_prefix=None):
+        return await firebase.query_tasks(user_id, completed=completed, company_id=company_id, title_prefix=title_prefix)
+
+    async def get_tasks_page(self, user_id, limit, cursor=None, completed=None, company_id=None, title_prefix=None):
+        return await firebase.get_tasks_page(
+            user_id, limit, cursor, completed=completed, company_id=company_id, title_prefix=title_prefix
+        )
+
+    async def get_task_by_id(self, user_id, task_id):
+        return await firebase.get_task_by_id(user_id, task_id)
+
+    async def create_task(self, user_id, task):
+        return await firebase.create_task(user_id, task)
+
+    async def update_task(self, user_id, task_id, task, precondition=None):
+        return await firebase.update_task(user_id, task_id, task, precondition)
+
+    async def delete_task(self, user_id, task_id, company_id, precondition=None):
+        return await firebase.delete_task(user_id, task_id, company_id, precondition)
+
+    async def count_companies(self, user_id):
+        return await firebase.count_companies(user_id)
+
+    async def count_tasks(self, user_id, completed=None, company_id=None):
+        return await firebase.count_tasks(user_id, completed=completed, company_id=company_id)
+
+    async def get_task_summary(self, user_id):
+        return await firebase.get_task_summary(user_id)
+
+    async def search(self, user_id, query, limit=20):
+        return await firebase.search(user_id, query, limit)
+
+    async def get_templates(self, user_id):
+        return await firebase.get_templates(user_id)
+
+    async def get_changes(self, user_id, since=None):
+        return await firebase.get_changes(user_id, since)
+
+    async def purge_tombstones(self, cutoff, progress):
+        return await firebase.purge_tombstones(cutoff, progress)
+
+    async def import_batch(self, user_id, kind, items):
+        writes = []
+        for doc_id, item in items:
+            if kind == "companies":
+                fields = firebase.company_to_firestore(item)
+                path = f"users/{user_id}/companies/{doc_id}"
+            else:
+                fields = firebase.task_to_firestore(item)
+                path = f"users/{user_id}/companies/{item.companyId}/Task/{doc_id}"
+            write = {
+                "update": {"name": firebase.document_name(path), "fields": fields},
+                # Stamped like any other write so /sync picks imports up
+                "updateTransforms": [firebase.server_time("updated_at")]
+            }
+            if kind == "companies":
+                # Upserts leave the task counters of existing companies alone
+                write["updateMask"] = {"fieldPaths": list(fields)}
+            writes.append(write)
+        try:
+            return await firebase.batch_write(writes)
+        finally:
+            # Rows were written behind the caches' back; reload on next read
+            firebase.invalidate_user_caches(user_id)
+
+    async def repair_task_counters(self, user_id, progress):
+        return await firebase.repair_task_counters(user_id, progress)
+
+
+def get_repository() -> Repository:
+    global _repository
+    if _repository is None:
+        if STORAGE_BACKEND == "sqlite":
+            from app.services.sqlite_repository import SQLiteRepository
+            _repository = SQLiteRepository(SQLITE_PATH)
+        elif STORAGE_BACKEND == "firestore":
+            _repository = FirestoreRepository()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _repository
+
+
+def set_repository(repository: Optional[Repository]):
+    """Swap the backend (tests and benchmarks); None goes back to the configured one"""
+    global _repository
+    if _repository is not None and _repository is not repository:
+        _repository.close()
+    _repository = repository
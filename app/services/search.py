@@ -0,0 +1,156 @@
+"""In-memory prefix search over one user's companies and tasks"""
+import heapq
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models import Company, Task
+
+COMPANY_FIELDS = ("name", "city", "contactPersonName", "EIN")
+TASK_FIELDS = ("title", "description")
+
+_WORD = re.compile(r"\w+")
+
+# Nodes this close to the root also keep the documents of their whole
+# subtree, so the shortest (and broadest) typeahead prefixes skip the walk.
+SUBTREE_CACHE_DEPTH = 2
+
+DocKey = Tuple[str, str]  # ("company" | "task", id)
+
+# Rough CPython costs behind SearchIndex.approximate_size: a trie node with
+# its (mostly small) children dict and docs set, and one document-term pair
+# across the term set, the docs set and the subtree counts.
+NODE_BYTES = 360
+POSTING_BYTES = 128
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.lower()) if text else []
+
+
+def company_terms(company: Company) -> Set[str]:
+    terms = set()
+    for field in COMPANY_FIELDS:
+        terms.update(tokenize(getattr(company, field)))
+    # "12-3456789" should also be found by typing the digits without the dash
+    terms.add("".join(tokenize(company.EIN)))
+    terms.discard("")
+    return terms
+
+
+def task_terms(task: Task) -> Set[str]:
+    terms = set()
+    for field in TASK_FIELDS:
+        terms.update(tokenize(getattr(task, field)))
+    return terms
+
+
+class _Node:
+    __slots__ = ("children", "docs", "subtree")
+
+    def __init__(self, depth: int):
+        self.children: Dict[str, "_Node"] = {}
+        self.docs: Set[DocKey] = set()
+        self.subtree: Optional[Dict[DocKey, int]] = {} if 1 <= depth <= SUBTREE_CACHE_DEPTH else None
+
+
+class SearchIndex:
+    """Inverted index stored in a character trie.
+
+    Every term of a document points back to it from the trie node where the
+    term ends; a prefix query walks to the prefix node and gathers the
+    documents of its subtree. Queries match documents containing every
+    query word as a prefix of some term.
+    """
+
+    def __init__(self):
+        self._root = _Node(0)
+        self._terms: Dict[DocKey, Set[str]] = {}
+        self._nodes = 1
+        self._postings = 0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def approximate_size(self) -> int:
+        """Rough bytes held by the trie and postings, kept as counts so it is O(1)"""
+        return self._nodes * NODE_BYTES + self._postings * POSTING_BYTES
+
+    def put(self, key: DocKey, terms: Iterable[str]):
+        terms = set(terms)
+        old = self._terms.get(key, set())
+        for term in old - terms:
+            self._unlink(term, key)
+        for term in terms - old:
+            node = self._root
+            for depth, char in enumerate(term, start=1):
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node(depth)
+                    self._nodes += 1
+                node = child
+                if node.subtree is not None:
+                    # Counts, since several terms of a document can share a prefix
+                    node.subtree[key] = node.subtree.get(key, 0) + 1
+            node.docs.add(key)
+            self._postings += 1
+        if terms:
+            self._terms[key] = terms
+        else:
+            self._terms.pop(key, None)
+
+    def remove(self, key: DocKey):
+        for term in self._terms.pop(key, set()):
+            self._unlink(term, key)
+
+    def _unlink(self, term: str, key: DocKey):
+        path = [self._root]
+        for char in term:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].docs.discard(key)
+        self._postings -= 1
+        for node in path[1:SUBTREE_CACHE_DEPTH + 1]:
+            remaining = node.subtree.get(key, 0) - 1
+            if remaining > 0:
+                node.subtree[key] = remaining
+            else:
+                node.subtree.pop(key, None)
+        # Prune branches nothing points through any more
+        for depth in range(len(term), 0, -1):
+            node = path[depth]
+            if node.docs or node.children:
+                break
+            del path[depth - 1].children[term[depth - 1]]
+            self._nodes -= 1
+
+    def _prefix_docs(self, prefix: str) -> Tuple[Set[DocKey], Set[DocKey]]:
+        """Documents with a term equal to the prefix, and with any term starting with it"""
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set(), set()
+        if node.subtree is not None:
+            return node.docs, node.subtree.keys()
+        docs = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            docs |= current.docs
+            stack.extend(current.children.values())
+        return node.docs, docs
+
+    def search(self, query: str, limit: int = 20) -> List[DocKey]:
+        words = tokenize(query)
+        if not words:
+            return []
+        matches = [self._prefix_docs(word) for word in words]
+        smallest, *others = sorted((docs for _, docs in matches), key=len)
+        candidates = set(smallest).intersection(*others) if others else smallest
+        # Whole-word hits rank above prefix-only hits
+        return heapq.nsmallest(
+            limit, candidates,
+            key=lambda key: (-sum(1 for exact, _ in matches if key in exact), key)
+        )
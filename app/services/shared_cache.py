@@ -0,0 +1,121 @@
+"""Host-wide second-level cache shared by all worker processes (SQLite, WAL mode)"""
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class SharedCache:
+    """Versioned key/payload store on a local SQLite file.
+
+    Every key carries a version that writes bump. A worker remembers the
+    version its in-process copy was built from; a mismatch means another
+    worker wrote since, and the local copy must be dropped. Payloads are
+    only stored when the version has not moved during the load.
+    """
+
+    def __init__(self, path: str, ttl: float, retention: float):
+        self.path = path
+        self.ttl = ttl
+        self.retention = retention
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=0.2, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " key TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " payload BLOB,"
+                " payload_expires_at REAL,"
+                " touched_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def version(self, key: str) -> int:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT version FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key: str) -> Tuple[int, Optional[bytes]]:
+        """Return (version, payload); payload is None when absent or expired"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT version, payload, payload_expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return 0, None
+        version, payload, expires_at = row
+        if payload is None or expires_at is None or expires_at <= time.time():
+            return version, None
+        return version, payload
+
+    def put(self, key: str, payload: bytes, expected_version: int) -> bool:
+        """Store a payload unless a write bumped the version since it was loaded"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            if expected_version == 0:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO cache_entries (key, version, payload, payload_expires_at, touched_at)"
+                    " VALUES (?, 0, ?, ?, ?)",
+                    (key, payload, now + self.ttl, now),
+                )
+                if cursor.rowcount:
+                    return True
+            cursor = conn.execute(
+                "UPDATE cache_entries SET payload = ?, payload_expires_at = ?, touched_at = ?"
+                " WHERE key = ? AND version = ?",
+                (payload, now + self.ttl, now, key, expected_version),
+            )
+            return cursor.rowcount > 0
+
+    def invalidate(self, key: str) -> Tuple[int, int]:
+        """Drop the payload and bump the version; returns (old, new) versions"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT version FROM cache_entries WHERE key = ?", (key,)).fetchone()
+                old = row[0] if row else 0
+                conn.execute(
+                    "INSERT INTO cache_entries (key, version, payload, payload_expires_at, touched_at)"
+                    " VALUES (?, ?, NULL, NULL, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET version = excluded.version, payload = NULL,"
+                    " payload_expires_at = NULL, touched_at = excluded.touched_at",
+                    (key, old + 1, now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return old, old + 1
+
+    def drop_payload(self, key: str):
+        """Forget the stored payload but keep the version (copies stay valid)"""
+        with self._lock:
+            self._connect().execute(
+                "UPDATE cache_entries SET payload = NULL, payload_expires_at = NULL WHERE key = ?", (key,)
+            )
+
+    def sweep(self) -> int:
+        """Forget keys nobody touched for longer than any worker can hold a copy"""
+        with self._lock:
+            cursor = self._connect().execute(
+                "DELETE FROM cache_entries WHERE touched_at < ?", (time.time() - self.retention,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,170 @@
+"""Per-user in-memory snapshot of companies and tasks"""
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.models import Company, Task
+from app.services.search import SearchIndex, company_terms, task_terms
+
+
+class UserSnapshot:
+    """Companies and tasks of one user, indexed by id, with a task -> company map"""
+
+    def __init__(self, companies: List[Company], tasks: List[Task]):
+        self.companies: Dict[str, Company] = {company.id: company for company in companies}
+        self.tasks: Dict[str, Task] = {task.id: task for task in tasks}
+        self.task_company: Dict[str, str] = {task.id: task.companyId for task in tasks}
+        self.loaded_at = time.monotonic()
+        self.last_access = self.loaded_at
+        self._search_index = None
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """Built on first search, then kept current by apply_company/apply_task"""
+        if self._search_index is None:
+            index = SearchIndex()
+            for company_id, company in self.companies.items():
+                index.put(("company", company_id), company_terms(company))
+            for task_id, task in self.tasks.items():
+                index.put(("task", task_id), task_terms(task))
+            self._search_index = index
+        return self._search_index
+
+    def approximate_size(self) -> int:
+        """Bytes held by the indexes and the search trie.
+
+        The models themselves are the ones in the list caches and are
+        counted there.
+        """
+        size = sys.getsizeof(self.companies) + sys.getsizeof(self.tasks) + sys.getsizeof(self.task_company)
+        if self._search_index is not None:
+            size += self._search_index.approximate_size()
+        return size
+
+    def apply_company(self, company_id: str, company: Optional[Company]):
+        if company is not None:
+            self.companies[company_id] = company
+            if self._search_index is not None:
+                self._search_index.put(("company", company_id), company_terms(company))
+            return
+        self.companies.pop(company_id, None)
+        if self._search_index is not None:
+            self._search_index.remove(("company", company_id))
+        for task_id in [tid for tid, cid in self.task_company.items() if cid == company_id]:
+            self._drop_task(task_id)
+
+    def apply_task(self, task_id: str, task: Optional[Task]):
+        if task is not None:
+            self.tasks[task_id] = task
+            self.task_company[task_id] = task.companyId
+            if self._search_index is not None:
+                self._search_index.put(("task", task_id), task_terms(task))
+        else:
+            self._drop_task(task_id)
+
+    def _drop_task(self, task_id: str):
+        self.tasks.pop(task_id, None)
+        self.task_company.pop(task_id, None)
+        if self._search_index is not None:
+            self._search_index.remove(("task", task_id))
+
+    def search(self, query: str, limit: int) -> dict:
+        companies, tasks = [], []
+        for kind, doc_id in self.search_index.search(query, limit):
+            if kind == "company" and doc_id in self.companies:
+                companies.append(self.companies[doc_id])
+            elif kind == "task" and doc_id in self.tasks:
+                tasks.append(self.tasks[doc_id])
+        return {"companies": companies, "tasks": tasks}
+
+    def open_tasks_with_companies(self) -> list:
+        result = []
+        for task in self.tasks.values():
+            if not task.completed:
+                company = self.companies.get(task.companyId)
+                result.append((task, company))
+        return result
+
+
+class SnapshotStore:
+    """Holds one snapshot per active user; idle ones are evicted.
+
+    Bounded by user count and by the approximate bytes of the snapshots,
+    search tries included, evicting the least recently used first. A
+    snapshot grows after it is stored (its search index is built on first
+    search, writes are applied to it), so callers re-measure it with
+    resize() after such changes.
+    """
+
+    def __init__(self, max_age: float, idle_ttl: float, max_users: int, max_bytes: int):
+        self.max_age = max_age
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self._snapshots = OrderedDict()
+        self._sizes = {}
+        self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def get(self, user_id: str) -> Optional[UserSnapshot]:
+        """Return a snapshot young enough to serve reads, or None"""
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is None:
+            return None
+        now = time.monotonic()
+        if now - snapshot.loaded_at >= self.max_age:
+            self.drop(user_id)
+            return None
+        snapshot.last_access = now
+        self._snapshots.move_to_end(user_id)
+        return snapshot
+
+    def put(self, user_id: str, snapshot: UserSnapshot):
+        self.drop(user_id)
+        self._snapshots[user_id] = snapshot
+        self.resize(user_id)
+
+    def resize(self, user_id: str):
+        """Re-measure a stored snapshot and evict down to the limits"""
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is None:
+            return
+        size = snapshot.approximate_size()
+        self.current_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        while self._snapshots and (len(self._snapshots) > self.max_users or self.current_bytes > self.max_bytes):
+            self.drop(next(iter(self._snapshots)))
+
+    def apply_company(self, user_id: str, company_id: str, company: Optional[Company]):
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            snapshot.apply_company(company_id, company)
+            self.resize(user_id)
+
+    def apply_task(self, user_id: str, task_id: str, task: Optional[Task]):
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            snapshot.apply_task(task_id, task)
+            self.resize(user_id)
+
+    def drop(self, user_id: str):
+        if self._snapshots.pop(user_id, None) is not None:
+            self.current_bytes -= self._sizes.pop(user_id, 0)
+
+    def clear(self):
+        self._snapshots.clear()
+        self._sizes.clear()
+        self.current_bytes = 0
+
+    def evict_idle(self) -> int:
+        now = time.monotonic()
+        idle = [
+            user_id for user_id, snapshot in self._snapshots.items()
+            if now - snapshot.last_access >= self.idle_ttl or now - snapshot.loaded_at >= self.max_age
+        ]
+        for user_id in idle:
+            self.drop(user_id)
+        return len(idle)
@@ -0,0 +1,575 @@
+"""Embedded SQLite storage backend (WAL mode) for self-hosted deployments"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from app.models import Company, Task, TaskTemplate
+from app.services.firebase import (
+    BATCH_WRITE_LIMIT, PreconditionFailed, SyncTokenExpired, decode_cursor, decode_sync_token, encode_cursor, encode_sync_token
+)
+from app.services.repository import Repository
+from app.services.search import company_terms, task_terms, tokenize
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS companies ("
+    " user_id TEXT NOT NULL,"
+    " id TEXT NOT NULL,"
+    " data TEXT NOT NULL,"
+    " seq INTEGER NOT NULL DEFAULT 0,"
+    " PRIMARY KEY (user_id, id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS tasks ("
+    " user_id TEXT NOT NULL,"
+    " id TEXT NOT NULL,"
+    " company_id TEXT NOT NULL,"
+    " title TEXT NOT NULL,"
+    " description TEXT,"
+    " completed INTEGER NOT NULL,"
+    " created_at TEXT,"
+    " updated_at TEXT,"
+    " seq INTEGER NOT NULL DEFAULT 0,"
+    " PRIMARY KEY (user_id, id))",
+    # One index per access path: by company (lists, counts, cascades),
+    # by status (filters and open/completed counts) and by title prefix
+    "CREATE INDEX IF NOT EXISTS tasks_by_company ON tasks (user_id, company_id, id)",
+    "CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (user_id, completed, company_id, id)",
+    "CREATE INDEX IF NOT EXISTS tasks_by_title ON tasks (user_id, title, company_id, id)",
+    "CREATE TABLE IF NOT EXISTS search_terms ("
+    " user_id TEXT NOT NULL,"
+    " term TEXT NOT NULL,"
+    " kind TEXT NOT NULL,"
+    " doc_id TEXT NOT NULL,"
+    " PRIMARY KEY (user_id, term, kind, doc_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS search_terms_by_doc ON search_terms (user_id, kind, doc_id)",
+    "CREATE TABLE IF NOT EXISTS task_templates ("
+    " id TEXT PRIMARY KEY,"
+    " data TEXT NOT NULL)",
+    # /sync: every write takes the user's next sequence number; deletes
+    # leave a tombstone so incremental syncs can report them. purged_seq is
+    # the newest tombstone purged, so older tokens are known to be stale.
+    "CREATE TABLE IF NOT EXISTS sync_state ("
+    " user_id TEXT PRIMARY KEY,"
+    " seq INTEGER NOT NULL,"
+    " purged_seq INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS deletions ("
+    " user_id TEXT NOT NULL,"
+    " kind TEXT NOT NULL,"
+    " id TEXT NOT NULL,"
+    " seq INTEGER NOT NULL,"
+    " deleted_at TEXT,"
+    " PRIMARY KEY (user_id, kind, id)) WITHOUT ROWID",
+)
+
+# Columns added after their table first shipped; older files get them on open
+ADDED_COLUMNS = (
+    ("companies", "seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("sync_state", "purged_seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("deletions", "deleted_at", "TEXT"),
+)
+
+# Run once ADDED_COLUMNS are known to exist
+SYNC_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS companies_by_seq ON companies (user_id, seq)",
+    "CREATE INDEX IF NOT EXISTS tasks_by_seq ON tasks (user_id, seq)",
+    "CREATE INDEX IF NOT EXISTS deletions_by_seq ON deletions (user_id, seq)",
+    "CREATE INDEX IF NOT EXISTS deletions_by_age ON deletions (deleted_at)",
+)
+
+# Company columns the model computes from tasks rather than stores
+_DERIVED = {"id", "taskCount", "openTaskCount"}
+
+_COMPANY_SELECT = (
+    "SELECT c.id, c.data,"
+    " (SELECT COUNT(*) FROM tasks t WHERE t.user_id = c.user_id AND t.company_id = c.id),"
+    " (SELECT COUNT(*) FROM tasks t WHERE t.user_id = c.user_id AND t.completed = 0 AND t.company_id = c.id)"
+    " FROM companies c"
+)
+_TASK_SELECT = "SELECT id, company_id, title, description, completed, created_at, updated_at FROM tasks"
+
+
+def _company_from_row(row) -> Company:
+    company_id, data, total, open_count = row
+    return Company.model_validate({**json.loads(data), "id": company_id, "taskCount": total, "openTaskCount": open_count})
+
+
+def _task_from_row(row) -> Task:
+    task_id, company_id, title, description, completed, created_at, updated_at = row
+    return Task(
+        id=task_id, companyId=company_id, title=title, description=description,
+        completed=bool(completed), created_at=created_at, updated_at=updated_at
+    )
+
+
+def _task_row(user_id: str, task_id: str, task: Task) -> tuple:
+    return (
+        user_id, task_id, task.companyId, task.title, task.description, int(task.completed),
+        task.created_at.isoformat() if task.created_at else None,
+        task.updated_at.isoformat() if task.updated_at else None,
+    )
+
+
+def _check_precondition(conn: sqlite3.Connection, precondition, sql: str, params: tuple, parse):
+    """Inside a write transaction: raise PreconditionFailed unless the stored row satisfies `precondition`"""
+    if precondition is None:
+        return
+    row = conn.execute(sql, params).fetchone()
+    if row is None or not precondition(parse(row)):
+        raise PreconditionFailed()
+
+
+def _cursor_values(cursor: Optional[str], order_fields: List[str]) -> Optional[List[str]]:
+    if not cursor:
+        return None
+    values = [value.get("stringValue") if isinstance(value, dict) else None for value in decode_cursor(cursor, order_fields)]
+    if not all(isinstance(value, str) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _task_filters(user_id: str, completed: Optional[bool], company_id: Optional[str], title_prefix: Optional[str]) -> tuple:
+    clauses, params = ["user_id = ?"], [user_id]
+    if completed is not None:
+        clauses.append("completed = ?")
+        params.append(int(completed))
+    if company_id:
+        clauses.append("company_id = ?")
+        params.append(company_id)
+    if title_prefix:
+        # Same range Firestore uses, so both backends agree on what matches
+        clauses += ["title >= ?", "title < ?"]
+        params += [title_prefix, title_prefix + "\uf8ff"]
+    return clauses, params
+
+
+class SQLiteRepository(Repository):
+    """All users' companies and tasks in one SQLite file.
+
+    Statements run on a worker thread, one at a time, over a single
+    connection. WAL mode lets other processes read while this one writes,
+    and synchronous=NORMAL only syncs at checkpoints. Task counters and
+    summaries are computed from the task indexes, so there is nothing to
+    keep in step and nothing to repair.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        for table, column, definition in ADDED_COLUMNS:
+            columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        for statement in SYNC_INDEXES:
+            self._conn.execute(statement)
+
+    async def _run(self, fn, *args):
+        def locked():
+            with self._lock:
+                try:
+                    return fn(self._conn, *args)
+                except sqlite3.Error as e:
+                    if self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                    raise Exception(f"Database error: {e}")
+        return await asyncio.to_thread(locked)
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Companies
+
+    async def get_companies(self, user_id):
+        def run(conn):
+            rows = conn.execute(f"{_COMPANY_SELECT} WHERE c.user_id = ? ORDER BY c.id", (user_id,))
+            return [_company_from_row(row) for row in rows]
+        return await self._run(run)
+
+    async def get_companies_page(self, user_id, limit, cursor=None):
+        order_fields = ["id"]
+        after = _cursor_values(cursor, order_fields)
+
+        def run(conn):
+            sql, params = f"{_COMPANY_SELECT} WHERE c.user_id = ?", [user_id]
+            if after:
+                sql += " AND c.id > ?"
+                params.append(after[0])
+            rows = conn.execute(f"{sql} ORDER BY c.id LIMIT ?", params + [limit + 1]).fetchall()
+            return rows
+        rows = await self._run(run)
+        next_cursor = encode_cursor(order_fields, [{"stringValue": rows[limit - 1][0]}]) if len(rows) > limit else None
+        return [_company_from_row(row) for row in rows[:limit]], next_cursor
+
+    async def get_company_by_id(self, user_id, company_id):
+        def run(conn):
+            return conn.execute(f"{_COMPANY_SELECT} WHERE c.user_id = ? AND c.id = ?", (user_id, company_id)).fetchone()
+        row = await self._run(run)
+        return _company_from_row(row) if row else None
+
+    async def company_exists(self, user_id, company_id):
+        def run(conn):
+            return conn.execute("SELECT 1 FROM companies WHERE user_id = ? AND id = ?", (user_id, company_id)).fetchone()
+        return await self._run(run) is not None
+
+    def _put_company(self, conn, user_id: str, company_id: str, company: Company):
+        data = company.model_dump_json(exclude=_DERIVED)
+        conn.execute(
+            "INSERT INTO companies (user_id, id, data, seq) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (user_id, id) DO UPDATE SET data = excluded.data, seq = excluded.seq",
+            (user_id, company_id, data, self._next_seq(conn, user_id))
+        )
+        conn.execute("DELETE FROM deletions WHERE user_id = ? AND kind = 'company' AND id = ?", (user_id, company_id))
+        self._put_terms(conn, user_id, "company", company_id, company_terms(company))
+
+    @staticmethod
+    def _next_seq(conn, user_id: str) -> int:
+        return conn.execute(
+            "INSERT INTO sync_state (user_id, seq) VALUES (?, 1)"
+            " ON CONFLICT (user_id) DO UPDATE SET seq = seq + 1 RETURNING seq",
+            (user_id,)
+        ).fetchone()[0]
+
+    def _touch_companies(self, conn, user_id: str, *company_ids: str):
+        """Task writes change the companies' derived counters, which /sync reports"""
+        conn.execute(
+            f"UPDATE companies SET seq = ? WHERE user_id = ? AND id IN ({', '.join('?' * len(company_ids))})",
+            (self._next_seq(conn, user_id), user_id, *company_ids)
+        )
+
+    def _record_deletion(self, conn, user_id: str, kind: str, doc_id: str):
+        conn.execute(
+            "INSERT INTO deletions (user_id, kind, id, seq, deleted_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (user_id, kind, id) DO UPDATE SET seq = excluded.seq, deleted_at = excluded.deleted_at",
+            (user_id, kind, doc_id, self._next_seq(conn, user_id), datetime.now(timezone.utc).isoformat())
+        )
+
+    def _put_terms(self, conn, user_id: str, kind: str, doc_id: str, terms):
+        conn.execute("DELETE FROM search_terms WHERE user_id = ? AND kind = ? AND doc_id = ?", (user_id, kind, doc_id))
+        conn.executemany(
+            "INSERT OR IGNORE INTO search_terms (user_id, term, kind, doc_id) VALUES (?, ?, ?, ?)",
+            [(user_id, term, kind, doc_id) for term in terms]
+        )
+
+    async def create_company(self, user_id, company):
+        def run(conn):
+            with self._transaction(conn):
+                self._put_company(conn, user_id, company.id, company)
+            return True
+        return await self._run(run)
+
+    async def update_company(self, user_id, company_id, company, precondition=None):
+        def run(conn):
+            with self._transaction(conn):
+                _check_precondition(conn, precondition, f"{_COMPANY_SELECT} WHERE c.user_id = ? AND c.id = ?",
+                                    (user_id, company_id), _company_from_row)
+                self._put_company(conn, user_id, company_id, company)
+                row = conn.execute(f"{_COMPANY_SELECT} WHERE c.user_id = ? AND c.id = ?", (user_id, company_id)).fetchone()
+            return _company_from_row(row)
+        return await self._run(run)
+
+    async def delete_company(self, user_id, company_id, precondition=None):
+        # Unlike Firestore the tasks can go in the same transaction
+        def run(conn):
+            with self._transaction(conn):
+                _check_precondition(conn, precondition, f"{_COMPANY_SELECT} WHERE c.user_id = ? AND c.id = ?",
+                                    (user_id, company_id), _company_from_row)
+                conn.execute(
+                    "DELETE FROM search_terms WHERE user_id = ? AND kind = 'task' AND doc_id IN"
+                    " (SELECT id FROM tasks WHERE user_id = ? AND company_id = ?)",
+                    (user_id, user_id, company_id)
+                )
+                conn.execute("DELETE FROM tasks WHERE user_id = ? AND company_id = ?", (user_id, company_id))
+                conn.execute("DELETE FROM search_terms WHERE user_id = ? AND kind = 'company' AND doc_id = ?", (user_id, company_id))
+                if conn.execute("DELETE FROM companies WHERE user_id = ? AND id = ?", (user_id, company_id)).rowcount:
+                    # Its tasks went with it; clients drop them along with the company
+                    self._record_deletion(conn, user_id, "company", company_id)
+            return True
+        return await self._run(run)
+
+    async def delete_company_tasks(self, user_id, company_id, progress):
+        # delete_company already cascaded; this only sweeps up stragglers
+        progress.update(deleted=0, failed=0, batches=0)
+
+        def run(conn):
+            if conn.execute("SELECT 1 FROM companies WHERE user_id = ? AND id = ?", (user_id, company_id)).fetchone():
+                return 0
+            with self._transaction(conn):
+                return conn.execute("DELETE FROM tasks WHERE user_id = ? AND company_id = ?", (user_id, company_id)).rowcount
+        progress["deleted"] = await self._run(run)
+        progress["batches"] = 1
+
+    # Tasks
+
+    async def get_tasks(self, user_id):
+        return await self.query_tasks(user_id)
+
+    async def query_tasks(self, user_id, completed=None, company_id=None, title_prefix=None):
+        clauses, params = _task_filters(user_id, completed, company_id, title_prefix)
+
+        def run(conn):
+            rows = conn.execute(f"{_TASK_SELECT} WHERE {' AND '.join(clauses)} ORDER BY company_id, id", params)
+            return [_task_from_row(row) for row in rows]
+        return await self._run(run)
+
+    async def get_tasks_page(self, user_id, limit, cursor=None, completed=None, company_id=None, title_prefix=None):
+        order_fields = ["title", "company_id", "id"] if title_prefix else ["company_id", "id"]
+        after = _cursor_values(cursor, order_fields)
+        clauses, params = _task_filters(user_id, completed, company_id, title_prefix)
+        if after:
+            clauses.append(f"({', '.join(order_fields)}) > ({', '.join('?' * len(order_fields))})")
+            params += after
+
+        def run(conn):
+            sql = f"{_TASK_SELECT} WHERE {' AND '.join(clauses)} ORDER BY {', '.join(order_fields)} LIMIT ?"
+            return conn.execute(sql, params + [limit + 1]).fetchall()
+        rows = await self._run(run)
+        tasks = [_task_from_row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = tasks[-1]
+            values = {"title": last.title, "company_id": last.companyId, "id": last.id}
+            next_cursor = encode_cursor(order_fields, [{"stringValue": values[field]} for field in order_fields])
+        return tasks, next_cursor
+
+    async def get_task_by_id(self, user_id, task_id):
+        def run(conn):
+            return conn.execute(f"{_TASK_SELECT} WHERE user_id = ? AND id = ?", (user_id, task_id)).fetchone()
+        row = await self._run(run)
+        return _task_from_row(row) if row else None
+
+    def _put_task(self, conn, user_id: str, task_id: str, task: Task):
+        previous = conn.execute("SELECT company_id FROM tasks WHERE user_id = ? AND id = ?", (user_id, task_id)).fetchone()
+        conn.execute(
+            "INSERT INTO tasks (user_id, id, company_id, title, description, completed, created_at, updated_at, seq)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (user_id, id) DO UPDATE SET company_id = excluded.company_id, title = excluded.title,"
+            " description = excluded.description, completed = excluded.completed,"
+            " created_at = COALESCE(tasks.created_at, excluded.created_at), updated_at = excluded.updated_at,"
+            " seq = excluded.seq",
+            _task_row(user_id, task_id, task) + (self._next_seq(conn, user_id),)
+        )
+        conn.execute("DELETE FROM deletions WHERE user_id = ? AND kind = 'task' AND id = ?", (user_id, task_id))
+        self._touch_companies(conn, user_id, task.companyId, *(previous or ()))
+        self._put_terms(conn, user_id, "task", task_id, task_terms(task))
+
+    async def create_task(self, user_id, task):
+        def run(conn):
+            with self._transaction(conn):
+                company = conn.execute("SELECT 1 FROM companies WHERE user_id = ? AND id = ?", (user_id, task.companyId)).fetchone()
+                existing = conn.execute("SELECT 1 FROM tasks WHERE user_id = ? AND id = ?", (user_id, task.id)).fetchone()
+                if company is None or existing is not None:
+                    raise Exception("Conflict: company does not exist or task already exists")
+                self._put_task(conn, user_id, task.id, task)
+            return True
+        return await self._run(run)
+
+    async def update_task(self, user_id, task_id, task, precondition=None):
+        def run(conn):
+            with self._transaction(conn):
+                _check_precondition(conn, precondition, f"{_TASK_SELECT} WHERE user_id = ? AND id = ?",
+                                    (user_id, task_id), _task_from_row)
+                self._put_task(conn, user_id, task_id, task)
+                row = conn.execute(f"{_TASK_SELECT} WHERE user_id = ? AND id = ?", (user_id, task_id)).fetchone()
+            return _task_from_row(row)
+        return await self._run(run)
+
+    async def delete_task(self, user_id, task_id, company_id, precondition=None):
+        def run(conn):
+            with self._transaction(conn):
+                _check_precondition(conn, precondition, f"{_TASK_SELECT} WHERE user_id = ? AND id = ?",
+                                    (user_id, task_id), _task_from_row)
+                if conn.execute("DELETE FROM tasks WHERE user_id = ? AND id = ? AND company_id = ?",
+                                (user_id, task_id, company_id)).rowcount:
+                    self._record_deletion(conn, user_id, "task", task_id)
+                    self._touch_companies(conn, user_id, company_id)
+                conn.execute("DELETE FROM search_terms WHERE user_id = ? AND kind = 'task' AND doc_id = ?", (user_id, task_id))
+            return True
+        return await self._run(run)
+
+    # Aggregates and search
+
+    async def count_companies(self, user_id):
+        def run(conn):
+            return conn.execute("SELECT COUNT(*) FROM companies WHERE user_id = ?", (user_id,)).fetchone()[0]
+        return await self._run(run)
+
+    async def count_tasks(self, user_id, completed=None, company_id=None):
+        clauses, params = _task_filters(user_id, completed, company_id, None)
+
+        def run(conn):
+            return conn.execute(f"SELECT COUNT(*) FROM tasks WHERE {' AND '.join(clauses)}", params).fetchone()[0]
+        return await self._run(run)
+
+    async def get_task_summary(self, user_id):
+        def run(conn):
+            company_ids = [row[0] for row in conn.execute("SELECT id FROM companies WHERE user_id = ?", (user_id,))]
+            counts = conn.execute(
+                "SELECT company_id, completed, COUNT(*) FROM tasks WHERE user_id = ? GROUP BY company_id, completed",
+                (user_id,)
+            ).fetchall()
+            return company_ids, counts
+        company_ids, counts = await self._run(run)
+        by_company = {company_id: {"open": 0, "completed": 0} for company_id in company_ids}
+        for company_id, completed, count in counts:
+            if company_id in by_company:
+                by_company[company_id]["completed" if completed else "open"] = count
+        return {
+            "companies": len(by_company),
+            "openTasks": sum(counts["open"] for counts in by_company.values()),
+            "completedTasks": sum(counts["completed"] for counts in by_company.values()),
+            "byCompany": by_company
+        }
+
+    async def search(self, user_id, query, limit=20):
+        words = tokenize(query)
+        if not words:
+            return {"companies": [], "tasks": []}
+
+        # Same semantics and ranking as SearchIndex: every word must prefix
+        # some term of the document; whole-word hits rank above prefix hits
+        per_word = " UNION ALL ".join(
+            "SELECT kind, doc_id, MAX(term = ?) AS exact FROM search_terms"
+            " WHERE user_id = ? AND term >= ? AND term < ? GROUP BY kind, doc_id"
+            for _ in words
+        )
+        params = []
+        for word in words:
+            params += [word, user_id, word, word + chr(0x10FFFF)]
+
+        def run(conn):
+            hits = conn.execute(
+                f"SELECT kind, doc_id FROM ({per_word}) GROUP BY kind, doc_id HAVING COUNT(*) = ?"
+                " ORDER BY SUM(exact) DESC, kind, doc_id LIMIT ?",
+                params + [len(words), limit]
+            ).fetchall()
+            company_ids = [doc_id for kind, doc_id in hits if kind == "company"]
+            task_ids = [doc_id for kind, doc_id in hits if kind == "task"]
+            companies = {
+                row[0]: _company_from_row(row) for row in conn.execute(
+                    f"{_COMPANY_SELECT} WHERE c.user_id = ? AND c.id IN ({', '.join('?' * len(company_ids))})",
+                    [user_id] + company_ids
+                )
+            } if company_ids else {}
+            tasks = {
+                row[0]: _task_from_row(row) for row in conn.execute(
+                    f"{_TASK_SELECT} WHERE user_id = ? AND id IN ({', '.join('?' * len(task_ids))})",
+                    [user_id] + task_ids
+                )
+            } if task_ids else {}
+            return (
+                [companies[doc_id] for doc_id in company_ids if doc_id in companies],
+                [tasks[doc_id] for doc_id in task_ids if doc_id in tasks],
+            )
+        companies, tasks = await self._run(run)
+        return {"companies": companies, "tasks": tasks}
+
+    async def get_templates(self, user_id):
+        def run(conn):
+            return [TaskTemplate.model_validate_json(row[0]) for row in conn.execute("SELECT data FROM task_templates ORDER BY id")]
+        return await self._run(run)
+
+    async def get_changes(self, user_id, since=None):
+        after = -1
+        if since:
+            after = decode_sync_token(since, "s")
+            if type(after) is not int:
+                raise ValueError("Invalid sync token")
+
+        def run(conn):
+            # One read transaction, so the rows and the position agree
+            conn.execute("BEGIN")
+            try:
+                companies = [_company_from_row(row) for row in conn.execute(
+                    f"{_COMPANY_SELECT} WHERE c.user_id = ? AND c.seq > ? ORDER BY c.id", (user_id, after)
+                )]
+                tasks = [_task_from_row(row) for row in conn.execute(
+                    f"{_TASK_SELECT} WHERE user_id = ? AND seq > ? ORDER BY company_id, id", (user_id, after)
+                )]
+                deletions = conn.execute(
+                    "SELECT kind, id FROM deletions WHERE user_id = ? AND seq > ? ORDER BY kind, id", (user_id, after)
+                ).fetchall() if since else []
+                position = conn.execute("SELECT seq, purged_seq FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+            finally:
+                conn.execute("COMMIT")
+            return companies, tasks, deletions, position or (0, 0)
+        companies, tasks, deletions, (position, purged) = await self._run(run)
+        if since and after < purged:
+            raise SyncTokenExpired()
+        return {
+            "companies": companies,
+            "tasks": tasks,
+            "deleted": {
+                "companies": [doc_id for kind, doc_id in deletions if kind == "company"],
+                "tasks": [doc_id for kind, doc_id in deletions if kind == "task"],
+            },
+            "token": encode_sync_token({"s": position})
+        }
+
+    # Bulk and maintenance
+
+    async def purge_tombstones(self, cutoff, progress):
+        progress.update(deleted=0, failed=0, batches=0)
+
+        # One short transaction per batch, so writers are never held up for long
+        def run(conn):
+            with self._transaction(conn):
+                rows = conn.execute(
+                    "SELECT user_id, kind, id, seq FROM deletions WHERE deleted_at < ? ORDER BY deleted_at LIMIT ?",
+                    (cutoff.astimezone(timezone.utc).isoformat(), BATCH_WRITE_LIMIT)
+                ).fetchall()
+                conn.executemany("DELETE FROM deletions WHERE user_id = ? AND kind = ? AND id = ?",
+                                 [row[:3] for row in rows])
+                conn.executemany("UPDATE sync_state SET purged_seq = MAX(purged_seq, ?) WHERE user_id = ?",
+                                 [(seq, user_id) for user_id, _, _, seq in rows])
+            return len(rows)
+        while True:
+            deleted = await self._run(run)
+            if not deleted:
+                break
+            progress["deleted"] += deleted
+            progress["batches"] += 1
+            if deleted < BATCH_WRITE_LIMIT:
+                break
+
+    async def import_batch(self, user_id, kind, items):
+        def run(conn):
+            with self._transaction(conn):
+                for doc_id, item in items:
+                    if kind == "companies":
+                        self._put_company(conn, user_id, doc_id, item)
+                    else:
+                        self._put_task(conn, user_id, doc_id, item)
+            return [True] * len(items)
+        try:
+            return await self._run(run)
+        except Exception as e:
+            return [str(e)] * len(items)
+
+    async def repair_task_counters(self, user_id, progress):
+        # Counters are derived on read, so they are always right
+        progress.update(companies=await self.count_companies(user_id), corrected=0, failed=0)
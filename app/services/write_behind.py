@@ -0,0 +1,111 @@
+"""Write-behind buffer that merges rapid writes to the same document"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from app.core.deadline import clear_request_deadline
+
+
+class _Pending:
+    __slots__ = ("value", "timer")
+
+    def __init__(self, value):
+        self.value = value
+        self.timer = None
+
+
+class WriteBehind:
+    """Holds the latest value written to each key for `delay` seconds.
+
+    Only the value pending when the window closes is handed to `flush`;
+    writes arriving in the meantime replace it instead of adding a round
+    trip. Flushes of one key run one after another, in write order, so an
+    older value never lands after a newer one.
+    """
+
+    def __init__(self, delay: float, flush: Callable[[Hashable, object], Awaitable]):
+        self.delay = delay
+        self._flush = flush
+        self._pending: Dict[Hashable, _Pending] = {}
+        self._flushing: Dict[Hashable, asyncio.Task] = {}
+        self.queued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, key: Hashable, value):
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.value = value
+            self.coalesced += 1
+            return
+        pending = self._pending[key] = _Pending(value)
+        self.queued += 1
+        pending.timer = asyncio.get_running_loop().call_later(self.delay, self._start, key)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        pending = self._pending.get(key)
+        return pending.value if pending is not None else None
+
+    def items(self) -> Iterator[Tuple[Hashable, object]]:
+        return ((key, pending.value) for key, pending in list(self._pending.items()))
+
+    def _start(self, key: Hashable) -> Optional[asyncio.Task]:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return None
+        if pending.timer is not None:
+            pending.timer.cancel()
+        task = asyncio.ensure_future(self._write(key, pending.value, self._flushing.get(key)))
+        self._flushing[key] = task
+        return task
+
+    async def _write(self, key: Hashable, value, previous: Optional[asyncio.Task]):
+        # Runs after the request that queued it has returned
+        clear_request_deadline()
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self._flush(key, value)
+            self.flushed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Deferred write of {key} failed: {e}")
+        finally:
+            if self._flushing.get(key) is asyncio.current_task():
+                del self._flushing[key]
+
+    async def discard(self, key: Hashable):
+        """Drop the pending value of a key and wait for its in-flight write"""
+        pending = self._pending.pop(key, None)
+        if pending is not None and pending.timer is not None:
+            pending.timer.cancel()
+        task = self._flushing.get(key)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def flush(self, key: Hashable):
+        """Write the pending value of a key now and wait until it has landed"""
+        self._start(key)
+        task = self._flushing.get(key)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def flush_all(self):
+        """Write every pending value now (used on shutdown)"""
+        for key in list(self._pending):
+            self._start(key)
+        if self._flushing:
+            await asyncio.wait(list(self._flushing.values()))
+
+    def stats(self) -> dict:
+        return {
+            "delaySeconds": self.delay,
+            "pending": len(self._pending),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "flushed": self.flushed,
+            "failed": self.failed,
+        }
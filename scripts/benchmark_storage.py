@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Storage backend benchmark
+Runs the same workload against each backend and prints per-operation latencies.
+
+    python scripts/benchmark_storage.py --backends sqlite
+    python scripts/benchmark_storage.py --backends sqlite,firestore --companies 20 --tasks 200
+
+The Firestore run writes to the project configured in the environment
+(FIREBASE_PROJECT_ID and credentials), under a throwaway user id.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Company, Task
+from app.services.repository import FirestoreRepository
+from app.services.sqlite_repository import SQLiteRepository
+
+
+def make_company(index: int) -> Company:
+    return Company(
+        id=str(uuid.uuid4()), name=f"Company {index} Holdings", EIN=f"12-{index:07d}", startDate="2024-01-01",
+        stateIncorporated="CA", contactPersonName="Jane Doe", contactPersonPhNumber="555-1234",
+        address1="1 Main St", address2="Suite 1", city="San Francisco", state="CA", zip="94105"
+    )
+
+
+def make_task(index: int, company_id: str) -> Task:
+    return Task(id=str(uuid.uuid4()), companyId=company_id, title=f"Task {index} invoice review",
+                description="Quarterly paperwork", completed=index % 3 == 0)
+
+
+class Timings:
+    def __init__(self):
+        self.samples = {}
+
+    async def measure(self, name: str, call):
+        start = time.perf_counter()
+        result = await call
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def report(self, backend: str):
+        print(f"\n{backend}")
+        print(f"{'operation':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}")
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            total = sum(samples)
+            print(f"{name:<22}{len(samples):>6}{statistics.median(samples) * 1000:>10.2f}{p95 * 1000:>10.2f}"
+                  f"{len(samples) / total if total else 0:>10.0f}")
+
+
+async def run_workload(repo, companies: int, tasks_per_company: int, reads: int) -> Timings:
+    user_id = f"bench-{uuid.uuid4()}"
+    timings = Timings()
+    company_list = [make_company(i) for i in range(companies)]
+    task_list = []
+
+    for company in company_list:
+        await timings.measure("create_company", repo.create_company(user_id, company))
+    for company in company_list:
+        for i in range(tasks_per_company):
+            task = make_task(i, company.id)
+            task_list.append(task)
+            await timings.measure("create_task", repo.create_task(user_id, task))
+
+    for i in range(reads):
+        await timings.measure("get_companies", repo.get_companies(user_id))
+        await timings.measure("get_tasks", repo.get_tasks(user_id))
+        await timings.measure("query_open_tasks", repo.query_tasks(user_id, completed=False))
+        await timings.measure("tasks_page", repo.get_tasks_page(user_id, 50))
+        await timings.measure("get_task_by_id", repo.get_task_by_id(user_id, task_list[i % len(task_list)].id))
+        await timings.measure("count_tasks", repo.count_tasks(user_id, completed=False))
+        await timings.measure("task_summary", repo.get_task_summary(user_id))
+        await timings.measure("search", repo.search(user_id, "invo", 20))
+
+    for task in task_list[:reads]:
+        await timings.measure("update_task", repo.update_task(
+            user_id, task.id, task.model_copy(update={"completed": not task.completed})
+        ))
+    for company in company_list:
+        await timings.measure("delete_company", repo.delete_company(user_id, company.id))
+        await repo.delete_company_tasks(user_id, company.id, {})
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare storage backends on the same workload")
+    parser.add_argument("--backends", default="sqlite", help="comma separated: sqlite, firestore")
+    parser.add_argument("--companies", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=20, help="tasks per company")
+    parser.add_argument("--reads", type=int, default=50, help="rounds of read operations")
+    args = parser.parse_args()
+
+    for backend in args.backends.split(","):
+        if backend == "sqlite":
+            directory = tempfile.mkdtemp()
+            repo = SQLiteRepository(os.path.join(directory, "bench.db"))
+        elif backend == "firestore":
+            repo = FirestoreRepository()
+        else:
+            parser.error(f"unknown backend {backend}")
+        try:
+            timings = await run_workload(repo, args.companies, args.tasks, args.reads)
+        finally:
+            repo.close()
+        timings.report(backend)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+import pytest
+import httpx
+from unittest.mock import patch, AsyncMock
+
+
+@pytest.fixture
+def firestore_stub():
+    """Route firebase.py's HTTP client through an in-test handler.
+
+    Usage: `firestore_stub(handler)` where handler is a (sync or async)
+    function taking an httpx.Request and returning an httpx.Response.
+    """
+    from app.services import firebase
+
+    installed = []
+
+    def install(handler):
+        firebase._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        installed.append(firebase._http_client)
+        return firebase._http_client
+
+    with patch('app.services.firebase.get_access_token', new_callable=AsyncMock) as mock_token:
+        mock_token.return_value = "test-access-token"
+        yield install
+    firebase._http_client = None
+    firebase._companies_cache.clear()
+    firebase._tasks_cache.clear()
+    firebase._counts_cache.clear()
+    firebase._write_versions.clear()
+    firebase._snapshots.clear()
+    firebase._last_reads.clear()
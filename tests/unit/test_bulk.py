@@ -0,0 +1,221 @@
+import asyncio
+import gzip
+import json
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.services import bulk, firebase
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc, task_doc
+
+client = TestClient(app)
+
+MOCK_TOKEN = "mock-firebase-token"
+
+COMPANY = {
+    "name": "Acme", "EIN": "12-3456789", "startDate": "2024-01-01", "stateIncorporated": "CA",
+    "contactPersonName": "Jane", "contactPersonPhNumber": "555-1234", "address1": "1 Main St",
+    "address2": "Suite 1", "city": "SF", "state": "CA", "zip": "94105",
+}
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+def batch_write_stub(firestore_stub):
+    """Accept every batchWrite, recording the writes of each call"""
+    batches = []
+
+    def handler(request):
+        writes = json.loads(request.content)["writes"]
+        batches.append(writes)
+        return httpx.Response(200, json={"writeResults": [{} for _ in writes], "status": [{} for _ in writes]})
+
+    firestore_stub(handler)
+    return batches
+
+
+class TestParsing:
+
+    def test_csv_quoted_field_spanning_lines_and_chunks(self):
+        data = b'id,title,description\r\nt1,"Say ""hi""","line one\nline two"\nt2,Plain,\n'
+        lines = bulk.iter_lines(stream(data[:30], data[30:]))
+        rows = asyncio.run(collect(bulk.iter_rows(lines, "csv")))
+
+        assert rows == [
+            (1, {"id": "t1", "title": 'Say "hi"', "description": "line one\nline two"}, None),
+            (2, {"id": "t2", "title": "Plain"}, None),
+        ]
+
+    def test_ndjson_reports_bad_lines(self):
+        data = b'{"a": 1}\n\nnot json\n[1]\n'
+        rows = asyncio.run(collect(bulk.iter_rows(bulk.iter_lines(stream(data)), "ndjson")))
+
+        assert rows[0] == (1, {"a": 1}, None)
+        assert rows[1][2].startswith("Invalid JSON")
+        assert rows[2] == (3, None, "Expected a JSON object")
+
+    def test_gunzip_in_bounded_pieces(self):
+        raw = b"x" * (10 * bulk.READ_SIZE)
+        pieces = asyncio.run(collect(bulk.gunzip(stream(gzip.compress(raw)))))
+
+        assert b"".join(pieces) == raw
+        assert max(len(piece) for piece in pieces) <= bulk.READ_SIZE
+
+
+class TestImport:
+
+    def test_companies_batched_with_row_errors(self, firestore_stub):
+        batches = batch_write_stub(firestore_stub)
+        lines = [json.dumps(dict(COMPANY, id=f"c{i}")) for i in range(1200)]
+        lines.insert(3, json.dumps(dict(COMPANY, name="")))
+        body = gzip.compress("\n".join(lines).encode())
+
+        report = asyncio.run(bulk.import_rows(MOCK_USER_ID, "companies", stream(body), "ndjson", gzipped=True))
+
+        assert [len(batch) for batch in batches] == [500, 500, 200]
+        assert batches[0][0]["update"]["name"].endswith(f"/documents/users/{MOCK_USER_ID}/companies/c0")
+        assert report["processed"] == 1201
+        assert report["imported"] == 1200
+        assert report["failed"] == 1
+        assert report["errors"][0]["row"] == 4
+        assert report["errors"][0]["errors"][0].startswith("name:")
+
+    def test_tasks_need_an_existing_company(self, firestore_stub):
+        batches = batch_write_stub(firestore_stub)
+        body = b"companyId,title,completed\nc1,Known,true\nc2,Unknown,false\nc1,Another,0\n"
+
+        with patch.object(firebase, "company_exists", AsyncMock(side_effect=lambda uid, cid: cid == "c1")) as exists:
+            report = asyncio.run(bulk.import_rows(MOCK_USER_ID, "tasks", stream(body), "csv"))
+
+        assert exists.await_count == 2
+        assert report["imported"] == 2
+        assert report["errors"] == [{"row": 2, "id": report["errors"][0]["id"], "errors": ["companyId: Company not exist"]}]
+        fields = batches[0][0]["update"]["fields"]
+        assert fields["completed"] == {"booleanValue": True}
+        assert "/companies/c1/Task/" in batches[0][0]["update"]["name"]
+
+    def test_failed_writes_are_reported(self, firestore_stub):
+        def handler(request):
+            writes = json.loads(request.content)["writes"]
+            return httpx.Response(200, json={"status": [{"code": 7, "message": "PERMISSION_DENIED"}] + [{}] * (len(writes) - 1)})
+
+        firestore_stub(handler)
+        body = "\n".join(json.dumps(dict(COMPANY, id=f"c{i}")) for i in range(2)).encode()
+        report = asyncio.run(bulk.import_rows(MOCK_USER_ID, "companies", stream(body), "ndjson"))
+
+        assert report["imported"] == 1
+        assert report["errors"] == [{"row": 1, "id": "c0", "errors": ["Write failed"]}]
+
+    def test_import_drops_cached_lists(self, firestore_stub):
+        batch_write_stub(firestore_stub)
+        firebase._companies_cache.set(f"companies_{MOCK_USER_ID}", [])
+        body = json.dumps(COMPANY).encode()
+
+        asyncio.run(bulk.import_rows(MOCK_USER_ID, "companies", stream(body), "ndjson"))
+
+        assert f"companies_{MOCK_USER_ID}" not in firebase._companies_cache
+
+
+class TestImportEndpoint:
+
+    def test_csv_upload_accepted(self, firestore_stub):
+        batch_write_stub(firestore_stub)
+        header = ",".join(COMPANY)
+        row = ",".join(COMPANY.values())
+        response = client.post(
+            "/import/companies",
+            content=f"{header}\n{row}\n".encode(),
+            headers={"Authorization": f"Bearer {MOCK_TOKEN}", "Content-Type": "text/csv"}
+        )
+        assert response.status_code == 200
+        assert response.json()["imported"] == 1
+
+    def test_unknown_kind_404(self):
+        response = client.post("/import/widgets", content=b"", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 404
+
+    def test_corrupt_gzip_400(self):
+        response = client.post(
+            "/import/companies",
+            content=b"not gzip",
+            headers={"Authorization": f"Bearer {MOCK_TOKEN}", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 400
+
+
+def paged_stub(firestore_stub, documents):
+    """Serve runQuery pages over `documents` ordered by name, honouring startAt and limit"""
+    pages = []
+
+    def handler(request):
+        query = json.loads(request.content)["structuredQuery"]
+        remaining = sorted(documents, key=lambda doc: doc["name"])
+        if "startAt" in query:
+            after = query["startAt"]["values"][0]["referenceValue"]
+            remaining = [doc for doc in remaining if doc["name"] > after]
+        page = remaining[:query["limit"]]
+        pages.append(len(page))
+        return httpx.Response(200, json=[{"document": doc} for doc in page])
+
+    firestore_stub(handler)
+    return pages
+
+
+class TestExport:
+
+    def test_ndjson_export_pages_through_everything(self, firestore_stub, monkeypatch):
+        monkeypatch.setattr(bulk, "EXPORT_PAGE_SIZE", 2)
+        pages = paged_stub(firestore_stub, [task_doc("c1", f"t{i}", title=f"Task {i}") for i in range(5)])
+
+        async def run():
+            return b"".join([chunk async for chunk in bulk.export_chunks(MOCK_USER_ID, "tasks", "ndjson")])
+
+        lines = asyncio.run(run()).decode().splitlines()
+
+        assert [json.loads(line)["id"] for line in lines] == [f"t{i}" for i in range(5)]
+        assert json.loads(lines[0]) == {"id": "t0", "companyId": "c1", "title": "Task 0", "description": None, "completed": False}
+        assert pages == [3, 3, 1]
+
+    def test_csv_gzip_export_round_trips_through_import_parser(self, firestore_stub):
+        paged_stub(firestore_stub, [task_doc("c1", "t1", title='Say "hi", then go', completed=True)])
+
+        async def run():
+            body = b"".join([chunk async for chunk in bulk.export_chunks(MOCK_USER_ID, "tasks", "csv", gzipped=True)])
+            lines = bulk.iter_lines(bulk.gunzip(stream(body)))
+            return [row async for row in bulk.iter_rows(lines, "csv")]
+
+        rows = asyncio.run(run())
+        assert rows == [(1, {"id": "t1", "companyId": "c1", "title": 'Say "hi", then go', "completed": "true"}, None)]
+
+    def test_endpoint_streams_with_attachment_headers(self, firestore_stub):
+        paged_stub(firestore_stub, [company_doc("c1"), company_doc("c2")])
+
+        response = client.get("/export/companies?format=csv", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="companies.csv"' in response.headers["content-disposition"]
+        lines = response.text.splitlines()
+        assert lines[0].startswith("id,name,EIN")
+        assert len(lines) == 3
+
+    def test_upstream_error_before_first_byte_maps_to_status(self, firestore_stub):
+        firestore_stub(lambda request: httpx.Response(503))
+        response = client.get("/export/tasks", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 503
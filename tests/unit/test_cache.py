@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.models import Task
+from app.services.cache import LRUCache, approximate_size
+
+
+def make_tasks(count):
+    return [Task(id=f"t{i}", companyId="c1", title=f"Task {i}") for i in range(count)]
+
+
+class TestLRUCache:
+
+    def test_get_and_set(self):
+        cache = LRUCache(max_bytes=10_000, ttl=60)
+        cache.set("a", [1, 2, 3])
+        assert cache.get("a") == [1, 2, 3]
+        assert cache.get("missing") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_expired_entries_are_misses(self):
+        cache = LRUCache(max_bytes=10_000, ttl=60)
+        cache.set("a", "value", ttl=0)
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.current_bytes == 0
+
+    def test_evicts_least_recently_used_when_over_budget(self):
+        entry_size = approximate_size(make_tasks(5))
+        cache = LRUCache(max_bytes=entry_size * 2 + 1, ttl=60)
+        cache.set("a", make_tasks(5))
+        cache.set("b", make_tasks(5))
+        cache.get("a")
+        cache.set("c", make_tasks(5))
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.stats()["evictions"] == 1
+        assert cache.current_bytes <= cache.max_bytes
+
+    def test_oversized_value_is_not_stored(self):
+        cache = LRUCache(max_bytes=100, ttl=60)
+        cache.set("a", make_tasks(10))
+        assert "a" not in cache
+        assert cache.current_bytes == 0
+
+    def test_update_resizes_live_entry_only(self):
+        cache = LRUCache(max_bytes=1_000_000, ttl=60)
+        assert not cache.update("a", lambda value: value + make_tasks(1))
+        cache.set("a", make_tasks(1))
+        before = cache.current_bytes
+        assert cache.update("a", lambda value: value + make_tasks(3))
+        assert len(cache.get("a")) == 4
+        assert cache.current_bytes > before
+
+    def test_entry_is_stale_between_soft_and_hard_ttl(self):
+        cache = LRUCache(max_bytes=10_000, ttl=60, fresh_ttl=0)
+        cache.set("a", "value")
+        assert cache.get_entry("a") == ("value", False)
+        assert cache.stats()["stale_hits"] == 1
+
+    def test_sweep_removes_expired_entries(self):
+        cache = LRUCache(max_bytes=10_000, ttl=60)
+        cache.set("a", "value")
+        cache.set("b", "value", ttl=0)
+        assert cache.sweep() == 1
+        assert len(cache) == 1
+
+
+class TestCacheStatsEndpoint:
+
+    def test_cache_stats_200(self):
+        response = TestClient(app).get("/cache_stats", headers={"Authorization": "Bearer mock-firebase-token"})
+        assert response.status_code == 200
+        assert set(response.json()) == {"companies", "tasks"}
+        assert "hit_rate" in response.json()["companies"]
+
+    def test_cache_stats_requires_auth(self):
+        assert TestClient(app).get("/cache_stats").status_code == 401
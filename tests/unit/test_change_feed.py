@@ -0,0 +1,139 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import AsyncMock
+
+from app.services import change_feed, firebase
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc, task_doc
+
+
+def seed_caches():
+    firebase._companies_cache.set(f"companies_{MOCK_USER_ID}", [firebase.parse_firestore_company(company_doc("c1"))])
+    firebase._tasks_cache.set(f"tasks_{MOCK_USER_ID}", [firebase.parse_firestore_task(task_doc("c1", "t1"))])
+
+
+class TestParseDocumentName:
+
+    def test_company_and_task_names(self):
+        assert change_feed.parse_document_name(company_doc("c1")["name"]) == (MOCK_USER_ID, "company", "c1")
+        assert change_feed.parse_document_name(task_doc("c1", "t1")["name"]) == (MOCK_USER_ID, "task", "t1")
+
+    def test_other_documents_are_ignored(self):
+        assert change_feed.parse_document_name("projects/p/databases/(default)/documents/users/u1") is None
+        assert change_feed.parse_document_name("projects/p/databases/(default)/documents/task_templates/x") is None
+
+
+class TestApplyListenResponse:
+
+    def test_document_change_patches_cached_list(self, firestore_stub):
+        seed_caches()
+        change_feed.apply_listen_response({"documentChange": {"document": company_doc("c2", name="Console Co"), "targetIds": [1]}})
+        companies = firebase._companies_cache.get(f"companies_{MOCK_USER_ID}")
+        assert [c.id for c in companies] == ["c1", "c2"]
+
+    def test_document_delete_removes_task(self, firestore_stub):
+        seed_caches()
+        change_feed.apply_listen_response({"documentDelete": {"document": task_doc("c1", "t1")["name"]}})
+        assert firebase._tasks_cache.get(f"tasks_{MOCK_USER_ID}") == []
+
+    def test_removed_from_target_counts_as_delete(self, firestore_stub):
+        seed_caches()
+        change_feed.apply_listen_response({"documentChange": {"document": company_doc("c1"), "removedTargetIds": [1]}})
+        assert firebase._companies_cache.get(f"companies_{MOCK_USER_ID}") == []
+
+    def test_unparseable_document_drops_user_caches(self, firestore_stub):
+        seed_caches()
+        broken = {"name": company_doc("c1")["name"]}
+        change_feed.apply_listen_response({"documentChange": {"document": broken, "targetIds": [1]}})
+        assert firebase._companies_cache.get(f"companies_{MOCK_USER_ID}") is None
+
+    def test_target_change_is_ignored(self):
+        assert not change_feed.apply_listen_response({"targetChange": {"resumeToken": "abc"}})
+
+
+class TestSources:
+
+    def test_file_source_tails_appended_lines(self, tmp_path):
+        path = tmp_path / "changes.ndjson"
+        path.write_text(json.dumps({"targetChange": {}}) + "\n")
+        source = change_feed.FileChangeSource(str(path), poll_interval=0.01)
+
+        async def run():
+            received = []
+            stream = source.responses()
+            reader = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.02)
+            with open(path, "a") as f:
+                f.write(json.dumps({"documentDelete": {"document": "x"}}) + "\n")
+            received.append(await asyncio.wait_for(reader, 1))
+            await source.close()
+            return received
+
+        assert asyncio.run(run()) == [{"documentDelete": {"document": "x"}}]
+
+    def test_firestore_source_polls_cached_users(self, firestore_stub):
+        from tests.unit.test_firestore_standin import use_standin, seed_company
+        from tests.unit.test_counters import make_task
+        use_standin(firestore_stub)
+        source = change_feed.FirestorePollSource()
+
+        async def run():
+            await seed_company("c1")
+            await firebase.get_companies(MOCK_USER_ID)
+            assert firebase.cached_user_ids() == {MOCK_USER_ID}
+            assert await source._poll(MOCK_USER_ID) == []
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+            written = await source._poll(MOCK_USER_ID)
+            await firebase.delete_task(MOCK_USER_ID, "t1", "c1")
+            deleted = await source._poll(MOCK_USER_ID)
+            return written, deleted
+
+        written, deleted = asyncio.run(run())
+
+        names = sorted(change_feed.parse_document_name(m["documentChange"]["document"]["name"]) for m in written)
+        assert names == [(MOCK_USER_ID, "company", "c1"), (MOCK_USER_ID, "task", "t1")]
+        deletes = [change_feed.parse_document_name(m["documentDelete"]["document"]) for m in deleted if "documentDelete" in m]
+        assert deletes == [(MOCK_USER_ID, "task", "t1")]
+
+    def test_poll_starts_from_firestore_read_time(self, monkeypatch):
+        monkeypatch.setattr(firebase, "server_read_time", AsyncMock(return_value="2020-01-01T00:00:00Z"))
+        source = change_feed.FirestorePollSource()
+
+        assert asyncio.run(source._poll(MOCK_USER_ID)) == []
+        assert source._positions == {MOCK_USER_ID: "2020-01-01T00:00:00Z"}
+
+    def test_only_active_users_are_polled(self, monkeypatch):
+        monkeypatch.setattr(firebase, "cached_user_ids", lambda: {"busy", "idle"})
+        monkeypatch.setattr(firebase, "active_user_ids", lambda window: {"busy"})
+        seed = AsyncMock(return_value="2020-01-01T00:00:00Z")
+        monkeypatch.setattr(firebase, "server_read_time", seed)
+        changes = AsyncMock(return_value=([], [], [], None))
+        monkeypatch.setattr(firebase, "query_changes", changes)
+        source = change_feed.FirestorePollSource(poll_interval=0.01)
+
+        async def run():
+            feed = asyncio.ensure_future(change_feed.run_change_feed(source))
+            await asyncio.sleep(0.05)
+            await source.close()
+            await feed
+
+        asyncio.run(run())
+        assert [call.args[0] for call in seed.await_args_list] == ["busy"]
+        assert {call.args[0] for call in changes.await_args_list} == {"busy"}
+
+    def test_empty_polls_back_off(self):
+        source = change_feed.FirestorePollSource(poll_interval=2, max_interval=10)
+        intervals = []
+        for changed in (False, False, False, False, True):
+            source._reschedule(MOCK_USER_ID, changed)
+            intervals.append(source._schedule[MOCK_USER_ID][1])
+        assert intervals == [2, 4, 8, 10, 2]
+
+    def test_source_selection(self):
+        assert change_feed.get_change_source(None) is None
+        assert isinstance(change_feed.get_change_source("firestore"), change_feed.FirestorePollSource)
+        assert isinstance(change_feed.get_change_source("file:/tmp/x"), change_feed.FileChangeSource)
+
+    def test_sources_must_implement_responses(self):
+        with pytest.raises(TypeError):
+            change_feed.ChangeSource()
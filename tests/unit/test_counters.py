@@ -0,0 +1,186 @@
+import pytest
+import asyncio
+import json
+import httpx
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.models import Company, Task
+from app.services import firebase
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc, task_doc
+
+
+def make_task(task_id="t1", completed=False):
+    return Task(id=task_id, companyId="c1", title="Invoice", completed=completed)
+
+
+def counter_deltas(writes):
+    """{fieldPath: delta} of the counter transform in a commit, if any"""
+    for write in writes:
+        if "transform" in write:
+            return {
+                t["fieldPath"]: int(t["increment"]["integerValue"])
+                for t in write["transform"]["fieldTransforms"] if "increment" in t
+            }
+    return {}
+
+
+def commit_stub(firestore_stub, stored=None, failures=0, counts=None):
+    """Serve `stored` for document GETs and record commits; the first `failures` commits fail their precondition"""
+    commits = []
+
+    def handler(request):
+        if request.url.path.endswith(":commit"):
+            commits.append(json.loads(request.content)["writes"])
+            if len(commits) <= failures:
+                return httpx.Response(400, json={"error": {"status": "FAILED_PRECONDITION"}})
+            return httpx.Response(200, json={"writeResults": []})
+        if request.url.path.endswith(":runAggregationQuery"):
+            body = json.loads(request.content)
+            where = json.dumps(body["structuredAggregationQuery"]["structuredQuery"].get("where"))
+            count = counts["open"] if "completed" in where else counts["total"]
+            return httpx.Response(200, json=[{"result": {"aggregateFields": {"count": {"integerValue": str(count)}}}}])
+        if request.url.path.endswith(":runQuery"):
+            return httpx.Response(200, json=[{"document": company_doc("c1")}])
+        if request.method == "GET" and stored is not None:
+            return httpx.Response(200, json={**stored, "updateTime": "2024-01-01T00:00:00Z"})
+        return httpx.Response(404, json={})
+
+    firestore_stub(handler)
+    return commits
+
+
+class TestCounterMaintenance:
+
+    def test_create_increments_both_counters_in_the_same_commit(self, firestore_stub):
+        commits = commit_stub(firestore_stub)
+
+        assert asyncio.run(firebase.create_task(MOCK_USER_ID, make_task())) is True
+
+        writes = commits[0]
+        assert writes[0]["currentDocument"] == {"exists": False}
+        assert counter_deltas(writes) == {"taskCount": 1, "openTaskCount": 1}
+        assert writes[1]["currentDocument"] == {"exists": True}
+
+    def test_create_of_completed_task_leaves_open_count(self, firestore_stub):
+        commits = commit_stub(firestore_stub)
+
+        asyncio.run(firebase.create_task(MOCK_USER_ID, make_task(completed=True)))
+
+        assert counter_deltas(commits[0]) == {"taskCount": 1}
+
+    def test_create_conflict_is_reported(self, firestore_stub):
+        commit_stub(firestore_stub, failures=1)
+
+        with pytest.raises(Exception, match="Conflict"):
+            asyncio.run(firebase.create_task(MOCK_USER_ID, make_task()))
+
+    def test_completing_a_task_decrements_open_count(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1", completed=False))
+
+        asyncio.run(firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=True)))
+
+        assert commits[0][0]["currentDocument"] == {"updateTime": "2024-01-01T00:00:00Z"}
+        assert counter_deltas(commits[0]) == {"openTaskCount": -1}
+
+    def test_update_without_status_change_sends_no_transform(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1", completed=False))
+
+        asyncio.run(firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=False)))
+
+        assert len(commits[0]) == 1
+
+    def test_update_retries_when_task_changed_underneath(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1"), failures=1)
+
+        assert asyncio.run(firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=True))).completed is True
+        assert len(commits) == 2
+
+    def test_update_gives_up_after_repeated_conflicts(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1"), failures=99)
+
+        with pytest.raises(Exception, match="Conflict"):
+            asyncio.run(firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=True)))
+        assert len(commits) == firebase.COUNTER_COMMIT_ATTEMPTS
+
+    def test_delete_of_open_task_decrements_both(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1", completed=False))
+
+        assert asyncio.run(firebase.delete_task(MOCK_USER_ID, "t1", "c1")) is True
+
+        assert "delete" in commits[0][0]
+        assert counter_deltas(commits[0]) == {"taskCount": -1, "openTaskCount": -1}
+
+    def test_delete_of_missing_task_commits_nothing(self, firestore_stub):
+        commits = commit_stub(firestore_stub)
+
+        assert asyncio.run(firebase.delete_task(MOCK_USER_ID, "t1", "c1")) is True
+        assert commits == []
+
+    def test_cached_company_follows_committed_deltas(self, firestore_stub):
+        commit_stub(firestore_stub)
+        company = firebase.parse_firestore_company(company_doc("c1")).model_copy(update={"taskCount": 2, "openTaskCount": 1})
+        firebase._companies_cache.set(f"companies_{MOCK_USER_ID}", [company])
+
+        asyncio.run(firebase.create_task(MOCK_USER_ID, make_task()))
+
+        cached = firebase._cached_company(MOCK_USER_ID, "c1")
+        assert (cached.taskCount, cached.openTaskCount) == (3, 2)
+
+
+class TestCompanyWrites:
+
+    def test_update_company_masks_out_counters(self, firestore_stub):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={})
+
+        firestore_stub(handler)
+        company = Company.model_validate({**firebase.parse_firestore_company(company_doc("c1")).model_dump(), "taskCount": 99})
+
+        asyncio.run(firebase.update_company(MOCK_USER_ID, "c1", company))
+
+        write = json.loads(requests[0].content)["writes"][0]
+        mask = write["updateMask"]["fieldPaths"]
+        assert "name" in mask
+        assert "taskCount" not in mask
+        assert "taskCount" not in write["update"]["fields"]
+
+
+class TestCounterRepair:
+
+    def test_drifted_counters_are_rewritten(self, firestore_stub):
+        stored = company_doc("c1")
+        stored["fields"].update(taskCount={"integerValue": "5"}, openTaskCount={"integerValue": "5"})
+        commits = commit_stub(firestore_stub, stored=stored, counts={"total": 3, "open": 1})
+        progress = {}
+
+        asyncio.run(firebase.repair_task_counters(MOCK_USER_ID, progress))
+
+        assert progress == {"companies": 1, "corrected": 1, "failed": 0}
+        write = commits[0][0]
+        assert write["updateMask"] == {"fieldPaths": ["taskCount", "openTaskCount"]}
+        assert write["update"]["fields"] == {
+            "taskCount": {"integerValue": "3"}, "openTaskCount": {"integerValue": "1"}
+        }
+        assert write["currentDocument"] == {"updateTime": "2024-01-01T00:00:00Z"}
+
+    def test_correct_counters_are_left_alone(self, firestore_stub):
+        stored = company_doc("c1")
+        stored["fields"].update(taskCount={"integerValue": "3"}, openTaskCount={"integerValue": "1"})
+        commits = commit_stub(firestore_stub, stored=stored, counts={"total": 3, "open": 1})
+        progress = {}
+
+        asyncio.run(firebase.repair_task_counters(MOCK_USER_ID, progress))
+
+        assert progress["corrected"] == 0
+        assert commits == []
@@ -0,0 +1,102 @@
+import pytest
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import patch, MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.core import deadline
+from app.services import firebase
+
+client = TestClient(app)
+
+MOCK_TOKEN = "mock-firebase-token"
+
+
+def expire_current_deadline():
+    deadline.get_request_deadline().expires_at = 0
+
+
+class TestRemainingTime:
+
+    def test_no_deadline_returns_default(self):
+        deadline.clear_request_deadline()
+        assert deadline.remaining_time(5.0) == 5.0
+
+    def test_caps_to_remaining_budget(self):
+        deadline.start_request_deadline(1.0)
+        assert deadline.remaining_time(5.0) <= 1.0
+        deadline.clear_request_deadline()
+
+    def test_expired_budget_raises_and_flags(self):
+        current = deadline.start_request_deadline(1.0)
+        current.expires_at = 0
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.remaining_time(5.0)
+        assert current.exceeded
+        deadline.clear_request_deadline()
+
+
+class TestFirestoreRequest:
+
+    def test_no_upstream_call_after_deadline(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url)
+            return httpx.Response(200, json={})
+
+        async def run():
+            firebase._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                current = deadline.start_request_deadline(1.0)
+                await firebase._request("GET", "https://firestore.test/doc")
+                current.expires_at = 0
+                with pytest.raises(deadline.DeadlineExceeded):
+                    await firebase._request("GET", "https://firestore.test/doc")
+            finally:
+                await firebase._http_client.aclose()
+                firebase._http_client = None
+
+        asyncio.run(run())
+        assert len(calls) == 1
+
+
+class TestDeadlineMiddleware:
+
+    def test_handler_within_budget_200(self):
+        async def fake_get_companies(user_id):
+            return []
+
+        with patch('app.api.handlers.get_companies', side_effect=fake_get_companies):
+            response = client.get("/getall_companies", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 200
+
+    def test_exceeded_budget_swallowed_by_handler_504(self):
+        async def fake_get_companies(user_id):
+            expire_current_deadline()
+            try:
+                deadline.remaining_time(5.0)
+            except deadline.DeadlineExceeded:
+                return []
+
+        with patch('app.api.handlers.get_companies', side_effect=fake_get_companies):
+            response = client.get("/getall_companies", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 504
+
+    def test_exceeded_budget_raised_504(self):
+        async def fake_get_tasks(user_id):
+            expire_current_deadline()
+            deadline.remaining_time(5.0)
+
+        with patch('app.api.handlers.get_tasks', side_effect=fake_get_tasks):
+            response = client.get("/getall_tasks", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 504
@@ -0,0 +1,165 @@
+import pytest
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock, MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.api import etags
+from app.models import Task
+from app.services import firebase, repository
+from app.services.sqlite_repository import SQLiteRepository
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc
+from tests.unit.test_sqlite_repository import make_company, make_task
+
+client = TestClient(app)
+HEADERS = {"Authorization": "Bearer mock-firebase-token"}
+
+
+def tasks(*titles):
+    return [Task(id=f"t{i}", companyId="c1", title=title) for i, title in enumerate(titles)]
+
+
+class TestConditionalReads:
+
+    def test_matching_etag_gets_304_without_body(self):
+        result = tasks("Invoice")
+        with patch('app.main.handlers.get_tasks', new_callable=AsyncMock, return_value=result):
+            first = client.get("/getall_tasks", headers=HEADERS)
+            second = client.get("/getall_tasks", headers={**HEADERS, "If-None-Match": first.headers["etag"]})
+
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == "private, no-cache"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["etag"] == first.headers["etag"]
+
+    def test_changed_data_gets_new_etag(self):
+        with patch('app.main.handlers.get_tasks', new_callable=AsyncMock, return_value=tasks("Invoice")):
+            etag = client.get("/getall_tasks", headers=HEADERS).headers["etag"]
+        with patch('app.main.handlers.get_tasks', new_callable=AsyncMock, return_value=tasks("Payroll")):
+            response = client.get("/getall_tasks", headers={**HEADERS, "If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()[0]["title"] == "Payroll"
+
+    def test_same_content_from_another_object_has_same_etag(self):
+        with patch('app.main.handlers.get_companies', new_callable=AsyncMock, side_effect=[[], []]):
+            first = client.get("/getall_companies", headers=HEADERS).headers["etag"]
+            second = client.get("/getall_companies", headers={**HEADERS, "If-None-Match": first})
+
+        assert second.status_code == 304
+
+    def test_cached_list_is_not_serialized_again(self):
+        result = tasks("Invoice", "Payroll")
+        firebase._tasks_cache.set(f"tasks_{MOCK_USER_ID}", result)
+        with patch('app.main.handlers.get_tasks', new_callable=AsyncMock, return_value=result):
+            etag = client.get("/getall_tasks", headers=HEADERS).headers["etag"]
+            with patch('app.api.etags.jsonable_encoder') as encoder:
+                response = client.get("/getall_tasks", headers={**HEADERS, "If-None-Match": etag})
+
+        assert response.status_code == 304
+        encoder.assert_not_called()
+
+    def test_tag_is_forgotten_with_the_cache_entry(self):
+        result = tasks("Invoice")
+        firebase._tasks_cache.set(f"tasks_{MOCK_USER_ID}", result)
+        with patch('app.main.handlers.get_tasks', new_callable=AsyncMock, return_value=result):
+            etag = client.get("/getall_tasks", headers=HEADERS).headers["etag"]
+        assert firebase.cached_list_note(result) == etag
+
+        firebase._tasks_cache.set(f"tasks_{MOCK_USER_ID}", tasks("Invoice"))
+        assert firebase.cached_list_note(result) is None
+        # Results that never were cached are not remembered at all
+        assert firebase.note_cached_list(tasks("Payroll"), etag) is False
+
+    def test_pages_and_single_company_carry_etags(self):
+        page = {"items": tasks("Invoice"), "nextCursor": "abc"}
+        with patch('app.main.handlers.get_tasks', new_callable=AsyncMock, return_value=page):
+            response = client.get("/getall_tasks?limit=1", headers=HEADERS)
+        company = firebase.parse_firestore_company(company_doc("c1"))
+        with patch('app.main.handlers.get_company_by_id', new_callable=AsyncMock, return_value=company):
+            single = client.get("/get_company/c1", headers=HEADERS)
+
+        assert response.headers["etag"].startswith('"')
+        assert single.headers["etag"].startswith('"')
+
+
+class TestMatches:
+
+    @pytest.mark.parametrize("header", ['"a"', 'W/"a"', '"b", "a"', '*'])
+    def test_matching_headers(self, header):
+        assert etags.matches(header, '"a"')
+
+    @pytest.mark.parametrize("header", [None, "", '"b"', 'a'])
+    def test_non_matching_headers(self, header):
+        assert not etags.matches(header, '"a"')
+
+
+class TestCompanyLookupFromCache:
+
+    def test_fresh_cached_list_serves_lookup(self, firestore_stub):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(200, json={"documents": [company_doc("c1"), company_doc("c2")]})
+
+        firestore_stub(handler)
+        asyncio.run(firebase.get_companies(MOCK_USER_ID))
+        company = asyncio.run(firebase.get_company_by_id(MOCK_USER_ID, "c2"))
+
+        assert company.id == "c2"
+        assert len(calls) == 1
+
+
+class TestConditionalWrites:
+
+    @pytest.fixture(autouse=True)
+    def backend(self, tmp_path):
+        repo = SQLiteRepository(str(tmp_path / "app.db"))
+        repository.set_repository(repo)
+        asyncio.run(repo.create_company(MOCK_USER_ID, make_company("c1")))
+        asyncio.run(repo.create_task(MOCK_USER_ID, make_task("t1")))
+        yield
+        repository.set_repository(None)
+
+    def test_update_with_current_etag_returns_the_next_one(self):
+        etag = client.get("/get_company/c1", headers=HEADERS).headers["etag"]
+        body = make_company(None, name="Renamed").model_dump(exclude={"id"})
+
+        updated = client.put("/update_company/c1", json=body, headers={**HEADERS, "If-Match": etag})
+        current = client.get("/get_company/c1", headers=HEADERS).headers["etag"]
+        stale = client.put("/update_company/c1", json=body, headers={**HEADERS, "If-Match": etag})
+        again = client.put("/update_company/c1", json=body, headers={**HEADERS, "If-Match": updated.headers["etag"]})
+
+        assert updated.status_code == 200
+        assert updated.headers["etag"] == current != etag
+        assert stale.status_code == 412
+        assert again.status_code == 200
+
+    def test_stale_etag_blocks_task_update_and_delete(self):
+        etag = client.get("/get_task/t1", headers=HEADERS).headers["etag"]
+        body = {"companyId": "c1", "title": "Invoice", "completed": True}
+        assert client.put("/update_task/t1", json=body, headers={**HEADERS, "If-Match": etag}).status_code == 200
+
+        assert client.put("/update_task/t1", json=body, headers={**HEADERS, "If-Match": etag}).status_code == 412
+        assert client.delete("/delete_task/t1", headers={**HEADERS, "If-Match": etag}).status_code == 412
+        assert client.delete("/delete_task/t1", headers={**HEADERS, "If-Match": "*"}).status_code == 200
+
+    def test_weak_etags_never_match(self):
+        etag = client.get("/get_company/c1", headers=HEADERS).headers["etag"]
+
+        response = client.delete("/delete_company/c1", headers={**HEADERS, "If-Match": f"W/{etag}"})
+
+        assert response.status_code == 412
+        assert client.get("/get_company/c1", headers=HEADERS).json()["id"] == "c1"
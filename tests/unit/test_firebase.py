@@ -0,0 +1,342 @@
+import pytest
+import asyncio
+import httpx
+from app.core import deadline
+from app.services import firebase
+from app.services.cache import LRUCache
+from app.services.shared_cache import SharedCache
+
+MOCK_USER_ID = "test-user-123"
+
+
+def company_doc(company_id, name="Test Company"):
+    fields = {
+        key: {"stringValue": value}
+        for key, value in {
+            "name": name,
+            "EIN": "12-3456789",
+            "startDate": "2024-01-01",
+            "stateIncorporated": "CA",
+            "contactPersonName": "John Doe",
+            "contactPersonPhNumber": "555-1234",
+            "address1": "123 Main St",
+            "address2": "Suite 100",
+            "city": "San Francisco",
+            "state": "CA",
+            "zip": "94105",
+        }.items()
+    }
+    return {"name": f"projects/p/databases/(default)/documents/users/{MOCK_USER_ID}/companies/{company_id}", "fields": fields}
+
+
+def task_doc(company_id, task_id, title="Test Task", completed=False):
+    return {
+        "name": f"projects/p/databases/(default)/documents/users/{MOCK_USER_ID}/companies/{company_id}/Task/{task_id}",
+        "fields": {
+            "company_id": {"stringValue": company_id},
+            "title": {"stringValue": title},
+            "description": {"stringValue": ""},
+            "completed": {"booleanValue": completed},
+        },
+    }
+
+
+class TestSingleFlight:
+
+    def test_concurrent_company_lists_share_one_call(self, firestore_stub):
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json={"documents": [company_doc("c1")]})
+
+        async def run():
+            firestore_stub(handler)
+            return await asyncio.gather(*[firebase.get_companies(MOCK_USER_ID) for _ in range(5)])
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(result[0].id == "c1" for result in results)
+
+    def test_sequential_reads_are_not_coalesced(self, firestore_stub):
+        calls = []
+
+        def handler(request):
+            calls.append(str(request.url))
+            return httpx.Response(200, json=company_doc("c1"))
+
+        async def run():
+            firestore_stub(handler)
+            await firebase.get_company_by_id(MOCK_USER_ID, "c1")
+            await firebase.get_company_by_id(MOCK_USER_ID, "c1")
+
+        asyncio.run(run())
+        assert len(calls) == 2
+
+    def test_failure_is_shared_and_not_retained(self, firestore_stub):
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            await asyncio.sleep(0.01)
+            return httpx.Response(500, text="not json")
+
+        async def run():
+            firestore_stub(handler)
+            results = await asyncio.gather(
+                *[firebase.get_company_by_id(MOCK_USER_ID, "c1") for _ in range(3)],
+                return_exceptions=True
+            )
+            assert all(isinstance(result, Exception) for result in results)
+            assert not firebase._inflight_reads
+
+        asyncio.run(run())
+        assert len(calls) == 1
+
+
+    def test_short_deadline_does_not_cut_the_shared_load(self, firestore_stub):
+        async def handler(request):
+            if request.url.path.endswith("/companies"):
+                return httpx.Response(200, json={"documents": [company_doc("c1"), company_doc("c2")]})
+            company_id = request.url.path.split("/")[-2]
+            if company_id == "c2":
+                await asyncio.sleep(0.3)
+            return httpx.Response(200, json={"documents": [task_doc(company_id, f"t{company_id[1]}")]})
+
+        async def read(budget):
+            deadline.start_request_deadline(budget)
+            return await firebase.get_tasks(MOCK_USER_ID)
+
+        async def run():
+            firestore_stub(handler)
+            hurried, patient = await asyncio.gather(read(0.1), read(10), return_exceptions=True)
+            return hurried, patient, await firebase.get_tasks(MOCK_USER_ID)
+
+        hurried, patient, later = asyncio.run(run())
+        assert isinstance(hurried, deadline.DeadlineExceeded)
+        assert sorted(task.id for task in patient) == ["t1", "t2"]
+        assert sorted(task.id for task in later) == ["t1", "t2"]
+
+    def test_failed_company_fails_the_whole_task_list(self, firestore_stub):
+        def handler(request):
+            if request.url.path.endswith("/companies"):
+                return httpx.Response(200, json={"documents": [company_doc("c1"), company_doc("c2")]})
+            if "/c2/" in request.url.path:
+                return httpx.Response(503, json={})
+            return httpx.Response(200, json={"documents": [task_doc("c1", "t1")]})
+
+        firestore_stub(handler)
+        with pytest.raises(Exception, match="Service unavailable"):
+            asyncio.run(firebase.get_tasks(MOCK_USER_ID))
+
+        assert f"tasks_{MOCK_USER_ID}" not in firebase._tasks_cache
+
+class TestWriteAwareCache:
+
+    def make_handler(self, calls):
+        def handler(request):
+            calls.append((request.method, request.url.path))
+            if request.method == "GET" and request.url.path.endswith("/companies"):
+                return httpx.Response(200, json={"documents": [company_doc("c1"), company_doc("c2")]})
+            if request.method == "GET" and request.url.path.endswith("/Task"):
+                company_id = request.url.path.split("/")[-2]
+                return httpx.Response(200, json={"documents": [task_doc(company_id, f"t-{company_id}")]})
+            return httpx.Response(200, json={})
+        return handler
+
+    def test_company_mutations_update_cached_list(self, firestore_stub):
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            await firebase.get_companies(MOCK_USER_ID)
+
+            created = firebase.parse_firestore_company(company_doc("c3", name="New Co"))
+            await firebase.create_company(MOCK_USER_ID, created)
+            renamed = firebase.parse_firestore_company(company_doc("c1", name="Renamed"))
+            await firebase.update_company(MOCK_USER_ID, "c1", renamed)
+            await firebase.delete_company(MOCK_USER_ID, "c2")
+
+            return await firebase.get_companies(MOCK_USER_ID)
+
+        companies = asyncio.run(run())
+        assert [(c.id, c.name) for c in companies] == [("c1", "Renamed"), ("c3", "New Co")]
+        assert [call for call in calls if call[0] == "GET"] == [("GET", calls[0][1])]
+
+    def test_task_mutations_update_cached_list(self, firestore_stub):
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            await firebase.get_tasks(MOCK_USER_ID)
+
+            new_task = firebase.parse_firestore_task(task_doc("c1", "t-new", title="New"))
+            await firebase.create_task(MOCK_USER_ID, new_task)
+            done = firebase.parse_firestore_task(task_doc("c1", "t-c1", completed=True))
+            await firebase.update_task(MOCK_USER_ID, "t-c1", done)
+            await firebase.delete_task(MOCK_USER_ID, "t-c2", "c2")
+
+            return await firebase.get_tasks(MOCK_USER_ID)
+
+        tasks = asyncio.run(run())
+        assert [(t.id, t.completed) for t in tasks] == [("t-c1", True), ("t-new", False)]
+
+    def test_deleting_company_drops_its_cached_tasks(self, firestore_stub):
+        async def run():
+            firestore_stub(self.make_handler([]))
+            await firebase.get_tasks(MOCK_USER_ID)
+            await firebase.delete_company(MOCK_USER_ID, "c1")
+            return await firebase.get_tasks(MOCK_USER_ID)
+
+        tasks = asyncio.run(run())
+        assert [t.companyId for t in tasks] == ["c2"]
+
+    def test_failed_write_leaves_cache_untouched(self, firestore_stub):
+        def handler(request):
+            if request.method == "GET":
+                return httpx.Response(200, json={"documents": [company_doc("c1")]})
+            return httpx.Response(500, json={})
+
+        async def run():
+            firestore_stub(handler)
+            await firebase.get_companies(MOCK_USER_ID)
+            assert not await firebase.delete_company(MOCK_USER_ID, "c1")
+            return await firebase.get_companies(MOCK_USER_ID)
+
+        assert [c.id for c in asyncio.run(run())] == ["c1"]
+
+    def test_read_racing_a_write_is_not_cached(self, firestore_stub):
+        calls = []
+
+        async def handler(request):
+            calls.append(request.method)
+            if request.method == "GET":
+                await asyncio.sleep(0.05)
+                return httpx.Response(200, json={"documents": [company_doc("c1")]})
+            return httpx.Response(200, json={})
+
+        async def run():
+            firestore_stub(handler)
+            read = asyncio.ensure_future(firebase.get_companies(MOCK_USER_ID))
+            await asyncio.sleep(0.01)
+            await firebase.delete_company(MOCK_USER_ID, "c1")
+            await read
+            await firebase.get_companies(MOCK_USER_ID)
+
+        asyncio.run(run())
+        assert calls.count("GET") == 2
+
+
+class TestStaleWhileRevalidate:
+
+    def test_stale_entry_served_while_one_refresh_runs(self, firestore_stub, monkeypatch):
+        monkeypatch.setattr(firebase, "_companies_cache", LRUCache(max_bytes=1_000_000, ttl=60, fresh_ttl=0))
+        calls = []
+
+        async def handler(request):
+            calls.append(request.method)
+            await asyncio.sleep(0.02)
+            return httpx.Response(200, json={"documents": [company_doc("c1", name="Fresh")]})
+
+        async def run():
+            firestore_stub(handler)
+            stale = [firebase.parse_firestore_company(company_doc("c1", name="Stale"))]
+            firebase._companies_cache.set(f"companies_{MOCK_USER_ID}", stale)
+
+            results = await asyncio.gather(*[firebase.get_companies(MOCK_USER_ID) for _ in range(3)])
+            assert all(result[0].name == "Stale" for result in results)
+            assert len(firebase._background_refreshes) == 1
+
+            await asyncio.gather(*list(firebase._background_refreshes.values()))
+            return firebase._companies_cache.get(f"companies_{MOCK_USER_ID}")
+
+        refreshed = asyncio.run(run())
+        assert calls == ["GET"]
+        assert refreshed[0].name == "Fresh"
+
+    def test_hard_expired_entry_waits_for_firestore(self, firestore_stub, monkeypatch):
+        monkeypatch.setattr(firebase, "_tasks_cache", LRUCache(max_bytes=1_000_000, ttl=0))
+
+        def handler(request):
+            if request.url.path.endswith("/companies"):
+                return httpx.Response(200, json={"documents": [company_doc("c1")]})
+            return httpx.Response(200, json={"documents": [task_doc("c1", "t-new")]})
+
+        async def run():
+            firestore_stub(handler)
+            firebase._tasks_cache.set(f"tasks_{MOCK_USER_ID}", [])
+            return await firebase.get_tasks(MOCK_USER_ID)
+
+        assert [task.id for task in asyncio.run(run())] == ["t-new"]
+
+
+class TestSharedSecondLevelCache:
+
+    def make_handler(self, calls):
+        def handler(request):
+            calls.append(request.method)
+            if request.method == "GET":
+                return httpx.Response(200, json={"documents": [company_doc("c1")]})
+            return httpx.Response(200, json={})
+        return handler
+
+    def test_other_worker_reads_from_l2(self, firestore_stub, monkeypatch, tmp_path):
+        monkeypatch.setattr(firebase, "_shared_cache", SharedCache(str(tmp_path / "l2.db"), ttl=60, retention=120))
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            await firebase.get_companies(MOCK_USER_ID)
+            firebase._companies_cache.clear()  # a fresh worker has an empty L1
+            return await firebase.get_companies(MOCK_USER_ID)
+
+        companies = asyncio.run(run())
+        assert calls == ["GET"]
+        assert companies[0].id == "c1"
+
+    def test_write_on_other_worker_invalidates_l1(self, firestore_stub, monkeypatch, tmp_path):
+        path = str(tmp_path / "l2.db")
+        monkeypatch.setattr(firebase, "_shared_cache", SharedCache(path, ttl=60, retention=120))
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            await firebase.get_companies(MOCK_USER_ID)
+            SharedCache(path, ttl=60, retention=120).invalidate(f"companies_{MOCK_USER_ID}")
+            await firebase.get_companies(MOCK_USER_ID)
+
+        asyncio.run(run())
+        assert calls == ["GET", "GET"]
+
+    def test_sqlite_calls_stay_off_the_event_loop(self, firestore_stub, monkeypatch, tmp_path):
+        import threading
+        shared = SharedCache(str(tmp_path / "l2.db"), ttl=60, retention=120)
+        monkeypatch.setattr(firebase, "_shared_cache", shared)
+        threads = set()
+        for method in ("version", "get", "put", "invalidate"):
+            original = getattr(shared, method)
+            monkeypatch.setattr(shared, method, lambda *args, _original=original: threads.add(threading.current_thread()) or _original(*args))
+
+        async def run():
+            firestore_stub(self.make_handler([]))
+            await firebase.get_companies(MOCK_USER_ID)
+            await firebase.delete_company(MOCK_USER_ID, "c1")
+            await firebase.get_companies(MOCK_USER_ID)
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(run())
+        assert threads and loop_thread not in threads
+
+    def test_own_write_keeps_l1_current(self, firestore_stub, monkeypatch, tmp_path):
+        monkeypatch.setattr(firebase, "_shared_cache", SharedCache(str(tmp_path / "l2.db"), ttl=60, retention=120))
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            await firebase.get_companies(MOCK_USER_ID)
+            await firebase.delete_company(MOCK_USER_ID, "c1")
+            return await firebase.get_companies(MOCK_USER_ID)
+
+        assert asyncio.run(run()) == []
+        assert calls == ["GET", "POST"]
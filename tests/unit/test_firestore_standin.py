@@ -0,0 +1,272 @@
+import pytest
+import asyncio
+import httpx
+from starlette.testclient import TestClient
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.api import etags
+from app.devtools.firestore_standin import LatencyModel, StandinConfig, create_app
+from app.services import firebase
+from tests.unit.test_counters import make_task
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc
+
+
+def use_standin(firestore_stub, config=None):
+    """Route firebase.py's client into a fresh stand-in; returns the stand-in"""
+    app = create_app(config)
+    transport = httpx.ASGITransport(app=app)
+
+    async def handler(request):
+        response = await transport.handle_async_request(request)
+        await response.aread()
+        return response
+
+    firestore_stub(handler)
+    return app.state.standin
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def seed_company(company_id="c1"):
+    company = firebase.parse_firestore_company(company_doc(company_id))
+    company.id = company_id
+    assert await firebase.create_company(MOCK_USER_ID, company)
+
+
+async def counters(company_id="c1"):
+    document = await firebase._get_document(f"users/{MOCK_USER_ID}/companies/{company_id}")
+    fields = document["fields"]
+    return firebase.get_int_value(fields, "taskCount"), firebase.get_int_value(fields, "openTaskCount")
+
+
+class TestAgainstFirebaseModule:
+
+    def test_task_writes_keep_counters_in_step(self, firestore_stub):
+        use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company()
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+            await firebase.create_task(MOCK_USER_ID, make_task("t2"))
+            after_create = await counters()
+            await firebase.update_task(MOCK_USER_ID, "t1", make_task("t1", completed=True))
+            after_update = await counters()
+            await firebase.delete_task(MOCK_USER_ID, "t2", "c1")
+            return after_create, after_update, await counters()
+
+        assert run(scenario()) == ((2, 2), (2, 1), (1, 0))
+
+    def test_moving_a_task_to_another_company(self, firestore_stub):
+        use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company("c1")
+            await seed_company("c2")
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+            moved = make_task("t1")
+            moved.companyId = "c2"
+            assert (await firebase.update_task(MOCK_USER_ID, "t1", moved)).companyId == "c2"
+            firebase.invalidate_user_caches(MOCK_USER_ID)
+            return await counters("c1"), await counters("c2"), await firebase.get_tasks(MOCK_USER_ID)
+
+        old, new, tasks = run(scenario())
+
+        assert old == (0, 0)
+        assert new == (1, 1)
+        assert [(task.id, task.companyId) for task in tasks] == [("t1", "c2")]
+
+    def test_create_of_existing_task_conflicts(self, firestore_stub):
+        use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company()
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+
+        with pytest.raises(Exception, match="Conflict"):
+            run(scenario())
+
+    def test_stale_update_time_fails_commit(self, firestore_stub):
+        use_standin(firestore_stub)
+        path = f"users/{MOCK_USER_ID}/companies/c1"
+
+        async def scenario():
+            await seed_company()
+            stale = await firebase._get_document(path)
+            await seed_company()
+            await firebase.commit([{
+                "update": {"name": firebase.document_name(path), "fields": {}},
+                "updateMask": {"fieldPaths": ["city"]},
+                "currentDocument": firebase._unchanged_since(stale)
+            }])
+
+        with pytest.raises(firebase.PreconditionFailed):
+            run(scenario())
+
+    def test_queries_counts_and_pages(self, firestore_stub):
+        use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company("c1")
+            await seed_company("c2")
+            for i in range(5):
+                task = make_task(f"t{i}", completed=i % 2 == 0)
+                task.companyId = "c1" if i < 3 else "c2"
+                task.title = f"Invoice {i}" if i != 4 else "Payroll"
+                await firebase.create_task(MOCK_USER_ID, task)
+
+            open_tasks = await firebase.query_tasks(MOCK_USER_ID, completed=False)
+            prefixed = await firebase.query_tasks(MOCK_USER_ID, title_prefix="Inv", company_id="c2")
+            count = await firebase.count_tasks(MOCK_USER_ID, company_id="c1")
+            seen, cursor = [], None
+            while True:
+                page, cursor = await firebase.get_tasks_page(MOCK_USER_ID, 2, cursor)
+                seen += [task.id for task in page]
+                if cursor is None:
+                    break
+            return open_tasks, prefixed, count, seen
+
+        open_tasks, prefixed, count, seen = run(scenario())
+
+        assert sorted(task.id for task in open_tasks) == ["t1", "t3"]
+        assert [task.id for task in prefixed] == ["t3"]
+        assert count == 3
+        assert sorted(seen) == [f"t{i}" for i in range(5)]
+
+    def test_if_match_precondition_against_stored_company(self, firestore_stub):
+        use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company()
+            read = await firebase.get_company_by_id(MOCK_USER_ID, "c1")
+            renamed = read.model_copy(update={"name": "Renamed"})
+            assert await firebase.update_company(MOCK_USER_ID, "c1", renamed, precondition=lambda current: current == read)
+            cached = await firebase.get_company_by_id(MOCK_USER_ID, "c1")
+            firebase.invalidate_user_caches(MOCK_USER_ID)
+            assert await firebase.get_company_by_id(MOCK_USER_ID, "c1") == cached
+            await firebase.update_company(MOCK_USER_ID, "c1", renamed, precondition=lambda current: current == read)
+
+        with pytest.raises(firebase.PreconditionFailed):
+            run(scenario())
+
+    def test_update_of_uncached_company_drops_the_list(self, firestore_stub):
+        use_standin(firestore_stub)
+        cache_key = f"companies_{MOCK_USER_ID}"
+
+        async def scenario():
+            await seed_company()
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+            await firebase.get_companies(MOCK_USER_ID)
+            # A cached list that does not know c1, so its counters are unknown
+            firebase._companies_cache.update(cache_key, lambda companies: [])
+            company = firebase.parse_firestore_company(company_doc("c1", name="Renamed"))
+            await firebase.update_company(MOCK_USER_ID, "c1", company)
+            assert cache_key not in firebase._companies_cache
+            return await firebase.get_companies(MOCK_USER_ID)
+
+        [company] = run(scenario())
+        assert (company.name, company.taskCount, company.openTaskCount) == ("Renamed", 1, 1)
+
+    def test_if_match_company_writes_are_one_commit(self, firestore_stub):
+        standin = use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company()
+            read = await firebase.get_company_by_id(MOCK_USER_ID, "c1")
+            tag = etags.etag_of(read)
+            standin.calls.clear()
+            stored = await firebase.update_company(MOCK_USER_ID, "c1", read.model_copy(update={"name": "Renamed"}), etags.if_match(tag))
+            assert dict(standin.calls) == {"commit": 1}
+            with pytest.raises(firebase.PreconditionFailed):
+                await firebase.delete_company(MOCK_USER_ID, "c1", etags.if_match(tag))
+            standin.calls.clear()
+            assert await firebase.delete_company(MOCK_USER_ID, "c1", etags.if_match(etags.etag_of(stored)))
+            assert dict(standin.calls) == {"commit": 1}
+            firebase.invalidate_user_caches(MOCK_USER_ID)
+            return await firebase.get_companies(MOCK_USER_ID)
+
+        assert run(scenario()) == []
+
+    def test_if_match_move_is_checked_against_the_stored_task(self, firestore_stub):
+        use_standin(firestore_stub)
+
+        async def scenario():
+            await seed_company("c1")
+            await seed_company("c2")
+            await firebase.create_task(MOCK_USER_ID, make_task("t1"))
+            read = await firebase.get_task_by_id(MOCK_USER_ID, "t1")
+            precondition = etags.if_match(etags.etag_of(read))
+            moved = read.model_copy(update={"companyId": "c2"})
+            stored = await firebase.update_task(MOCK_USER_ID, "t1", moved, precondition)
+            assert stored == await firebase.get_task_by_id(MOCK_USER_ID, "t1")
+            with pytest.raises(firebase.PreconditionFailed):
+                await firebase.update_task(MOCK_USER_ID, "t1", read, precondition)
+            # Deleting with the caller's old company still finds the moved task
+            assert await firebase.delete_task(MOCK_USER_ID, "t1", "c1", etags.if_match(etags.etag_of(stored))) is True
+            return await counters("c1"), await counters("c2")
+
+        assert run(scenario()) == ((0, 0), (0, 0))
+
+    def test_company_task_cleanup_uses_batch_write(self, firestore_stub):
+        standin = use_standin(firestore_stub)
+        progress = {}
+
+        async def scenario():
+            await seed_company()
+            for i in range(3):
+                await firebase.create_task(MOCK_USER_ID, make_task(f"t{i}"))
+            await firebase.delete_company(MOCK_USER_ID, "c1")
+            await firebase.delete_company_tasks(MOCK_USER_ID, "c1", progress)
+
+        run(scenario())
+
+        assert progress["deleted"] == 3
+        assert [name.rsplit("/", 2)[1] for name in standin.documents] == ["deletions"]
+        assert standin.calls["batchWrite"] == 1
+
+
+class TestFaultInjection:
+
+    def test_error_rate_one_fails_every_call(self, firestore_stub):
+        use_standin(firestore_stub, StandinConfig(error_rate=1.0, error_statuses=(429,)))
+
+        with pytest.raises(Exception, match="Rate limit exceeded"):
+            run(firebase.count_companies(MOCK_USER_ID))
+
+    def test_list_page_size_cap(self):
+        client = TestClient(create_app(StandinConfig(page_size=2)))
+        base = "/v1/projects/p/databases/(default)/documents/users/u/companies"
+        for company_id in ("a", "b", "c"):
+            client.patch(f"{base}/{company_id}", json={"fields": {"name": {"stringValue": company_id}}})
+
+        first = client.get(base).json()
+        second = client.get(base, params={"pageToken": first["nextPageToken"]}).json()
+
+        assert [doc["name"].rsplit("/", 1)[1] for doc in first["documents"]] == ["a", "b"]
+        assert [doc["name"].rsplit("/", 1)[1] for doc in second["documents"]] == ["c"]
+        assert "nextPageToken" not in second
+
+    def test_latency_specs(self):
+        import random
+        assert LatencyModel("fixed:25", random.Random(1)).sample() == 0.025
+        assert 0.01 <= LatencyModel("uniform:10:20", random.Random(1)).sample() <= 0.02
+        with pytest.raises(ValueError):
+            LatencyModel("gamma:1", random.Random(1))
+
+    def test_token_endpoint_and_stats(self):
+        client = TestClient(create_app())
+
+        token = client.post("/token", data={"grant_type": "x", "assertion": "y"}).json()
+
+        assert token["access_token"]
+        assert client.get("/standin/stats").json()["calls"] == {"token": 1}
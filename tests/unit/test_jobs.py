@@ -0,0 +1,190 @@
+import pytest
+import asyncio
+import json
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.services import firebase, jobs
+from app.services.job_store import JobStore
+from app.core import deadline
+from tests.unit.test_firebase import MOCK_USER_ID
+
+client = TestClient(app)
+
+MOCK_TOKEN = "mock-firebase-token"
+
+
+def task_store_stub(firestore_stub, count, fail_every=0):
+    """In-memory Task subcollection answering the paging query and batchWrite"""
+    prefix = f"projects/p/databases/(default)/documents/users/{MOCK_USER_ID}/companies/c1/Task/"
+    names = [f"{prefix}t{i:05d}" for i in range(count)]
+    batches = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        if request.url.path.endswith(":runQuery"):
+            query = body["structuredQuery"]
+            remaining = sorted(names)
+            if "startAt" in query:
+                after = query["startAt"]["values"][0]["referenceValue"]
+                remaining = [name for name in remaining if name > after]
+            return httpx.Response(200, json=[{"document": {"name": name}} for name in remaining[:query["limit"]]])
+        writes = body["writes"]
+        batches.append(len(writes))
+        statuses = []
+        for index, write in enumerate(writes):
+            if fail_every and index % fail_every == 0:
+                statuses.append({"code": 10, "message": "ABORTED"})
+            else:
+                names.remove(write["delete"])
+                statuses.append({})
+        return httpx.Response(200, json={"writeResults": [{} for _ in writes], "status": statuses})
+
+    firestore_stub(handler)
+    return names, batches
+
+
+class TestCascadeDelete:
+
+    def test_deletes_subcollection_in_batches_of_500(self, firestore_stub):
+        names, batches = task_store_stub(firestore_stub, 1200)
+        progress = {}
+
+        asyncio.run(firebase.delete_company_tasks(MOCK_USER_ID, "c1", progress))
+
+        assert names == []
+        assert batches == [500, 500, 200]
+        assert progress == {"deleted": 1200, "failed": 0, "batches": 3}
+
+    def test_failed_deletes_are_counted_not_retried_forever(self, firestore_stub):
+        names, batches = task_store_stub(firestore_stub, 10, fail_every=5)
+        progress = {}
+
+        asyncio.run(firebase.delete_company_tasks(MOCK_USER_ID, "c1", progress))
+
+        assert len(names) == 2
+        assert progress == {"deleted": 8, "failed": 2, "batches": 1}
+
+
+class TestJobs:
+
+    def test_job_runs_outside_request_deadline(self):
+        seen = {}
+
+        async def work(job):
+            seen["deadline"] = deadline.get_request_deadline()
+            job.progress["done"] = True
+
+        async def run():
+            deadline.start_request_deadline(0.01)
+            job = jobs.start_job("test", MOCK_USER_ID, work, x=1)
+            assert job.status == "queued"
+            await job.task
+            return job
+
+        job = asyncio.run(run())
+        assert job.status == "completed"
+        assert seen["deadline"] is None
+        assert job.to_dict()["progress"] == {"done": True}
+
+    def test_failure_is_recorded(self):
+        async def work(job):
+            raise Exception("boom")
+
+        async def run():
+            job = jobs.start_job("test", MOCK_USER_ID, work)
+            await job.task
+            return job
+
+        job = asyncio.run(run())
+        assert job.status == "failed"
+        assert job.error == "boom"
+
+    def test_jobs_are_private_to_their_user(self):
+        async def run():
+            job = jobs.start_job("test", MOCK_USER_ID, AsyncMock())
+            await job.task
+            return job
+
+        job = asyncio.run(run())
+        assert jobs.get_job(job.id, "someone-else") is None
+        response = client.get(f"/jobs/{job.id}", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 200
+        assert response.json()["status"] == "completed"
+        assert client.get("/jobs/missing", headers={"Authorization": f"Bearer {MOCK_TOKEN}"}).status_code == 404
+
+    @patch('app.services.firebase.delete_company', new_callable=AsyncMock, return_value=True)
+    @patch('app.services.firebase.get_company_by_id', new_callable=AsyncMock)
+    def test_delete_company_queues_cleanup(self, mock_get, mock_delete):
+        with patch.object(jobs, "start_job") as mock_start:
+            mock_start.return_value.id = "job-1"
+            response = client.delete("/delete_company/c1", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+
+        assert response.status_code == 200
+        assert response.json()["cleanupJobId"] == "job-1"
+        assert mock_start.call_args.args[:2] == ("delete_company_tasks", MOCK_USER_ID)
+        assert mock_start.call_args.kwargs == {"companyId": "c1"}
+
+
+class TestSharedJobStore:
+
+    @pytest.fixture(autouse=True)
+    def store(self, tmp_path, monkeypatch):
+        store = JobStore(str(tmp_path / "jobs.db"))
+        monkeypatch.setattr(jobs, "_store", store)
+        monkeypatch.setattr(jobs, "_jobs", {})
+        yield store
+        store.close()
+
+    def test_other_workers_can_poll_a_job(self, store):
+        async def run():
+            job = jobs.start_job("test", MOCK_USER_ID, AsyncMock(), x=1)
+            await job.task
+            return job
+
+        job = asyncio.run(run())
+        # A worker that did not queue the job only has the store
+        jobs._jobs.clear()
+        assert asyncio.run(jobs.find_job(job.id, "someone-else")) is None
+        response = client.get(f"/jobs/{job.id}", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 200
+        assert response.json()["status"] == "completed"
+        assert response.json()["params"] == {"x": 1}
+
+    def test_unfinished_jobs_of_a_dead_worker_are_resumed(self, store, monkeypatch):
+        runner = AsyncMock()
+        monkeypatch.setattr(jobs, "_runners", {"delete_company_tasks": runner})
+        orphan = jobs.Job("delete_company_tasks", MOCK_USER_ID, {"companyId": "c1"})
+        orphan.status = "running"
+        unknown = jobs.Job("test", MOCK_USER_ID, {})
+        store.save(orphan.to_record(), 0)
+        store.save(unknown.to_record(), 0)
+
+        async def run():
+            resumed = await jobs.resume_stale_jobs()
+            for job in resumed:
+                await job.task
+            # Claimed jobs are not handed out twice
+            assert await jobs.resume_stale_jobs() == []
+            return resumed
+
+        resumed = asyncio.run(run())
+        assert [job.id for job in resumed] == [orphan.id]
+        assert runner.await_args.args[0].params == {"companyId": "c1"}
+        assert store.load(orphan.id)["status"] == "completed"
+        assert store.load(unknown.id)["status"] == "failed"
+
+    def test_cleanup_jobs_are_resumable(self):
+        from app.api import handlers
+        assert jobs._runners["delete_company_tasks"] is handlers._delete_company_tasks
+        assert jobs._runners["repair_task_counters"] is handlers._repair_task_counters
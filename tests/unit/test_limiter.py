@@ -0,0 +1,142 @@
+import pytest
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.core import deadline
+from app.services.limiter import AdaptiveLimiter
+from app.services import firebase
+
+
+class TestAdaptiveLimiter:
+
+    def test_grows_additively_on_fast_responses(self):
+        limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=100, latency_target=1.0)
+
+        async def run():
+            for _ in range(8):
+                await limiter.acquire()
+                limiter.release(0.01)
+
+        asyncio.run(run())
+        assert 5 < limiter.limit < 7
+
+    def test_congestion_cuts_limit_once_per_window(self):
+        limiter = AdaptiveLimiter(initial=20, min_limit=2, max_limit=100, latency_target=1.0)
+
+        async def run():
+            for _ in range(5):
+                await limiter.acquire()
+            for _ in range(5):
+                limiter.release(0.5, congested=True)
+
+        asyncio.run(run())
+        assert limiter.limit == pytest.approx(14.0)
+        assert limiter.stats()["congested"] == 5
+
+    def test_limit_never_drops_below_floor(self):
+        limiter = AdaptiveLimiter(initial=4, min_limit=3, max_limit=100, latency_target=0.1)
+
+        async def run():
+            for _ in range(10):
+                await limiter.acquire()
+                limiter._last_decrease = 0.0
+                limiter.release(5.0)
+
+        asyncio.run(run())
+        assert limiter.limit == 3
+
+    def test_waiters_queue_beyond_limit(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=2, latency_target=1.0)
+
+        async def run():
+            await limiter.acquire()
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            assert not waiter.done()
+            assert limiter.stats()["queued"] == 1
+            limiter.release(0.01)
+            await waiter
+            assert limiter.inflight == 2
+
+        asyncio.run(run())
+
+    def test_cancelled_waiter_does_not_leak_slot(self):
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1, latency_target=1.0)
+
+        async def run():
+            await limiter.acquire()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(limiter.acquire(), 0.01)
+            limiter.release(0.01)
+            assert limiter.inflight == 0
+            await asyncio.wait_for(limiter.acquire(), 0.1)
+
+        asyncio.run(run())
+
+
+class TestUpstreamLimiting:
+
+    def test_throttled_response_lowers_upstream_limit(self, firestore_stub, monkeypatch):
+        limiter = AdaptiveLimiter(initial=10, min_limit=1, max_limit=100, latency_target=1.0)
+        monkeypatch.setattr(firebase, "_upstream_limiter", limiter)
+        firestore_stub(lambda request: httpx.Response(429, json={}))
+
+        async def run():
+            return await firebase._request("GET", "https://firestore.googleapis.com/v1/x")
+
+        response = asyncio.run(run())
+        assert response.status_code == 429
+        assert limiter.limit == pytest.approx(7.0)
+        assert limiter.inflight == 0
+
+    def test_expired_deadline_leaves_limit_alone(self, firestore_stub, monkeypatch):
+        limiter = AdaptiveLimiter(initial=32, min_limit=1, max_limit=100, latency_target=1.0)
+        monkeypatch.setattr(firebase, "_upstream_limiter", limiter)
+        # Budget left when queuing for a slot, gone once the slot is granted
+        monkeypatch.setattr(firebase, "remaining_time", MagicMock(side_effect=[5.0, deadline.DeadlineExceeded()]))
+        calls = []
+        firestore_stub(lambda request: calls.append(request) or httpx.Response(200, json={}))
+
+        with pytest.raises(deadline.DeadlineExceeded):
+            asyncio.run(firebase._request("GET", "https://firestore.googleapis.com/v1/x"))
+        assert calls == []
+        assert limiter.limit == 32
+        assert limiter.inflight == 0
+
+    @pytest.mark.parametrize("budget, congested", [(1.0, False), (10.0, True)])
+    def test_only_upstream_timeouts_are_congestion(self, firestore_stub, monkeypatch, budget, congested):
+        limiter = AdaptiveLimiter(initial=10, min_limit=1, max_limit=100, latency_target=1.0)
+        monkeypatch.setattr(firebase, "_upstream_limiter", limiter)
+
+        def handler(request):
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        firestore_stub(handler)
+
+        async def run():
+            deadline.start_request_deadline(budget)
+            await firebase._request("GET", "https://firestore.googleapis.com/v1/x")
+
+        with pytest.raises(httpx.ReadTimeout):
+            asyncio.run(run())
+        assert limiter.stats()["congested"] == (1 if congested else 0)
+        assert limiter.limit == (pytest.approx(7.0) if congested else 10)
+
+    def test_upstream_stats_requires_auth(self):
+        client = TestClient(app)
+        assert client.get("/upstream_stats").status_code == 401
+        response = client.get("/upstream_stats", headers={"Authorization": "Bearer mock-firebase-token"})
+        assert response.status_code == 200
+        assert "taskWriteBehind" in response.json()
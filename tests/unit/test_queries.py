@@ -0,0 +1,241 @@
+import pytest
+import asyncio
+import json
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.services import firebase
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc, task_doc
+
+client = TestClient(app)
+
+MOCK_TOKEN = "mock-firebase-token"
+
+
+def query_stub(firestore_stub, documents):
+    """Answer runQuery with `documents`, recording each request"""
+    requests = []
+
+    def handler(request):
+        requests.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json=[{"document": doc} for doc in documents] + [{"readTime": "2024-01-01T00:00:00Z"}])
+
+    firestore_stub(handler)
+    return requests
+
+
+class TestTaskFilters:
+
+    def test_filters_are_pushed_into_where_clause(self, firestore_stub):
+        requests = query_stub(firestore_stub, [task_doc("c1", "t1", title="Invoice")])
+
+        tasks = asyncio.run(firebase.query_tasks(MOCK_USER_ID, completed=False, title_prefix="Inv"))
+
+        assert [task.id for task in tasks] == ["t1"]
+        path, body = requests[0]
+        assert path.endswith(f"/documents/users/{MOCK_USER_ID}:runQuery")
+        query = body["structuredQuery"]
+        assert query["from"] == [{"collectionId": "Task", "allDescendants": True}]
+        filters = query["where"]["compositeFilter"]["filters"]
+        assert filters[0]["fieldFilter"] == {
+            "field": {"fieldPath": "completed"}, "op": "EQUAL", "value": {"booleanValue": False}
+        }
+        assert [f["fieldFilter"]["op"] for f in filters[1:]] == ["GREATER_THAN_OR_EQUAL", "LESS_THAN"]
+        assert filters[2]["fieldFilter"]["value"]["stringValue"] == "Inv"
+
+    def test_company_filter_queries_that_company_only(self, firestore_stub):
+        requests = query_stub(firestore_stub, [])
+
+        asyncio.run(firebase.query_tasks(MOCK_USER_ID, company_id="c1"))
+
+        path, body = requests[0]
+        assert path.endswith(f"/documents/users/{MOCK_USER_ID}/companies/c1:runQuery")
+        assert body["structuredQuery"] == {"from": [{"collectionId": "Task"}]}
+
+    def test_query_error_is_raised(self, firestore_stub):
+        firestore_stub(lambda request: httpx.Response(400, json={"error": {"status": "FAILED_PRECONDITION"}}))
+
+        with pytest.raises(Exception, match="Database error"):
+            asyncio.run(firebase.query_tasks(MOCK_USER_ID, completed=True))
+
+    @patch('app.api.handlers.get_tasks')
+    def test_endpoint_passes_filters(self, mock_get_tasks):
+        mock_get_tasks.return_value = []
+        response = client.get(
+            "/getall_tasks?completed=false&companyId=c1&titlePrefix=Inv",
+            headers={"Authorization": f"Bearer {MOCK_TOKEN}"}
+        )
+        assert response.status_code == 200
+        mock_get_tasks.assert_called_once_with(MOCK_USER_ID, completed=False, company_id="c1", title_prefix="Inv")
+
+    @patch('app.services.firebase.query_tasks')
+    def test_invalid_company_id_rejected(self, mock_query):
+        response = client.get("/getall_tasks?companyId=a/b", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 400
+        mock_query.assert_not_called()
+
+
+class TestCursorPagination:
+
+    def test_first_page_returns_cursor_when_more_exist(self, firestore_stub):
+        docs = [task_doc("c1", f"t{i}") for i in range(3)]
+        requests = query_stub(firestore_stub, docs)
+
+        tasks, next_cursor = asyncio.run(firebase.get_tasks_page(MOCK_USER_ID, 2))
+
+        assert [task.id for task in tasks] == ["t0", "t1"]
+        query = requests[0][1]["structuredQuery"]
+        assert query["limit"] == 3
+        assert query["orderBy"] == [{"field": {"fieldPath": "__name__"}, "direction": "ASCENDING"}]
+        assert "startAt" not in query
+        assert firebase.decode_cursor(next_cursor, ["__name__"]) == [{"referenceValue": docs[1]["name"]}]
+
+    def test_cursor_resumes_after_last_item(self, firestore_stub):
+        requests = query_stub(firestore_stub, [task_doc("c1", "t2")])
+        cursor = firebase.encode_cursor(["__name__"], [{"referenceValue": "last-doc"}])
+
+        tasks, next_cursor = asyncio.run(firebase.get_tasks_page(MOCK_USER_ID, 2, cursor))
+
+        assert [task.id for task in tasks] == ["t2"]
+        assert next_cursor is None
+        query = requests[0][1]["structuredQuery"]
+        assert query["startAt"] == {"values": [{"referenceValue": "last-doc"}], "before": False}
+
+    def test_title_prefix_orders_by_title_first(self, firestore_stub):
+        requests = query_stub(firestore_stub, [task_doc("c1", "t1", title="Inv 1"), task_doc("c1", "t2", title="Inv 2")])
+
+        _, next_cursor = asyncio.run(firebase.get_tasks_page(MOCK_USER_ID, 1, title_prefix="Inv"))
+
+        query = requests[0][1]["structuredQuery"]
+        assert [order["field"]["fieldPath"] for order in query["orderBy"]] == ["title", "__name__"]
+        assert firebase.decode_cursor(next_cursor, ["title", "__name__"])[0] == {"stringValue": "Inv 1"}
+
+    def test_cursor_from_other_ordering_rejected(self):
+        cursor = firebase.encode_cursor(["__name__"], [{"referenceValue": "x"}])
+        with pytest.raises(ValueError):
+            firebase.decode_cursor(cursor, ["title", "__name__"])
+        with pytest.raises(ValueError):
+            firebase.decode_cursor("not-a-cursor", ["__name__"])
+
+    def test_companies_endpoint_returns_page(self, firestore_stub):
+        query_stub(firestore_stub, [company_doc("c1"), company_doc("c2")])
+
+        response = client.get("/getall_companies?limit=1", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert [company["id"] for company in body["items"]] == ["c1"]
+        assert body["nextCursor"]
+
+    def test_invalid_cursor_is_400(self, firestore_stub):
+        query_stub(firestore_stub, [])
+        response = client.get("/getall_tasks?cursor=garbage", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 400
+
+    def test_limit_out_of_range_is_422(self):
+        response = client.get("/getall_tasks?limit=0", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 422
+
+
+def count_stub(firestore_stub, count_for):
+    """Answer runAggregationQuery with count_for(structured query), recording each request"""
+    requests = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        query = body["structuredAggregationQuery"]["structuredQuery"]
+        requests.append((request.url.path, query))
+        count = count_for(request.url.path, query)
+        return httpx.Response(200, json=[{"result": {"aggregateFields": {"count": {"integerValue": str(count)}}}}])
+
+    firestore_stub(handler)
+    return requests
+
+
+class TestCounts:
+
+    def test_count_uses_aggregation_and_is_cached(self, firestore_stub):
+        requests = count_stub(firestore_stub, lambda path, query: 7)
+
+        async def run():
+            first = await firebase.count_tasks(MOCK_USER_ID, completed=False)
+            second = await firebase.count_tasks(MOCK_USER_ID, completed=False)
+            return first, second
+
+        assert asyncio.run(run()) == (7, 7)
+        assert len(requests) == 1
+        path, query = requests[0]
+        assert path.endswith(f"/documents/users/{MOCK_USER_ID}:runAggregationQuery")
+        assert query["where"]["fieldFilter"]["field"]["fieldPath"] == "completed"
+
+    def test_own_write_drops_cached_counts(self, firestore_stub):
+        requests = count_stub(firestore_stub, lambda path, query: len(requests))
+
+        async def run():
+            first = await firebase.count_companies(MOCK_USER_ID)
+            firebase._apply_company_write(MOCK_USER_ID, "c9")
+            return first, await firebase.count_companies(MOCK_USER_ID)
+
+        assert asyncio.run(run()) == (1, 2)
+
+    def test_summary_counts_per_company(self, firestore_stub):
+        def handler(request):
+            if request.url.path.endswith(":runAggregationQuery"):
+                query = json.loads(request.content)["structuredAggregationQuery"]["structuredQuery"]
+                completed = query["where"]["fieldFilter"]["value"]["booleanValue"]
+                company = request.url.path.split("/companies/")[1].split(":")[0]
+                count = {("c1", False): 2, ("c1", True): 1, ("c2", False): 0, ("c2", True): 4}[(company, completed)]
+                return httpx.Response(200, json=[{"result": {"aggregateFields": {"count": {"integerValue": str(count)}}}}])
+            return httpx.Response(200, json={"documents": [company_doc("c1"), company_doc("c2")]})
+
+        firestore_stub(handler)
+        summary = asyncio.run(firebase.get_task_summary(MOCK_USER_ID))
+
+        assert summary == {
+            "companies": 2,
+            "openTasks": 2,
+            "completedTasks": 5,
+            "byCompany": {"c1": {"open": 2, "completed": 1}, "c2": {"open": 0, "completed": 4}},
+        }
+
+    def test_summary_from_cached_tasks_makes_no_count_calls(self, firestore_stub):
+        requests = count_stub(firestore_stub, lambda path, query: 0)
+        companies = [firebase.parse_firestore_company(company_doc("c1"))]
+        tasks = [firebase.parse_firestore_task(task_doc("c1", "t1")), firebase.parse_firestore_task(task_doc("c1", "t2", completed=True))]
+        firebase._companies_cache.set(f"companies_{MOCK_USER_ID}", companies)
+        firebase._tasks_cache.set(f"tasks_{MOCK_USER_ID}", tasks)
+
+        summary = asyncio.run(firebase.get_task_summary(MOCK_USER_ID))
+
+        assert summary["byCompany"] == {"c1": {"open": 1, "completed": 1}}
+        assert requests == []
+
+    def test_summary_reads_company_counters(self, firestore_stub):
+        requests = count_stub(firestore_stub, lambda path, query: 0)
+        counted = company_doc("c1")
+        counted["fields"].update(taskCount={"integerValue": "5"}, openTaskCount={"integerValue": "2"})
+        firebase._companies_cache.set(f"companies_{MOCK_USER_ID}", [firebase.parse_firestore_company(counted)])
+
+        summary = asyncio.run(firebase.get_task_summary(MOCK_USER_ID))
+
+        assert summary["byCompany"] == {"c1": {"open": 2, "completed": 3}}
+        assert summary["openTasks"] == 2 and summary["completedTasks"] == 3
+        assert requests == []
+
+    @patch('app.api.handlers.count_tasks')
+    def test_count_tasks_endpoint(self, mock_count):
+        mock_count.return_value = {"count": 3}
+        response = client.get("/count_tasks?completed=true&companyId=c1", headers={"Authorization": f"Bearer {MOCK_TOKEN}"})
+        assert response.status_code == 200
+        assert response.json() == {"count": 3}
+        mock_count.assert_called_once_with(MOCK_USER_ID, completed=True, company_id="c1")
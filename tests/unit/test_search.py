@@ -0,0 +1,105 @@
+import asyncio
+import httpx
+
+from app.models import Task
+from app.services import firebase
+from app.services.search import SearchIndex, company_terms, tokenize
+from app.services.snapshot import UserSnapshot
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc, task_doc
+
+
+def make_company(company_id, name, city="San Francisco"):
+    return firebase.parse_firestore_company(company_doc(company_id, name=name)).model_copy(update={"city": city})
+
+
+class TestSearchIndex:
+
+    def test_tokenize_and_ein_digits(self):
+        assert tokenize("Acme, Inc.") == ["acme", "inc"]
+        terms = company_terms(make_company("c1", "Acme"))
+        assert {"acme", "san", "francisco", "john", "doe", "12", "3456789", "123456789"} <= terms
+
+    def test_every_word_must_match_as_prefix(self):
+        index = SearchIndex()
+        index.put(("company", "c1"), {"acme", "rockets"})
+        index.put(("company", "c2"), {"acme", "robots"})
+        index.put(("task", "t1"), {"file", "taxes"})
+
+        assert index.search("ac") == [("company", "c1"), ("company", "c2")]
+        assert index.search("acme rob") == [("company", "c2")]
+        assert index.search("zzz") == []
+        assert index.search("  ") == []
+
+    def test_exact_words_rank_first(self):
+        index = SearchIndex()
+        index.put(("task", "t1"), {"taxes"})
+        index.put(("task", "t2"), {"tax"})
+
+        assert index.search("tax") == [("task", "t2"), ("task", "t1")]
+
+    def test_updates_replace_terms_and_prune(self):
+        index = SearchIndex()
+        index.put(("task", "t1"), {"draft"})
+        index.put(("task", "t1"), {"final"})
+
+        assert index.search("dra") == []
+        assert index.search("fin") == [("task", "t1")]
+        index.remove(("task", "t1"))
+        assert index.search("fin") == []
+        assert index._root.children == {}
+        assert len(index) == 0
+
+    def test_size_returns_to_empty_after_removals(self):
+        index = SearchIndex()
+        empty = index.approximate_size()
+        index.put(("task", "t1"), {"draft", "finance"})
+        index.put(("task", "t2"), {"draft"})
+        assert index.approximate_size() > empty
+        index.remove(("task", "t1"))
+        index.remove(("task", "t2"))
+        assert index.approximate_size() == empty
+
+
+class TestSnapshotSearch:
+
+    def make_snapshot(self):
+        companies = [make_company("c1", "Acme Rockets"), make_company("c2", "Blue Sky", city="Austin")]
+        tasks = [Task(id="t1", companyId="c1", title="Quarterly filing"), Task(id="t2", companyId="c2", title="Payroll")]
+        return UserSnapshot(companies, tasks)
+
+    def test_search_returns_models(self):
+        snapshot = self.make_snapshot()
+        result = snapshot.search("aus", 20)
+        assert [company.id for company in result["companies"]] == ["c2"]
+        assert snapshot.search("quart fil", 20)["tasks"][0].id == "t1"
+
+    def test_index_follows_writes(self):
+        snapshot = self.make_snapshot()
+        assert snapshot.search("acme", 20)["companies"]
+
+        snapshot.apply_company("c3", make_company("c3", "Acme Labs"))
+        snapshot.apply_task("t1", Task(id="t1", companyId="c1", title="Annual report"))
+        assert [company.id for company in snapshot.search("acme", 20)["companies"]] == ["c1", "c3"]
+        assert snapshot.search("quarterly", 20)["tasks"] == []
+
+        snapshot.apply_company("c1", None)
+        assert [company.id for company in snapshot.search("acme", 20)["companies"]] == ["c3"]
+        assert snapshot.search("annual", 20)["tasks"] == []
+
+    def test_search_builds_index_lazily_from_firestore(self, firestore_stub):
+        def handler(request):
+            if request.url.path.endswith("/Task"):
+                return httpx.Response(200, json={"documents": [task_doc("c1", "t1", title="Renew license")]})
+            return httpx.Response(200, json={"documents": [company_doc("c1", name="Acme")]})
+
+        firestore_stub(handler)
+
+        async def run():
+            first = await firebase.search(MOCK_USER_ID, "ren")
+            await firebase.create_company(MOCK_USER_ID, make_company("c2", "Acme Two"))
+            second = await firebase.search(MOCK_USER_ID, "acme two")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert [task.id for task in first["tasks"]] == ["t1"]
+        assert [company.id for company in second["companies"]] == ["c2"]
@@ -0,0 +1,44 @@
+from app.services.shared_cache import SharedCache
+
+
+def make_cache(tmp_path, ttl=60):
+    return SharedCache(str(tmp_path / "cache.db"), ttl=ttl, retention=120)
+
+
+class TestSharedCache:
+
+    def test_put_then_get_across_connections(self, tmp_path):
+        writer = make_cache(tmp_path)
+        reader = make_cache(tmp_path)
+        assert writer.put("k", b"payload", expected_version=0)
+        assert reader.get("k") == (0, b"payload")
+
+    def test_uses_wal_journal(self, tmp_path):
+        cache = make_cache(tmp_path)
+        cache.version("k")
+        assert cache._connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_invalidate_bumps_version_and_drops_payload(self, tmp_path):
+        cache = make_cache(tmp_path)
+        cache.put("k", b"payload", expected_version=0)
+        assert cache.invalidate("k") == (0, 1)
+        assert cache.get("k") == (1, None)
+        assert cache.version("k") == 1
+
+    def test_put_rejected_after_concurrent_write(self, tmp_path):
+        cache = make_cache(tmp_path)
+        version, _ = cache.get("k")
+        make_cache(tmp_path).invalidate("k")
+        assert not cache.put("k", b"stale", expected_version=version)
+        assert cache.get("k") == (1, None)
+
+    def test_expired_payload_is_a_miss(self, tmp_path):
+        cache = make_cache(tmp_path, ttl=0)
+        cache.put("k", b"payload", expected_version=0)
+        assert cache.get("k") == (0, None)
+
+    def test_sweep_forgets_untouched_keys(self, tmp_path):
+        cache = SharedCache(str(tmp_path / "cache.db"), ttl=60, retention=-1)
+        cache.invalidate("k")
+        assert cache.sweep() == 1
+        assert cache.version("k") == 0
@@ -0,0 +1,133 @@
+import asyncio
+import httpx
+
+from app.models import Task
+from app.services import firebase
+from app.services.snapshot import SnapshotStore, UserSnapshot
+from tests.unit.test_firebase import MOCK_USER_ID, company_doc, task_doc
+
+
+def make_snapshot():
+    companies = [firebase.parse_firestore_company(company_doc(cid, name=f"Co {cid}")) for cid in ("c1", "c2")]
+    tasks = [
+        Task(id="t1", companyId="c1", title="Open"),
+        Task(id="t2", companyId="c1", title="Done", completed=True),
+        Task(id="t3", companyId="c2", title="Other"),
+    ]
+    return UserSnapshot(companies, tasks)
+
+
+class TestUserSnapshot:
+
+    def test_indexes_by_id(self):
+        snapshot = make_snapshot()
+        assert set(snapshot.companies) == {"c1", "c2"}
+        assert snapshot.task_company == {"t1": "c1", "t2": "c1", "t3": "c2"}
+
+    def test_deleting_company_drops_its_tasks(self):
+        snapshot = make_snapshot()
+        snapshot.apply_company("c1", None)
+        assert set(snapshot.tasks) == {"t3"}
+        assert set(snapshot.task_company) == {"t3"}
+
+    def test_task_delta_moves_company_mapping(self):
+        snapshot = make_snapshot()
+        snapshot.apply_task("t1", Task(id="t1", companyId="c2", title="Moved"))
+        assert snapshot.task_company["t1"] == "c2"
+        snapshot.apply_task("t1", None)
+        assert "t1" not in snapshot.tasks
+
+    def test_open_tasks_with_companies(self):
+        pairs = make_snapshot().open_tasks_with_companies()
+        assert [(task.id, company.id) for task, company in pairs] == [("t1", "c1"), ("t3", "c2")]
+
+
+class TestSnapshotStore:
+
+    def test_idle_snapshots_are_evicted(self):
+        store = SnapshotStore(max_age=60, idle_ttl=0, max_users=10, max_bytes=1_000_000)
+        store.put("u1", make_snapshot())
+        assert store.evict_idle() == 1
+        assert len(store) == 0
+
+    def test_old_snapshots_are_not_served(self):
+        store = SnapshotStore(max_age=0, idle_ttl=60, max_users=10, max_bytes=1_000_000)
+        store.put("u1", make_snapshot())
+        assert store.get("u1") is None
+
+    def test_bounded_by_user_count(self):
+        store = SnapshotStore(max_age=60, idle_ttl=60, max_users=1, max_bytes=1_000_000)
+        store.put("u1", make_snapshot())
+        store.put("u2", make_snapshot())
+        assert store.get("u1") is None
+        assert store.get("u2") is not None
+
+    def test_bounded_by_bytes_including_search_index(self):
+        searched = make_snapshot()
+        searched.search("co", 20)
+        size, grown = make_snapshot().approximate_size(), searched.approximate_size()
+        # Room for two plain snapshots, or one of them with its trie
+        store = SnapshotStore(max_age=60, idle_ttl=60, max_users=10, max_bytes=size + grown - 1)
+        store.put("u1", make_snapshot())
+        store.put("u2", make_snapshot())
+        assert len(store) == 2
+        store.get("u1").search("co", 20)
+        store.resize("u1")
+        # u2 was used least recently, so the grown trie pushes it out
+        assert store.get("u2") is None
+        assert store.get("u1") is not None
+        assert store.current_bytes <= store.max_bytes
+
+
+class TestSnapshotReads:
+
+    def make_handler(self, calls):
+        def handler(request):
+            calls.append((request.method, request.url.path))
+            if request.url.path.endswith("/companies"):
+                return httpx.Response(200, json={"documents": [company_doc("c1", name="Acme")]})
+            if request.url.path.endswith("/Task"):
+                return httpx.Response(200, json={"documents": [task_doc("c1", "t1"), task_doc("c1", "t2", completed=True)]})
+            if request.method == "PATCH" or request.url.path.endswith(":commit"):
+                return httpx.Response(200, json={})
+            return httpx.Response(404, json={})
+        return handler
+
+    def test_lookups_after_first_load_stay_in_memory(self, firestore_stub):
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            task = await firebase.get_task_by_id(MOCK_USER_ID, "t1")
+            loads = len(calls)
+            assert await firebase.company_exists(MOCK_USER_ID, "c1")
+            assert (await firebase.get_task_by_id(MOCK_USER_ID, "t2")).completed
+            reminders = await firebase.get_user_tasks_with_companies(MOCK_USER_ID)
+            assert len(calls) == loads
+            return task, reminders
+
+        task, reminders = asyncio.run(run())
+        assert task.id == "t1"
+        assert reminders == [{"company_name": "Acme", "task_title": "Test Task", "due_date": "Not specified"}]
+
+    def test_own_writes_are_applied_to_snapshot(self, firestore_stub):
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            await firebase.get_user_snapshot(MOCK_USER_ID)
+            await firebase.create_task(MOCK_USER_ID, Task(id="t9", companyId="c1", title="New"))
+            return await firebase.get_task_by_id(MOCK_USER_ID, "t9")
+
+        assert asyncio.run(run()).title == "New"
+        assert not any(method == "GET" and path.endswith("/Task/t9") for method, path in calls)
+
+    def test_missing_company_is_confirmed_with_firestore(self, firestore_stub):
+        calls = []
+
+        async def run():
+            firestore_stub(self.make_handler(calls))
+            return await firebase.company_exists(MOCK_USER_ID, "nope")
+
+        assert asyncio.run(run()) is False
+        assert any(path.endswith("/companies/nope") for _, path in calls)
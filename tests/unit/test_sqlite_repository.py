@@ -0,0 +1,160 @@
+import pytest
+import asyncio
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.models import Company, Task
+from app.services import repository
+from app.services.sqlite_repository import SQLiteRepository
+
+MOCK_TOKEN = "mock-firebase-token"
+USER = "test-user-123"
+
+
+def make_company(company_id, name="Acme Widgets"):
+    return Company(
+        id=company_id, name=name, EIN="12-3456789", startDate="2024-01-01", stateIncorporated="CA",
+        contactPersonName="John Doe", contactPersonPhNumber="555-1234", address1="123 Main St",
+        address2="Suite 100", city="San Francisco", state="CA", zip="94105"
+    )
+
+
+def make_task(task_id, company_id="c1", title="Invoice", completed=False):
+    return Task(id=task_id, companyId=company_id, title=title, completed=completed)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / "app.db"))
+    yield repo
+    repo.close()
+
+
+def seed(repo, companies=("c1", "c2"), tasks=()):
+    async def run():
+        for company_id in companies:
+            await repo.create_company(USER, make_company(company_id))
+        for task in tasks:
+            await repo.create_task(USER, task)
+    asyncio.run(run())
+
+
+class TestSQLiteRepository:
+
+    def test_wal_mode(self, repo):
+        assert repo._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_file_from_before_sync_is_migrated(self, tmp_path):
+        import sqlite3
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE companies (user_id TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL,"
+                     " PRIMARY KEY (user_id, id)) WITHOUT ROWID")
+        conn.execute("INSERT INTO companies VALUES (?, 'c1', ?)", (USER, make_company("c1").model_dump_json(exclude={"id"})))
+        conn.commit()
+        conn.close()
+
+        repo = SQLiteRepository(path)
+        changes = asyncio.run(repo.get_changes(USER))
+        repo.close()
+
+        assert [company.id for company in changes["companies"]] == ["c1"]
+
+    def test_counters_follow_task_writes(self, repo):
+        seed(repo, tasks=[make_task("t1"), make_task("t2", completed=True)])
+        asyncio.run(repo.update_task(USER, "t1", make_task("t1", completed=True)))
+
+        company = asyncio.run(repo.get_company_by_id(USER, "c1"))
+
+        assert (company.taskCount, company.openTaskCount) == (2, 0)
+        assert asyncio.run(repo.count_tasks(USER, completed=True)) == 2
+
+    def test_create_task_for_missing_company_conflicts(self, repo):
+        seed(repo)
+        with pytest.raises(Exception, match="Conflict"):
+            asyncio.run(repo.create_task(USER, make_task("t1", company_id="nope")))
+
+    def test_filters_and_users_are_isolated(self, repo):
+        seed(repo, tasks=[make_task("t1", title="Invoice"), make_task("t2", title="Payroll", company_id="c2")])
+        asyncio.run(repo.create_company("someone-else", make_company("c1")))
+        asyncio.run(repo.create_task("someone-else", make_task("t9", title="Invoice")))
+
+        tasks = asyncio.run(repo.query_tasks(USER, title_prefix="Inv"))
+
+        assert [task.id for task in tasks] == ["t1"]
+        assert [task.id for task in asyncio.run(repo.query_tasks(USER, company_id="c2"))] == ["t2"]
+
+    def test_pages_cover_everything_once(self, repo):
+        seed(repo, tasks=[make_task(f"t{i}", company_id="c1" if i % 2 else "c2") for i in range(7)])
+
+        seen, cursor = [], None
+        while True:
+            tasks, cursor = asyncio.run(repo.get_tasks_page(USER, 3, cursor))
+            seen += [task.id for task in tasks]
+            if cursor is None:
+                break
+
+        assert sorted(seen) == [f"t{i}" for i in range(7)]
+
+    def test_firestore_cursor_is_rejected(self, repo):
+        with pytest.raises(ValueError):
+            asyncio.run(repo.get_tasks_page(USER, 3, "garbage"))
+
+    def test_delete_company_takes_its_tasks(self, repo):
+        seed(repo, tasks=[make_task("t1"), make_task("t2", company_id="c2")])
+
+        asyncio.run(repo.delete_company(USER, "c1"))
+
+        assert [task.id for task in asyncio.run(repo.get_tasks(USER))] == ["t2"]
+        assert asyncio.run(repo.search(USER, "invoice", 10))["tasks"] == [make_task("t2", company_id="c2")]
+
+    def test_search_ranks_whole_words_first(self, repo):
+        seed(repo, tasks=[make_task("t1", title="Invoices overdue"), make_task("t2", title="Invoice")])
+
+        result = asyncio.run(repo.search(USER, "invoice", 10))
+
+        assert [task.id for task in result["tasks"]] == ["t2", "t1"]
+        assert asyncio.run(repo.search(USER, "acme wid", 10))["companies"][0].id == "c1"
+
+    def test_summary(self, repo):
+        seed(repo, tasks=[make_task("t1"), make_task("t2", completed=True)])
+
+        summary = asyncio.run(repo.get_task_summary(USER))
+
+        assert summary["companies"] == 2
+        assert summary["byCompany"]["c1"] == {"open": 1, "completed": 1}
+
+    def test_repository_interface_is_abstract(self):
+        with pytest.raises(TypeError):
+            repository.Repository()
+
+
+class TestSQLiteBackendThroughApi:
+
+    @pytest.fixture(autouse=True)
+    def backend(self, repo):
+        repository.set_repository(repo)
+        yield
+        repository._repository = None
+
+    def test_company_and_task_round_trip(self):
+        client = TestClient(app)
+        headers = {"Authorization": f"Bearer {MOCK_TOKEN}"}
+        company = make_company(None).model_dump(exclude={"id", "taskCount", "openTaskCount", "created_at", "updated_at"})
+
+        created = client.post("/create_company", json=company, headers=headers)
+        company_id = created.json()["id"]
+        task = client.post("/create_task", json={"companyId": company_id, "title": "Invoice"}, headers=headers)
+
+        assert task.status_code == 200
+        assert client.get("/getall_tasks", headers=headers).json()[0]["title"] == "Invoice"
+        assert client.get(f"/get_company/{company_id}", headers=headers).json()["openTaskCount"] == 1
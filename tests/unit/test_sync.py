@@ -0,0 +1,187 @@
+import pytest
+import asyncio
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.main import app
+from app.services import compaction, firebase, repository
+from app.services.repository import FirestoreRepository
+from app.services.sqlite_repository import SQLiteRepository
+from tests.unit.test_firebase import MOCK_USER_ID
+from tests.unit.test_firestore_standin import use_standin
+from tests.unit.test_sqlite_repository import make_company, make_task
+
+client = TestClient(app)
+HEADERS = {"Authorization": "Bearer mock-firebase-token"}
+
+
+def ids(items):
+    return sorted(item.id for item in items)
+
+
+async def sync_scenario(repo):
+    """Full sync, then an update, a delete and a new task; returns both answers"""
+    await repo.create_company(MOCK_USER_ID, make_company("c1"))
+    await repo.create_company(MOCK_USER_ID, make_company("c2"))
+    await repo.create_task(MOCK_USER_ID, make_task("t1"))
+    await repo.create_task(MOCK_USER_ID, make_task("t2"))
+    full = await repo.get_changes(MOCK_USER_ID)
+
+    await repo.update_task(MOCK_USER_ID, "t1", make_task("t1", completed=True))
+    await repo.delete_task(MOCK_USER_ID, "t2", "c1")
+    await repo.delete_company(MOCK_USER_ID, "c2")
+    await repo.create_task(MOCK_USER_ID, make_task("t3"))
+    return full, await repo.get_changes(MOCK_USER_ID, full["token"])
+
+
+@pytest.fixture(params=["firestore", "sqlite"])
+def repo(request, firestore_stub, tmp_path):
+    if request.param == "firestore":
+        use_standin(firestore_stub)
+        yield FirestoreRepository()
+    else:
+        backend = SQLiteRepository(str(tmp_path / "app.db"))
+        yield backend
+        backend.close()
+
+
+class TestIncrementalSync:
+
+    def test_only_changes_since_the_token_come_back(self, repo):
+        full, changes = asyncio.run(sync_scenario(repo))
+
+        assert ids(full["companies"]) == ["c1", "c2"]
+        assert ids(full["tasks"]) == ["t1", "t2"]
+        assert full["deleted"] == {"companies": [], "tasks": []}
+        # c1 is there because its task counters changed
+        assert ids(changes["companies"]) == ["c1"]
+        assert ids(changes["tasks"]) == ["t1", "t3"]
+        assert changes["deleted"] == {"companies": ["c2"], "tasks": ["t2"]}
+        assert changes["tasks"][0].completed is True
+
+    def test_nothing_changed_returns_nothing(self, repo):
+        async def scenario():
+            await repo.create_company(MOCK_USER_ID, make_company("c1"))
+            token = (await repo.get_changes(MOCK_USER_ID))["token"]
+            return await repo.get_changes(MOCK_USER_ID, token)
+
+        changes = asyncio.run(scenario())
+
+        assert changes["companies"] == [] and changes["tasks"] == []
+        assert changes["deleted"] == {"companies": [], "tasks": []}
+
+    def test_recreated_task_is_not_reported_deleted(self, repo):
+        async def scenario():
+            await repo.create_company(MOCK_USER_ID, make_company("c1"))
+            await repo.create_task(MOCK_USER_ID, make_task("t1"))
+            token = (await repo.get_changes(MOCK_USER_ID))["token"]
+            await repo.delete_task(MOCK_USER_ID, "t1", "c1")
+            await repo.create_task(MOCK_USER_ID, make_task("t1"))
+            return await repo.get_changes(MOCK_USER_ID, token)
+
+        changes = asyncio.run(scenario())
+
+        assert ids(changes["tasks"]) == ["t1"]
+        assert changes["deleted"]["tasks"] == []
+
+
+class TestTombstonePurge:
+
+    def test_recent_tombstones_are_kept(self, repo):
+        async def scenario():
+            await repo.create_company(MOCK_USER_ID, make_company("c1"))
+            await repo.create_task(MOCK_USER_ID, make_task("t1"))
+            token = (await repo.get_changes(MOCK_USER_ID))["token"]
+            await repo.delete_task(MOCK_USER_ID, "t1", "c1")
+            progress = {}
+            await repo.purge_tombstones(firebase.tombstone_cutoff(), progress)
+            return progress, await repo.get_changes(MOCK_USER_ID, token)
+
+        progress, changes = asyncio.run(scenario())
+
+        assert progress["deleted"] == 0
+        assert changes["deleted"]["tasks"] == ["t1"]
+
+    def test_purge_expires_tokens_from_before_it(self, repo, monkeypatch):
+        monkeypatch.setattr(firebase, "TOMBSTONE_RETENTION_DAYS", 0)
+
+        async def scenario():
+            await repo.create_company(MOCK_USER_ID, make_company("c1"))
+            await repo.create_company(MOCK_USER_ID, make_company("c2"))
+            token = (await repo.get_changes(MOCK_USER_ID))["token"]
+            await repo.delete_company(MOCK_USER_ID, "c1")
+            await repo.delete_company(MOCK_USER_ID, "c2")
+            progress = {}
+            await repo.purge_tombstones(firebase.tombstone_cutoff(), progress)
+            full = await repo.get_changes(MOCK_USER_ID)
+            return token, progress, full
+
+        token, progress, full = asyncio.run(scenario())
+
+        assert progress == {"deleted": 2, "failed": 0, "batches": 1}
+        assert full["companies"] == []
+        with pytest.raises(firebase.SyncTokenExpired):
+            asyncio.run(repo.get_changes(MOCK_USER_ID, token))
+
+    def test_purge_runs_in_batches(self, tmp_path, monkeypatch):
+        import app.services.sqlite_repository as sqlite_repository
+        monkeypatch.setattr(sqlite_repository, "BATCH_WRITE_LIMIT", 2)
+        monkeypatch.setattr(firebase, "TOMBSTONE_RETENTION_DAYS", 0)
+        repo = SQLiteRepository(str(tmp_path / "app.db"))
+        repository.set_repository(repo)
+
+        async def scenario():
+            await repo.create_company(MOCK_USER_ID, make_company("c1"))
+            for i in range(5):
+                await repo.create_task(MOCK_USER_ID, make_task(f"t{i}"))
+                await repo.delete_task(MOCK_USER_ID, f"t{i}", "c1")
+            return await compaction.purge_tombstones()
+
+        try:
+            assert asyncio.run(scenario()) == {"deleted": 5, "failed": 0, "batches": 3}
+        finally:
+            repository.set_repository(None)
+
+
+class TestSyncRoute:
+
+    @pytest.fixture(autouse=True)
+    def backend(self, tmp_path):
+        repo = SQLiteRepository(str(tmp_path / "app.db"))
+        repository.set_repository(repo)
+        asyncio.run(repo.create_company(MOCK_USER_ID, make_company("c1")))
+        yield
+        repository.set_repository(None)
+
+    def test_token_round_trip(self):
+        full = client.get("/sync", headers=HEADERS).json()
+        changes = client.get("/sync", params={"since": full["token"]}, headers=HEADERS).json()
+
+        assert [company["id"] for company in full["companies"]] == ["c1"]
+        assert changes["companies"] == []
+
+    @pytest.mark.parametrize("token", ["garbage", "eyJ0IjoiMjAyNC0wMS0wMVQwMDowMDowMFoifQ"])
+    def test_unusable_token_is_400(self, token):
+        response = client.get("/sync", params={"since": token}, headers=HEADERS)
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid sync token"
+
+    def test_token_from_before_purged_tombstones_is_410(self, monkeypatch):
+        token = client.get("/sync", headers=HEADERS).json()["token"]
+        assert client.delete("/delete_company/c1", headers=HEADERS).status_code == 200
+        monkeypatch.setattr(firebase, "TOMBSTONE_RETENTION_DAYS", 0)
+        asyncio.run(compaction.purge_tombstones())
+
+        response = client.get("/sync", params={"since": token}, headers=HEADERS)
+
+        assert response.status_code == 410
+        assert response.json()["detail"] == "Sync token expired"
@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app import main
+from app.services import firebase
+
+client = TestClient(main.app)
+
+
+class TestWarmUp:
+
+    def test_opens_connections_and_fetches_token(self, firestore_stub):
+        requests = []
+
+        def handler(request):
+            requests.append(request.method)
+            return httpx.Response(404)
+
+        firestore_stub(handler)
+        result = asyncio.run(firebase.warm_up(connections=3, timeout=1.0))
+
+        assert result == {"access_token": True, "connections": 3}
+        assert requests == ["HEAD", "HEAD", "HEAD"]
+        firebase.get_access_token.assert_awaited_once()
+
+    def test_failures_are_reported_not_raised(self, firestore_stub):
+        def handler(request):
+            raise httpx.ConnectError("unreachable")
+
+        firestore_stub(handler)
+        firebase.get_access_token.side_effect = Exception("Missing Firebase credentials")
+        result = asyncio.run(firebase.warm_up(connections=2, timeout=1.0))
+
+        assert result == {"access_token": False, "connections": 0}
+
+    def test_bounded_by_timeout(self, firestore_stub):
+        async def handler(request):
+            await asyncio.sleep(5)
+            return httpx.Response(200)
+
+        firestore_stub(handler)
+        result = asyncio.run(firebase.warm_up(connections=1, timeout=0.05))
+
+        assert result["connections"] == 0
+
+
+class TestReadiness:
+
+    def test_not_ready_before_warm_up(self):
+        with patch.object(main, "_warmup_status", None):
+            response = client.get("/ready")
+        assert response.status_code == 503
+
+    def test_ready_after_warm_up(self):
+        async def fake_warm_up():
+            return {"access_token": True, "connections": 8}
+
+        with patch.object(main, "_warmup_status", None), \
+                patch.object(firebase, "warm_up", fake_warm_up), \
+                patch.object(main, "fetch_id_token_certs", AsyncMock(return_value=True)):
+            asyncio.run(main.warm_up_services())
+            response = client.get("/ready")
+
+        assert response.status_code == 200
+        warmup = response.json()["warmup"]
+        assert warmup["connections"] == 8
+        assert warmup["certs"] is True
+
+    def test_certs_are_fetched_from_the_public_url(self, firestore_stub):
+        urls = []
+
+        def handler(request):
+            urls.append(str(request.url))
+            return httpx.Response(200, json={})
+
+        firestore_stub(handler)
+        assert asyncio.run(main.fetch_id_token_certs()) is True
+        assert urls == [main.ID_TOKEN_CERT_URI]
@@ -0,0 +1,151 @@
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+import sys
+
+# Mock firebase modules before importing main
+firebase_admin_mock = MagicMock()
+firebase_admin_mock.auth.verify_id_token.return_value = {'uid': 'test-user-123'}
+sys.modules['firebase_admin'] = firebase_admin_mock
+sys.modules['firebase_admin.auth'] = firebase_admin_mock.auth
+sys.modules['firebase_admin.credentials'] = MagicMock()
+
+from app.services import firebase
+from app.services.write_behind import WriteBehind
+from tests.unit.test_counters import commit_stub, counter_deltas, make_task
+from tests.unit.test_firebase import MOCK_USER_ID, task_doc
+
+
+class TestWriteBehind:
+
+    def test_writes_within_window_are_merged(self):
+        written = []
+
+        async def flush(key, value):
+            written.append((key, value))
+
+        async def scenario():
+            buffer = WriteBehind(0.01, flush)
+            for value in (1, 2, 3):
+                buffer.put("k", value)
+            assert buffer.get("k") == 3
+            await asyncio.sleep(0.05)
+            return buffer
+
+        buffer = asyncio.run(scenario())
+
+        assert written == [("k", 3)]
+        assert buffer.stats()["coalesced"] == 2
+        assert buffer.get("k") is None
+
+    def test_flushes_of_one_key_keep_write_order(self):
+        written = []
+
+        async def flush(key, value):
+            # The first write is slow; the second must still land after it
+            await asyncio.sleep(0.05 if value == 1 else 0)
+            written.append(value)
+
+        async def scenario():
+            buffer = WriteBehind(0.01, flush)
+            buffer.put("k", 1)
+            await asyncio.sleep(0.02)
+            buffer.put("k", 2)
+            await asyncio.sleep(0.1)
+
+        asyncio.run(scenario())
+
+        assert written == [1, 2]
+
+    def test_flush_of_one_key_writes_it_now(self):
+        written = []
+
+        async def flush(key, value):
+            written.append((key, value))
+
+        async def scenario():
+            buffer = WriteBehind(10, flush)
+            buffer.put("a", 1)
+            buffer.put("b", 2)
+            await buffer.flush("a")
+            return buffer
+
+        buffer = asyncio.run(scenario())
+
+        assert written == [("a", 1)]
+        assert buffer.get("b") == 2
+
+    def test_failed_flush_is_counted(self):
+        async def flush(key, value):
+            raise Exception("boom")
+
+        async def scenario():
+            buffer = WriteBehind(0, flush)
+            buffer.put("k", 1)
+            await buffer.flush_all()
+            return buffer
+
+        assert asyncio.run(scenario()).stats()["failed"] == 1
+
+    def test_discard_drops_pending_value(self):
+        written = []
+
+        async def flush(key, value):
+            written.append(value)
+
+        async def scenario():
+            buffer = WriteBehind(0.01, flush)
+            buffer.put("k", 1)
+            await buffer.discard("k")
+            await asyncio.sleep(0.03)
+
+        asyncio.run(scenario())
+
+        assert written == []
+
+
+class TestTaskWriteBehind:
+
+    @pytest.fixture(autouse=True)
+    def window(self, monkeypatch):
+        monkeypatch.setattr(firebase._task_write_behind, "delay", 0.01)
+
+    def test_checkbox_toggles_become_one_commit(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1", completed=False))
+
+        async def scenario():
+            for completed in (True, False, True):
+                assert (await firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=completed))).completed is completed
+            pending = await firebase.get_task_by_id(MOCK_USER_ID, "t1")
+            await asyncio.sleep(0.05)
+            return pending
+
+        pending = asyncio.run(scenario())
+
+        assert pending.completed is True
+        assert len(commits) == 1
+        assert counter_deltas(commits[0]) == {"openTaskCount": -1}
+
+    def test_delete_discards_pending_update(self, firestore_stub):
+        commits = commit_stub(firestore_stub, stored=task_doc("c1", "t1", completed=False))
+
+        async def scenario():
+            await firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=True))
+            await firebase.delete_task(MOCK_USER_ID, "t1", "c1")
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+
+        assert len(commits) == 1
+        assert "delete" in commits[0][0]
+
+    def test_failed_flush_drops_cached_value(self, firestore_stub):
+        commit_stub(firestore_stub, stored=task_doc("c1", "t1"), failures=99)
+
+        async def scenario():
+            await firebase.update_task(MOCK_USER_ID, "t1", make_task(completed=True))
+            await firebase.flush_pending_writes()
+
+        asyncio.run(scenario())
+
+        assert firebase._tasks_cache.get(f"tasks_{MOCK_USER_ID}") is None